@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Inference benchmark over the bundled samplecrowd images.
+
+Run from the backend directory:
+    python benchmark_inference.py
+    python benchmark_inference.py --batch-sizes 1 2 4 8 --threads 1 4 --backends torch int8
+    python benchmark_inference.py --synthetic 640x480 1920x1080 --ground-truth counts.json
+    python benchmark_inference.py --compare outputs/benchmarks/<earlier run>.json
+
+Every combination of backend, torch thread count, batch size and image set
+counts each image `--repeats` times. The image sets are samplecrowd itself,
+plus samplecrowd re-encoded at each `--synthetic` resolution. Four stages are
+timed separately:
+- decode: encoded bytes to RGB.
+- preprocess: resize and normalize.
+- forward: one batched model call.
+- postprocess: model output to counts.
+
+Each stage gets mean/p50/p95/p99 milliseconds per image. The whole batch gets
+latency percentiles and images/s. With `--ground-truth` (JSON
+`{"file.jpg": 42}` or a CSV of filename,count), each row also has the MAE and
+RMSE of the counts. The `heuristic` backend times the NumPy estimator in place
+of decode, preprocess and forward.
+
+Results go to a JSON file under outputs/benchmarks/, named after the time and
+git commit. `--compare` matches rows with an earlier file and lists
+throughput or p95 regressions beyond `--tolerance`. The exit status is 1 when
+there are any, so the comparison can gate a commit.
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import inference_utils as iu
+from config import settings
+
+STAGES = ("decode", "preprocess", "forward", "postprocess")
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """mean/p50/p95/p99 of `values` (nearest-rank), rounded to microseconds."""
+    if not values:
+        return {"mean": None, "p50": None, "p95": None, "p99": None}
+    ordered = sorted(values)
+
+    def rank(q):
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+    return {
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(rank(0.50), 3),
+        "p95": round(rank(0.95), 3),
+        "p99": round(rank(0.99), 3),
+    }
+
+
+def load_ground_truth(path: str) -> Dict[str, float]:
+    """Ground-truth counts keyed by file name, from JSON or CSV (filename,count)."""
+    text = Path(path).read_text()
+    if path.lower().endswith(".json"):
+        data = json.loads(text)
+    else:
+        data = {}
+        for row in csv.reader(io.StringIO(text)):
+            if len(row) < 2 or row[0].strip().lower() in ("filename", "image", "file"):
+                continue
+            data[row[0].strip()] = row[1]
+    return {Path(name).name: float(count) for name, count in data.items()}
+
+
+def load_image_sets(image_dir: Optional[str], synthetic: Sequence[str], max_images: int) -> Dict[str, List[Tuple[str, bytes]]]:
+    """{set name: [(file name, encoded bytes)]}: the sample images, then each synthetic resolution."""
+    paths, _ = iu.find_image_paths(image_dir or str(REPO_ROOT / "samplecrowd"))
+    samples = [(Path(p).name, Path(p).read_bytes()) for p in sorted(paths)[:max_images]]
+    sets = {"samplecrowd": samples}
+    for spec in synthetic:
+        w, h = (int(v) for v in spec.lower().split("x"))
+        encoded = []
+        for name, data in samples:
+            buf = io.BytesIO()
+            iu.open_image(data).resize((w, h), iu.Image.BILINEAR).save(buf, format="JPEG", quality=90)
+            encoded.append((name, buf.getvalue()))
+        sets[f"synthetic-{w}x{h}"] = encoded
+    return sets
+
+
+def _load_model(backend: str, model_path: str, input_size: int):
+    if backend == "heuristic":
+        return None
+    model = iu.load_backend(model_path, backend, device="cpu", input_size=input_size)
+    if model is None:
+        raise RuntimeError(f"model not available at {model_path}")
+    return model
+
+
+def run_config(model: Any, backend: str, images: List[Tuple[str, bytes]], batch_size: int,
+               target_size: Tuple[int, int], repeats: int, warmup: int = 1) -> Dict[str, Any]:
+    """Time one (model, batch size, image set) configuration; returns the measurements."""
+    stage_ms = {stage: [] for stage in STAGES}
+    batch_ms: List[float] = []
+    counts: Dict[str, float] = {}
+    pre = iu.get_preprocessor(target_size)
+    min_size = (target_size[1], target_size[0])
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    n_images = 0
+    wall = 0.0
+    for r in range(warmup + repeats):
+        measured = r >= warmup
+        for batch in batches:
+            started = time.perf_counter()
+            if backend == "heuristic":
+                t0 = time.perf_counter()
+                batch_counts = [float(iu.estimate_count_heuristic(data)) for _, data in batch]
+                stage = {"forward": (time.perf_counter() - t0) * 1000.0}
+            else:
+                t0 = time.perf_counter()
+                decoded = [iu.open_image(data, min_size=min_size) for _, data in batch]
+                t1 = time.perf_counter()
+                tensors = [pre(img) for img in decoded]
+                t2 = time.perf_counter()
+                stacked = iu.torch.stack(tensors)
+                with iu.torch.no_grad():
+                    out = model(stacked)
+                if isinstance(out, (list, tuple)):
+                    out = out[0]
+                t3 = time.perf_counter()
+                batch_counts = [iu._output_to_count(out[i]) for i in range(len(batch))]
+                t4 = time.perf_counter()
+                stage = {"decode": (t1 - t0) * 1000.0, "preprocess": (t2 - t1) * 1000.0,
+                         "forward": (t3 - t2) * 1000.0, "postprocess": (t4 - t3) * 1000.0}
+            elapsed = time.perf_counter() - started
+            if not measured:
+                continue
+            wall += elapsed
+            n_images += len(batch)
+            batch_ms.append(elapsed * 1000.0)
+            for name, ms in stage.items():
+                stage_ms[name].extend([ms / len(batch)] * len(batch))
+            if r == warmup:
+                counts.update((name, c) for (name, _), c in zip(batch, batch_counts))
+    return {
+        "images": n_images,
+        "images_per_s": round(n_images / wall, 3) if wall else None,
+        "latency_ms": percentiles(batch_ms),
+        "stages_ms": {stage: percentiles(ms) for stage, ms in stage_ms.items() if ms},
+        "counts": {name: round(c, 3) for name, c in counts.items()},
+    }
+
+
+def accuracy(counts: Dict[str, float], truth: Dict[str, float]) -> Optional[Dict[str, Any]]:
+    errors = [counts[name] - truth[name] for name in counts if name in truth]
+    if not errors:
+        return None
+    return {
+        "images": len(errors),
+        "mae": round(sum(abs(e) for e in errors) / len(errors), 3),
+        "rmse": round((sum(e * e for e in errors) / len(errors)) ** 0.5, 3),
+        "bias": round(sum(errors) / len(errors), 3),
+    }
+
+
+def run_benchmark(backends: Sequence[str], batch_sizes: Sequence[int], threads: Sequence[int],
+                  image_sets: Dict[str, List[Tuple[str, bytes]]], input_size: int = 512,
+                  repeats: int = 3, model_path: Optional[str] = None,
+                  ground_truth: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """One result row per (backend, threads, batch size, image set)."""
+    model_path = model_path or str(settings.model_path)
+    target_size = (input_size, input_size)
+    rows = []
+    for backend in backends:
+        try:
+            model = _load_model(backend, model_path, input_size)
+        except Exception as e:
+            rows.append({"backend": backend, "error": str(e)})
+            print(f"⚠️  {backend}: {e}")
+            continue
+        for n_threads in threads:
+            if iu.torch is not None:
+                iu.torch.set_num_threads(n_threads)
+            for batch_size in batch_sizes:
+                for set_name, images in image_sets.items():
+                    row = {"backend": backend, "threads": n_threads, "batch_size": batch_size,
+                           "image_set": set_name, "input_size": input_size}
+                    try:
+                        row.update(run_config(model, backend, images, batch_size, target_size, repeats))
+                        if ground_truth:
+                            row["accuracy"] = accuracy(row["counts"], ground_truth)
+                    except Exception as e:
+                        row["error"] = str(e)
+                    rows.append(row)
+                    print(_format_row(row))
+    return rows
+
+
+def _format_row(row: Dict[str, Any]) -> str:
+    head = f"{row['backend']:<11} threads={row.get('threads', '-'):<2} batch={row.get('batch_size', '-'):<3} {row.get('image_set', ''):<24}"
+    if "error" in row:
+        return f"{head} ERROR {row['error']}"
+    stages = " ".join(f"{s}={row['stages_ms'][s]['mean']:.1f}" for s in STAGES if s in row["stages_ms"])
+    lat = row["latency_ms"]
+    line = f"{head} {row['images_per_s']:>8.2f} img/s  p50={lat['p50']:.1f} p95={lat['p95']:.1f} p99={lat['p99']:.1f} ms  [{stages}]"
+    if row.get("accuracy"):
+        line += f"  MAE={row['accuracy']['mae']:.2f}"
+    return line
+
+
+def _row_key(row: Dict[str, Any]) -> Tuple:
+    return (row.get("backend"), row.get("threads"), row.get("batch_size"), row.get("image_set"), row.get("input_size"))
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.10) -> List[Dict[str, Any]]:
+    """Rows of `current` that are slower than their match in `previous` by more than `tolerance`."""
+    before = {_row_key(r): r for r in previous.get("results", []) if "error" not in r}
+    regressions = []
+    for row in current.get("results", []):
+        old = before.get(_row_key(row))
+        if old is None or "error" in row:
+            continue
+        throughput = row["images_per_s"] / old["images_per_s"] - 1 if old.get("images_per_s") else 0.0
+        p95 = row["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1 if old["latency_ms"].get("p95") else 0.0
+        if throughput < -tolerance or p95 > tolerance:
+            regressions.append({
+                "key": dict(zip(("backend", "threads", "batch_size", "image_set", "input_size"), _row_key(row))),
+                "images_per_s": [old["images_per_s"], row["images_per_s"]],
+                "p95_ms": [old["latency_ms"]["p95"], row["latency_ms"]["p95"]],
+            })
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the inference path on samplecrowd images.")
+    parser.add_argument("--backends", nargs="+", default=[settings.inference_backend],
+                        choices=list(iu.INFERENCE_BACKENDS) + ["heuristic"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--threads", nargs="+", type=int, default=[iu.torch.get_num_threads() if iu.torch else 1])
+    parser.add_argument("--synthetic", nargs="*", default=[], metavar="WxH", help="extra resolutions, e.g. 1920x1080")
+    parser.add_argument("--input-size", type=int, default=settings.inference_input_size)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-images", type=int, default=16)
+    parser.add_argument("--images", default=None, help="image directory (default: samplecrowd)")
+    parser.add_argument("--model", default=None, help="weights file (default: MODEL_PATH)")
+    parser.add_argument("--ground-truth", default=None, help="JSON or CSV of filename -> count")
+    parser.add_argument("--output", default=None, help="result file (default: outputs/benchmarks/...)")
+    parser.add_argument("--compare", default=None, help="earlier result file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    image_sets = load_image_sets(args.images, args.synthetic, args.max_images)
+    truth = load_ground_truth(args.ground_truth) if args.ground_truth else None
+    commit = _git_commit()
+    rows = run_benchmark(args.backends, args.batch_sizes, args.threads, image_sets,
+                         input_size=args.input_size, repeats=args.repeats,
+                         model_path=args.model, ground_truth=truth)
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "git_commit": commit,
+        "environment": {
+            "python": platform.python_version(),
+            "torch": getattr(iu.torch, "__version__", None),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {**{k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+                   "model": args.model or str(settings.model_path),
+                   "image_sets": {name: len(images) for name, images in image_sets.items()}},
+        "results": rows,
+    }
+
+    output = Path(args.output or REPO_ROOT / "backend" / "outputs" / "benchmarks" /
+                  f"inference-{datetime.utcnow():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"✓ Results written to {output}")
+
+    if args.compare:
+        regressions = compare(json.loads(Path(args.compare).read_text()), report, args.tolerance)
+        for r in regressions:
+            print(f"⚠️  Regression {r['key']}: img/s {r['images_per_s'][0]} -> {r['images_per_s'][1]}, "
+                  f"p95 {r['p95_ms'][0]} -> {r['p95_ms'][1]} ms")
+        if regressions:
+            return 1
+        print(f"✓ No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+Camera ingest: count frames from camera folders and streams automatically.
+
+Each camera in the ingest config maps one source to an `event_id` and to a
+zone (`zone_id`, from `/zones`) and/or an `area_name`:
+
+    {"cameras": [
+        {"camera_id": "gate-1", "event_id": "EVT123", "zone_id": "65f0...",
+         "area_name": "Gate 1", "radius_m": 12, "source": "/srv/frames/gate-1"},
+        {"camera_id": "hall", "event_id": "EVT123", "area_name": "Hall",
+         "source": "rtsp://10.0.0.7/stream1"}
+    ]}
+
+A `source` is a directory that a camera (or an uploader) drops frames into,
+an http(s) snapshot URL that returns one JPEG/PNG per GET, or an rtsp:// (or
+other OpenCV-readable) stream. A folder is scanned for its newest new image.
+Older new images are skipped and counted as `dropped`, because only the
+latest frame matters for live occupancy.
+
+Every camera runs as one asyncio task. Frames go through the same result
+cache, admission control and micro-batcher as `/inference/count` (routine
+lane, or the priority lane while the zone is Risky/Overcrowded). The camera
+is polled at its zone's scheduled interval (see inference_scheduler), and
+never faster than `poll_s`. Results are buffered. Every `flush_s` (or
+`flush_max` records) they are written with one `insert_many` into
+`crowd_density` and one `bulk_write` to `zones`, keeping only the latest
+count per zone.
+
+A camera whose reads or counts fail backs off exponentially, up to
+`backoff_max_s`. A camera with no new frame for `stale_after_s` is reported
+stale. Per-camera and total throughput is in `GET /inference/stats` under
+`ingest`.
+
+Set CAMERA_INGEST_CONFIG to run the ingest inside a single API process
+(`run.py`; `serve.py` workers skip it, since each would poll every camera),
+or run it as its own process, one per node:
+    python camera_ingest.py --config cameras.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import urllib.request
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+import inference_utils as iu
+from config import settings
+from database import database
+from inference_scheduler import source_zone_key, zone_scheduler
+
+Frame = Tuple[bytes, str, int]  # (encoded image, frame name, frames skipped since the last read)
+CountFn = Callable[..., Awaitable[Tuple[Dict[str, Any], bool]]]
+
+
+class CameraConfig:
+    """One ingested camera and where its counts go."""
+
+    def __init__(self, camera_id: str, event_id: str, source: str, zone_id: Optional[str] = None,
+                 area_name: Optional[str] = None, radius_m: Optional[float] = None,
+                 interval_s: Optional[float] = None, remove_processed: bool = False):
+        if not camera_id or not event_id or not source:
+            raise ValueError("every camera needs camera_id, event_id and source")
+        if zone_id is not None and not ObjectId.is_valid(zone_id):
+            raise ValueError(f"camera {camera_id}: zone_id {zone_id!r} is not a zone ObjectId")
+        self.camera_id = camera_id
+        self.event_id = event_id
+        self.source = source
+        self.zone_id = zone_id
+        self.area_name = area_name or camera_id
+        self.radius_m = float(radius_m) if radius_m else None
+        self.interval_s = interval_s
+        self.remove_processed = remove_processed
+
+    @property
+    def zone_key(self) -> str:
+        """The zone scheduler key, as `/inference/count` builds it."""
+        return source_zone_key(self.event_id, self.area_name, self.camera_id)
+
+
+def load_cameras(path: str) -> List[CameraConfig]:
+    """Cameras from a JSON file: {"cameras": [...]} or a bare list."""
+    with open(path) as fh:
+        data = json.load(fh)
+    entries = data.get("cameras", []) if isinstance(data, dict) else data
+    cameras = [CameraConfig(**entry) for entry in entries]
+    ids = [c.camera_id for c in cameras]
+    if len(ids) != len(set(ids)):
+        raise ValueError("camera_id values must be unique")
+    return cameras
+
+
+class FolderReader:
+    """Newest new image in a directory; hidden and partially written (.tmp/.part) files are ignored."""
+
+    def __init__(self, path: str, remove_processed: bool = False):
+        self.path = path
+        self.remove_processed = remove_processed
+        self._last: Tuple[float, str] = (0.0, "")
+
+    def read(self) -> Optional[Frame]:
+        newer = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(".") or not name.lower().endswith(iu.IMAGE_EXTS) or not entry.is_file():
+                    continue
+                stamp = (entry.stat().st_mtime, name)
+                if stamp > self._last:
+                    newer.append(stamp)
+        if not newer:
+            return None
+        newest = max(newer)
+        self._last = newest
+        path = os.path.join(self.path, newest[1])
+        with open(path, "rb") as fh:
+            data = fh.read()
+        if self.remove_processed:
+            for _, name in newer:
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                except OSError:
+                    pass
+        return data, newest[1], len(newer) - 1
+
+    def close(self):
+        pass
+
+
+class SnapshotReader:
+    """One frame per GET from an http(s) snapshot URL."""
+
+    def __init__(self, url: str, timeout_s: float = 10.0):
+        self.url = url
+        self.timeout_s = timeout_s
+
+    def read(self) -> Optional[Frame]:
+        with urllib.request.urlopen(self.url, timeout=self.timeout_s) as resp:
+            data = resp.read()
+        if not data:
+            return None
+        return data, self.url, 0
+
+    def close(self):
+        pass
+
+
+class StreamReader:
+    """Latest frame of an RTSP (or other OpenCV-readable) stream, re-encoded as JPEG."""
+
+    def __init__(self, url: str):
+        if iu.cv2 is None:
+            raise RuntimeError("opencv-python is required for stream sources - install with 'pip install opencv-python'")
+        self.url = url
+        self._cap = None
+
+    def read(self) -> Optional[Frame]:
+        cv2 = iu.cv2
+        if self._cap is None:
+            self._cap = cv2.VideoCapture(self.url)
+            self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            if not self._cap.isOpened():
+                self.close()
+                raise ConnectionError(f"unable to open stream {self.url}")
+        ok, frame = self._cap.read()
+        if not ok:
+            # Reopened on the next read, after the camera's backoff
+            self.close()
+            raise ConnectionError(f"stream {self.url} returned no frame")
+        ok, buf = cv2.imencode(".jpg", frame)
+        if not ok:
+            raise ValueError("unable to encode stream frame")
+        return buf.tobytes(), self.url, 0
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+def open_reader(camera: CameraConfig):
+    source = camera.source
+    if source.startswith(("http://", "https://")):
+        return SnapshotReader(source)
+    if "://" in source:
+        return StreamReader(source)
+    if not os.path.isdir(source):
+        raise FileNotFoundError(f"camera folder {source} does not exist")
+    return FolderReader(source, camera.remove_processed)
+
+
+class CameraState:
+    """Counters, backoff and staleness of one camera."""
+
+    def __init__(self, camera: CameraConfig, started_at: float):
+        self.camera = camera
+        self.reader = None
+        self.frames = 0
+        self.counted = 0
+        self.dropped = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_error: Optional[str] = None
+        self.last_count: Optional[int] = None
+        self.last_frame_at = started_at
+        self.last_counted_at: Optional[float] = None
+        self.latency_ms = 0.0
+        self.stale = False
+
+    def backoff_s(self, base_s: float, max_s: float) -> float:
+        """Delay before the next attempt after `consecutive_errors` failures in a row."""
+        if not self.consecutive_errors:
+            return 0.0
+        return min(max_s, base_s * 2 ** (self.consecutive_errors - 1))
+
+    def check_stale(self, now: float, stale_after_s: float) -> bool:
+        """Update `stale` after a read found no frame; True if the camera just went stale.
+
+        Only judged on reads, so a camera its zone schedule polls rarely is not stale.
+        """
+        was, self.stale = self.stale, now - self.last_frame_at > stale_after_s
+        return self.stale and not was
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "event_id": self.camera.event_id,
+            "zone_id": self.camera.zone_id,
+            "area_name": self.camera.area_name,
+            "frames": self.frames,
+            "counted": self.counted,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+            "last_error": self.last_error,
+            "last_count": self.last_count,
+            "last_frame_age_s": round(now - self.last_frame_at, 1),
+            "latency_ms": round(self.latency_ms, 1),
+            "stale": self.stale,
+        }
+
+
+class CameraIngest:
+    def __init__(self, poll_s: float = 2.0, backoff_s: float = 1.0, backoff_max_s: float = 60.0,
+                 stale_after_s: float = 30.0, flush_s: float = 1.0, flush_max: int = 500,
+                 read_concurrency: int = 32, rate_window_s: float = 60.0):
+        self.poll_s = poll_s
+        self.backoff_s = backoff_s
+        self.backoff_max_s = backoff_max_s
+        self.stale_after_s = stale_after_s
+        self.flush_s = flush_s
+        self.flush_max = flush_max
+        self.rate_window_s = rate_window_s
+        self.cameras: Dict[str, CameraState] = {}
+        self._count: Optional[CountFn] = None
+        self._tasks: List[asyncio.Task] = []
+        self._writer: Optional[asyncio.Task] = None
+        self.read_concurrency = max(1, read_concurrency)
+        # Created on the running loop by _bind_loop, not at import time
+        self._loop = None
+        self._reads: Optional[asyncio.Semaphore] = None
+        self._flush_now: Optional[asyncio.Event] = None
+        self._records: List[Dict[str, Any]] = []
+        self._zones: Dict[str, Dict[str, Any]] = {}
+        self._counted_at = deque()
+        self.flushes = 0
+        self.records_written = 0
+        self.zone_updates = 0
+        self.write_errors = 0
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def _bind_loop(self):
+        """Create the asyncio primitives on the running loop (again, if the loop changed)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._reads = asyncio.Semaphore(self.read_concurrency)
+            self._flush_now = asyncio.Event()
+            self._writer = None  # a writer on the previous loop went away with it
+
+    async def start(self, cameras: List[CameraConfig], count: CountFn):
+        """Start one task per camera plus the writer. `count` is `routes.inference._count_contents`."""
+        if self.running:
+            await self.stop()
+        self._bind_loop()
+        self._count = count
+        self.started_at = time.monotonic()
+        self.cameras = {c.camera_id: CameraState(c, self.started_at) for c in cameras}
+        self._tasks = [asyncio.create_task(self._run_camera(state)) for state in self.cameras.values()]
+        self._ensure_writer()
+        print(f"✓ Camera ingest started for {len(cameras)} cameras")
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        if self._writer is not None:
+            tasks.append(self._writer)
+            self._writer = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.flush()
+
+    async def _run_camera(self, state: CameraState):
+        try:
+            while True:
+                delay = await self.step(state)
+                # Jitter keeps hundreds of cameras from polling in lockstep
+                await asyncio.sleep(delay * random.uniform(0.9, 1.1))
+        finally:
+            if state.reader is not None:
+                state.reader.close()
+
+    async def step(self, state: CameraState) -> float:
+        """Read and count one frame of a camera; returns the seconds until its next read."""
+        camera = state.camera
+        now = time.monotonic()
+        self._bind_loop()
+        try:
+            if state.reader is None:
+                state.reader = open_reader(camera)
+            async with self._reads:
+                frame = await asyncio.to_thread(state.reader.read)
+        except Exception as e:
+            return self._failed(state, f"read failed: {e}")
+        if frame is None:
+            state.consecutive_errors = 0
+            if state.check_stale(time.monotonic(), self.stale_after_s):
+                print(f"⚠️  Camera {camera.camera_id} is stale (no new frame for {self.stale_after_s:.0f}s)")
+            return camera.interval_s or self.poll_s
+        contents, name, skipped = frame
+        state.frames += 1
+        state.dropped += skipped
+        state.last_frame_at = time.monotonic()
+        if state.stale:
+            state.stale = False
+            print(f"✓ Camera {camera.camera_id} is delivering frames again")
+
+        area_m2 = math.pi * camera.radius_m ** 2 if camera.radius_m else None
+        priority = zone_scheduler.is_priority(camera.zone_key)
+        try:
+            result, _ = await self._count(contents, area_m2=area_m2, priority=priority, bulk=not priority,
+                                          zone=camera.zone_key)
+        except Exception as e:
+            return self._failed(state, f"count failed: {e}")
+        if result['count'] is None:
+            return self._failed(state, f"count failed: {result.get('error')}")
+        state.consecutive_errors = 0
+        state.counted += 1
+        state.last_count = int(result['count'])
+        state.last_counted_at = time.monotonic()
+        latency_ms = (state.last_counted_at - now) * 1000.0
+        state.latency_ms = latency_ms if state.counted == 1 else state.latency_ms + 0.1 * (latency_ms - state.latency_ms)
+        self._counted_at.append(state.last_counted_at)
+        self.record(camera, result, name)
+        interval = camera.interval_s or self.poll_s
+        if zone_scheduler.enabled:
+            interval = max(interval, zone_scheduler.interval(camera.zone_key))
+        return interval
+
+    def _failed(self, state: CameraState, error: str) -> float:
+        state.errors += 1
+        state.consecutive_errors += 1
+        state.last_error = error
+        if state.consecutive_errors == 1:
+            print(f"⚠️  Camera {state.camera.camera_id}: {error}")
+        if state.check_stale(time.monotonic(), self.stale_after_s):
+            print(f"⚠️  Camera {state.camera.camera_id} is stale (no new frame for {self.stale_after_s:.0f}s)")
+        return state.backoff_s(self.backoff_s, self.backoff_max_s)
+
+    def record(self, camera: CameraConfig, result: Dict[str, Any], frame_name: str, observe: bool = True):
+        """Buffer a counted frame for the next bulk write (also used by `/inference/stream`).
+
+        `observe=False` leaves the zone scheduler alone, for callers that have
+        already reported the frame to it.
+        """
+        from routes.crowd_density import calculate_density, generate_density_id
+
+        self._bind_loop()
+        count = int(result['count'])
+        record = calculate_density({
+            'id': generate_density_id(),
+            'timestamp': datetime.utcnow(),
+            'person_count': count,
+            'radius_m': camera.radius_m or 0.0,
+            'event_id': camera.event_id,
+            'area_name': camera.area_name,
+            'location': None,
+            'camera_id': camera.camera_id,
+            'frame': frame_name,
+        })
+        if observe and zone_scheduler.enabled:
+            value = record['people_per_m2'] if camera.radius_m else float(count)
+            zone_scheduler.observe(camera.zone_key, result, value, record['density_level'] if camera.radius_m else None)
+        self._records.append(record)
+        if camera.zone_id:
+            self._zones[camera.zone_id] = {'current_density': count, 'last_updated': record['timestamp']}
+        if len(self._records) >= self.flush_max:
+            self._flush_now.set()
+        self._ensure_writer()
+
+    def _ensure_writer(self):
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._run_writer())
+
+    async def _run_writer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_s)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write the buffered records and zone counts in bulk."""
+        records, self._records = self._records, []
+        zones, self._zones = self._zones, {}
+        if not records and not zones:
+            return
+        try:
+            await self._write(records, zones)
+            self.flushes += 1
+            self.records_written += len(records)
+            self.zone_updates += len(zones)
+        except Exception as e:
+            self.write_errors += 1
+            print(f"⚠️  Camera ingest write failed ({len(records)} records): {e}")
+
+    async def _write(self, records: List[Dict[str, Any]], zones: Dict[str, Dict[str, Any]]):
+        from pymongo import UpdateOne
+
+        from routes.zones import zone_density_status
+
+        if records:
+            await database["crowd_density"].insert_many(records, ordered=False)
+        if not zones:
+            return
+        ids = [ObjectId(zone_id) for zone_id in zones]
+        capacities = {
+            str(doc['_id']): doc.get('capacity')
+            async for doc in database["zones"].find({'_id': {'$in': ids}}, {'capacity': 1})
+        }
+        updates = []
+        for zone_id, fields in zones.items():
+            if capacities.get(zone_id):
+                fields['density_status'] = zone_density_status(fields['current_density'], capacities[zone_id])
+            updates.append(UpdateOne({'_id': ObjectId(zone_id)}, {'$set': fields}))
+        await database["zones"].bulk_write(updates, ordered=False)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        while self._counted_at and now - self._counted_at[0] > self.rate_window_s:
+            self._counted_at.popleft()
+        window = min(self.rate_window_s, now - self.started_at) if self.started_at else 0.0
+        return {
+            "running": self.running,
+            "cameras": len(self.cameras),
+            "stale": sum(1 for s in self.cameras.values() if s.stale),
+            "backing_off": sum(1 for s in self.cameras.values() if s.consecutive_errors),
+            "frames_per_s": round(len(self._counted_at) / window, 3) if window > 0 else 0.0,
+            "counted": sum(s.counted for s in self.cameras.values()),
+            "dropped": sum(s.dropped for s in self.cameras.values()),
+            "errors": sum(s.errors for s in self.cameras.values()),
+            "pending_records": len(self._records),
+            "flushes": self.flushes,
+            "records_written": self.records_written,
+            "zone_updates": self.zone_updates,
+            "write_errors": self.write_errors,
+            "per_camera": {camera_id: s.stats(now) for camera_id, s in self.cameras.items()},
+        }
+
+
+ingest = CameraIngest(
+    poll_s=settings.camera_ingest_poll_s,
+    backoff_s=settings.camera_ingest_backoff_s,
+    backoff_max_s=settings.camera_ingest_backoff_max_s,
+    stale_after_s=settings.camera_ingest_stale_after_s,
+    flush_s=settings.camera_ingest_flush_s,
+    flush_max=settings.camera_ingest_flush_max,
+    read_concurrency=settings.camera_ingest_read_concurrency,
+)
+
+
+async def _serve(cameras: List[CameraConfig], report_interval: float):
+    from database import init_db
+    from inference_executor import executor
+    from routes import inference
+
+    await init_db()
+    await executor.startup(settings.model_warmup)
+    await ingest.start(cameras, inference._count_contents)
+    try:
+        while True:
+            await asyncio.sleep(report_interval)
+            s = ingest.stats()
+            print(f"✓ Ingest: {s['frames_per_s']} frames/s, {s['counted']} counted, {s['stale']} stale, "
+                  f"{s['backing_off']} backing off, {s['records_written']} records written")
+    finally:
+        await ingest.stop()
+        await inference.batcher.close()
+        inference.close_tensor_ring()
+        executor.shutdown()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Count frames from camera folders and streams into zones.")
+    parser.add_argument("--config", default=settings.camera_ingest_config, required=not settings.camera_ingest_config,
+                        help="JSON file of cameras (default: CAMERA_INGEST_CONFIG)")
+    parser.add_argument("--report-interval", type=float, default=60.0, help="seconds between throughput reports")
+    args = parser.parse_args(argv)
+    cameras = load_cameras(args.config)
+    try:
+        asyncio.run(_serve(cameras, args.report_interval))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -26,7 +26,70 @@ class Settings(BaseSettings):
     
     # CORS
     allowed_origins: list = ["*"]
-    
+
+    # Inference
+    model_path: str = "./model_weights.pt"
+    inference_device: Optional[str] = None  # "cuda" / "cpu"; auto-detected when unset
+    model_hot_reload: bool = True  # Reload weights when the file on disk changes
+    model_reload_check_s: float = 2.0  # Minimum seconds between mtime checks
+    model_warmup: bool = True  # Run one samplecrowd image through the model at startup
+    model_mmap: bool = False  # Memory-map torch.load checkpoints so processes share the weights pages
+    inference_backend: str = "torch"  # torch | int8 | torchscript | onnx
+    lwcc_model_name: str = "DM-Count"  # LWCC fallback model used when MODEL_PATH is missing
+    lwcc_model_weights: str = "SHA"
+    inference_batch_size: int = 8  # Max images per forward pass
+    inference_batch_wait_ms: float = 10.0  # Max time the first queued image waits for a batch to fill
+    inference_workers: int = 0  # Worker processes for inference; 0 runs it on a background thread
+    inference_timeout_s: float = 30.0  # Per-batch inference timeout
+    inference_shm_slots: int = 16  # Shared-memory tensor slots for handing images to worker processes; 0 sends encoded bytes
+    inference_input_size: int = 512  # Model input is resized to this square size
+    inference_cascade: bool = True  # Answer clearly-Safe/Moderate/... frames from a cheap low-resolution pass
+    inference_cascade_size: int = 128  # Input size of the cheap pass
+    inference_cascade_margin: float = 0.3  # Escalate when the cheap density is within this fraction of a level boundary
+    inference_cascade_calibration: int = 8  # Images run through both tiers before the cheap count answers alone
+    inference_cascade_audit_every: int = 20  # Also escalate one in N clear frames to keep the calibration current; 0 disables
+    inference_batch_max_files: int = 256  # Max images per /inference/count-batch request
+    inference_archive_max_image_mb: float = 32.0  # Largest uncompressed image accepted from an uploaded archive
+    inference_archive_max_total_mb: float = 512.0  # Uncompressed images of one archive, in total
+    inference_video_timeout_s: float = 600.0  # Timeout for one /inference/count-video request
+    inference_tile_size: int = 512  # Tile edge in pixels for tiled=true requests
+    inference_tile_overlap: int = 64  # Overlap between neighbouring tiles in pixels
+    inference_tile_max_pixels: int = 16_000_000  # Larger images are downscaled to this budget first
+    inference_cache_mb: float = 64.0  # Result cache size; 0 disables it
+    inference_cache_ttl_s: float = 300.0  # How long a cached count stays valid
+    density_map_dir: str = "./density_maps"  # Stored per-record density maps (.npy)
+    density_map_max_side: int = 128  # Stored maps are sum-pooled to at most this many cells per side
+    frame_dedup_threshold: float = 2.0  # Mean abs thumbnail difference (0-255) below which a source's last count is reused; 0 disables
+    frame_dedup_max_reuse_s: float = 30.0  # Recount a static source at least this often
+    inference_budget_fps: float = 20.0  # Frames per second this node counts across all zones; 0 disables scheduling
+    inference_schedule_intervals: dict = {"Safe": 30.0, "Moderate": 10.0, "Risky": 3.0, "Overcrowded": 1.0}  # Seconds between frames per density level
+    inference_schedule_min_interval_s: float = 0.5
+    inference_schedule_max_interval_s: float = 60.0
+    inference_admission_slots: int = 16  # Images counted at once; 0 disables admission control
+    inference_queue_depth: int = 64  # Routine requests that may wait for a slot; more get 429
+    inference_priority_queue_depth: int = 32  # Waiting room of the priority lane (Risky/Overcrowded zones, priority roles)
+    inference_queue_timeout_s: float = 10.0  # Longest wait for a slot before 503
+    inference_priority_roles: list = ["medical", "police"]
+    inference_qos: bool = True  # Degrade to cheaper counting while the inference queue is saturated
+    inference_qos_tiers: list = ["reduced", "quantized", "estimate"]  # Degrade steps, in order
+    inference_qos_thresholds: list = [0.5, 0.75, 0.9]  # Queue fill (fraction of INFERENCE_QUEUE_DEPTH) entering each step
+    inference_qos_hold_s: float = 5.0  # Time the queue must stay drained before quality steps back up
+    inference_qos_reduced_size: int = 256  # Model input size of the reduced tier
+    inference_qos_quantized_size: int = 192  # Model input size of the quantized tier; smaller, so it is cheaper even if int8 falls back to torch
+    inference_qos_quantized_backend: str = "int8"
+    inference_ws_max_inflight: int = 2  # Frames of one /inference/stream connection counted at once
+    inference_ws_max_frame_bytes: int = 8 * 1024 * 1024
+
+    # Camera ingest (see camera_ingest.py)
+    camera_ingest_config: Optional[str] = None  # JSON file of cameras to ingest inside the API process; unset disables
+    camera_ingest_poll_s: float = 2.0  # Shortest time between two reads of one camera
+    camera_ingest_backoff_s: float = 1.0  # First retry delay after a failed read/count; doubles per failure
+    camera_ingest_backoff_max_s: float = 60.0
+    camera_ingest_stale_after_s: float = 30.0  # A camera with no new frame for this long is reported stale
+    camera_ingest_flush_s: float = 1.0  # Buffered records and zone counts are written this often
+    camera_ingest_flush_max: int = 500  # ... or as soon as this many records are buffered
+    camera_ingest_read_concurrency: int = 32  # Folder scans / snapshot fetches running at once
+
     class Config:
         env_file = ".env"
         case_sensitive = False
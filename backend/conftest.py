@@ -39,3 +39,11 @@ async def setup_test_database(event_loop):
     # Close the client after all tests
     if db_module.client is not None:
         db_module.client.close()
+
+
+@pytest.fixture(autouse=True)
+def clear_inference_cache():
+    """Tests swap inference backends (e.g. fake LWCC), so cached counts must not leak between them"""
+    from routes.inference import result_cache
+    result_cache.clear()
+    yield
@@ -28,6 +28,11 @@ async def create_indexes():
     await database["crowd_density"].create_index("id", unique=True)
     await database["crowd_density"].create_index("event_id")
     await database["crowd_density"].create_index("timestamp")
+
+    # Camera area masks collection
+    await database["camera_area_masks"].create_index(
+        [("event_id", 1), ("camera_id", 1), ("area_name", 1)], unique=True
+    )
     
     # Medical emergencies collection
     await database["medical_emergencies"].create_index("id", unique=True)
@@ -0,0 +1,132 @@
+"""
+On-disk density maps for crowd-density records.
+
+When a count is saved with its density map, the model output is sum-pooled
+down to at most `max_side` cells on the long edge (which keeps the total
+count) and written as a float16 `.npy` file, one per record, grouped by
+event. The `crowd_density` record keeps the file path and map metadata.
+
+Maps are read back memory-mapped, so recounting a region over an event's
+whole history only touches the pages it needs. Regions are boxes or polygons
+in normalized image coordinates (0..1, origin top-left), which makes them
+independent of camera and map resolution; their raster masks are cached per
+map shape so a replay is one multiply-sum per map.
+"""
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+Region = Dict[str, Any]  # {"box": [x0, y0, x1, y1]} or {"polygon": [[x, y], ...]}
+
+
+def downsample(density: np.ndarray, max_side: int = 128) -> np.ndarray:
+    """Sum-pool a density map so its long edge is at most `max_side`; returns float16.
+
+    Sum pooling keeps the integral (the count). Edges that do not divide
+    evenly are zero-padded first.
+    """
+    density = np.asarray(density, dtype=np.float32)
+    h, w = density.shape
+    factor = max(1, int(np.ceil(max(h, w) / float(max_side)))) if max_side else 1
+    if factor > 1:
+        ph, pw = -h % factor, -w % factor
+        if ph or pw:
+            density = np.pad(density, ((0, ph), (0, pw)))
+        density = density.reshape(density.shape[0] // factor, factor,
+                                  density.shape[1] // factor, factor).sum(axis=(1, 3))
+    return density.astype(np.float16)
+
+
+def region_polygon(region: Region) -> np.ndarray:
+    """Region as an (N, 2) array of normalized polygon vertices; raises ValueError if malformed."""
+    if 'polygon' in region:
+        poly = np.asarray(region['polygon'], dtype=np.float64)
+        if poly.ndim != 2 or poly.shape[1] != 2 or len(poly) < 3:
+            raise ValueError('polygon needs at least 3 [x, y] points')
+        return poly
+    if 'box' in region:
+        x0, y0, x1, y1 = (float(v) for v in region['box'])
+        return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float64)
+    raise ValueError('region needs a "box" or "polygon"')
+
+
+def polygon_mask(polygon: Sequence[Sequence[float]], shape: Tuple[int, int]) -> np.ndarray:
+    """float32 mask of the cells of a `shape` grid whose centers fall inside `polygon`.
+
+    `polygon` is in normalized (x, y) image coordinates. Even-odd rule,
+    evaluated for all cell centers at once, one polygon edge at a time.
+    """
+    h, w = shape
+    poly = np.asarray(polygon, dtype=np.float64)
+    ys = (np.arange(h) + 0.5) / h
+    xs = (np.arange(w) + 0.5) / w
+    px, py = np.meshgrid(xs, ys)
+    inside = np.zeros((h, w), dtype=bool)
+    x1, y1 = poly[-1]
+    for x2, y2 in poly:
+        if y1 != y2:
+            crosses = (y1 > py) != (y2 > py)
+            x_at = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crosses & (px < x_at)
+        x1, y1 = x2, y2
+    return inside.astype(np.float32)
+
+
+class DensityMapStore:
+    """Writes and memory-maps per-record density maps under `root`."""
+
+    def __init__(self, root: str, max_side: int = 128, mask_cache_size: int = 256):
+        self.root = root
+        self.max_side = max_side
+        self.mask_cache_size = mask_cache_size
+        self._masks: "OrderedDict[Any, np.ndarray]" = OrderedDict()
+
+    def path_for(self, record_id: str, event_id: Optional[str] = None) -> str:
+        safe = lambda s: ''.join(c if c.isalnum() or c in '-_' else '_' for c in str(s))
+        return os.path.join(self.root, safe(event_id or 'no-event'), f"{safe(record_id)}.npy")
+
+    def save(self, record_id: str, density: np.ndarray, event_id: Optional[str] = None) -> Dict[str, Any]:
+        """Store a (downsampled) map; returns the metadata to keep on the record."""
+        small = density if density.dtype == np.float16 and max(density.shape) <= self.max_side \
+            else downsample(density, self.max_side)
+        path = self.path_for(record_id, event_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fh:
+            np.save(fh, small)
+        os.replace(tmp, path)
+        return {
+            'path': path,
+            'shape': list(small.shape),
+            'dtype': str(small.dtype),
+            'total': round(float(small.sum(dtype=np.float64)), 3),
+        }
+
+    @staticmethod
+    def load(path: str) -> np.ndarray:
+        """Read-only memory map of a stored density map."""
+        return np.load(path, mmap_mode='r')
+
+    def mask(self, region: Region, shape: Tuple[int, int]) -> np.ndarray:
+        """Cached raster mask for `region` at `shape`."""
+        poly = region_polygon(region)
+        key = (tuple(shape), poly.tobytes())
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = polygon_mask(poly, shape)
+            self._masks[key] = mask
+            if len(self._masks) > self.mask_cache_size:
+                self._masks.popitem(last=False)
+        else:
+            self._masks.move_to_end(key)
+        return mask
+
+    def region_counts(self, density: np.ndarray, regions: Dict[str, Region]) -> Dict[str, float]:
+        """People inside each named region of one density map."""
+        out = {}
+        for name, region in regions.items():
+            mask = self.mask(region, density.shape)
+            out[name] = round(float(np.vdot(mask, density.astype(np.float32, copy=False))), 3)
+        return out
@@ -0,0 +1,135 @@
+"""
+Near-duplicate frame detection for fixed cameras.
+
+Fixed cameras keep resending almost the same picture while the crowd is
+static. Each upload that names its source (camera) gets a 32x32 grayscale
+thumbnail, decoded at 1/8 scale for JPEGs so it costs a few milliseconds.
+The thumbnail is compared with the one from the last frame that actually went
+through the model. If the mean absolute difference (0-255 scale) is below the
+event's threshold, that frame's result is reused instead of running the
+model again.
+
+Comparing against the last *counted* frame, rather than the previous upload,
+means slow drift still triggers a recount. `max_reuse_s` forces a recount
+even for a perfectly static scene. Per-source frame and skip counters are
+kept for `/inference/stats`.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+import inference_utils as iu
+from config import settings
+from database import database
+
+THUMB_SIZE = (32, 32)
+
+
+def thumbnail(data: Any) -> np.ndarray:
+    """Small grayscale float32 thumbnail of an encoded image (CPU work; run off the event loop)."""
+    img = iu.open_image(data, min_size=(THUMB_SIZE[0] * 2, THUMB_SIZE[1] * 2))
+    small = img.convert('L').resize(THUMB_SIZE, iu.Image.BILINEAR)
+    return np.asarray(small, dtype=np.float32)
+
+
+class _Source:
+    __slots__ = ('thumb', 'result', 'counted_at', 'frames', 'skipped', 'last_change')
+
+    def __init__(self):
+        self.thumb = None
+        self.result = None
+        self.counted_at = 0.0
+        self.frames = 0
+        self.skipped = 0
+        self.last_change = None
+
+
+class FrameDeduplicator:
+    """Reuses the last counted result of a source while its frames stay unchanged."""
+
+    def __init__(self, threshold: float = 2.0, max_reuse_s: float = 30.0,
+                 max_sources: int = 1024, event_ttl_s: float = 60.0):
+        self.threshold = threshold
+        self.max_reuse_s = max_reuse_s
+        self.max_sources = max_sources
+        self.event_ttl_s = event_ttl_s
+        self._sources: "OrderedDict[str, _Source]" = OrderedDict()
+        self._event_thresholds: Dict[str, Tuple[Optional[float], float]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    async def threshold_for(self, event_id: Optional[str]) -> float:
+        """The event's `frame_dedup_threshold`, or the global default (cached for `event_ttl_s`)."""
+        if not event_id:
+            return self.threshold
+        cached = self._event_thresholds.get(event_id)
+        if cached is None or cached[1] < time.monotonic():
+            event = await database["events"].find_one({"id": event_id}, {"_id": 0, "frame_dedup_threshold": 1})
+            value = (event or {}).get("frame_dedup_threshold")
+            cached = (value, time.monotonic() + self.event_ttl_s)
+            self._event_thresholds[event_id] = cached
+        return self.threshold if cached[0] is None else float(cached[0])
+
+    def forget_event(self, event_id: str):
+        """Drop the cached threshold after an event update."""
+        self._event_thresholds.pop(event_id, None)
+
+    def _source(self, key: str) -> _Source:
+        source = self._sources.get(key)
+        if source is None:
+            source = self._sources[key] = _Source()
+            if len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+        else:
+            self._sources.move_to_end(key)
+        return source
+
+    def match(self, key: str, thumb: np.ndarray, threshold: float) -> Optional[Dict[str, Any]]:
+        """The reusable result for this frame, or None if the model has to run.
+
+        Counts the frame towards the source's statistics either way.
+        """
+        source = self._source(key)
+        source.frames += 1
+        if source.thumb is None or source.result is None or threshold <= 0:
+            source.last_change = None
+            return None
+        change = float(np.abs(thumb - source.thumb).mean())
+        source.last_change = round(change, 3)
+        if change >= threshold or time.time() - source.counted_at >= self.max_reuse_s:
+            return None
+        source.skipped += 1
+        return {**source.result, 'change': source.last_change, 'counted_at': source.counted_at}
+
+    def remember(self, key: str, thumb: np.ndarray, result: Dict[str, Any]):
+        """Make `result` (just computed for `thumb`) the reference for the source."""
+        source = self._source(key)
+        source.thumb = thumb
+        source.result = result
+        source.counted_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "max_reuse_s": self.max_reuse_s,
+            "sources": {
+                key: {
+                    "frames": s.frames,
+                    "skipped": s.skipped,
+                    "skip_ratio": round(s.skipped / s.frames, 3) if s.frames else 0.0,
+                    "last_change": s.last_change,
+                }
+                for key, s in self._sources.items()
+            },
+        }
+
+
+frame_dedup = FrameDeduplicator(
+    threshold=settings.frame_dedup_threshold,
+    max_reuse_s=settings.frame_dedup_max_reuse_s,
+)
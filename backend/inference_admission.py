@@ -0,0 +1,186 @@
+"""
+Admission control for model inference.
+
+At most `slots` images are counted at once. Further requests wait in one of
+two lanes, and a freed slot always goes to the priority lane first. The
+priority lane is for frames from zones already at Risky/Overcrowded, or sent
+by medical/police users. Each lane has a bounded depth. A request that finds
+its lane full is rejected at once (`AdmissionRejected`, HTTP 429). A request
+that waits longer than `timeout_s` gives up (`AdmissionTimeout`, HTTP 503).
+Both carry a Retry-After estimate based on the current backlog and the
+recent time per image.
+
+Bulk work (`/inference/count-batch`, videos, camera ingest) queues in the
+routine lane without a depth limit or timeout. It still yields to priority
+frames, and it is left out of the queue pressure that drives QoS degrading
+and WebSocket shedding (`waiting(bulk=False)`).
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from config import settings
+from database import database
+from inference_batcher import Histogram
+
+LANES = ("priority", "routine")
+
+
+class AdmissionRejected(Exception):
+    """The lane's queue is full."""
+
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"Inference queue full ({lane} lane); retry in {retry_after}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class AdmissionTimeout(Exception):
+    """Waited too long for an inference slot."""
+
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"Timed out waiting for an inference slot ({lane} lane); retry in {retry_after}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded two-lane queue in front of the model. `slots` <= 0 admits everything."""
+
+    def __init__(self, slots: int = 16, queue_depth: int = 64, priority_depth: int = 32,
+                 timeout_s: float = 10.0, priority_roles=("medical", "police"), role_ttl_s: float = 300.0):
+        self.slots = slots
+        self.depth = {"priority": priority_depth, "routine": queue_depth}
+        self.timeout_s = timeout_s
+        self.priority_roles = set(priority_roles)
+        self.role_ttl_s = role_ttl_s
+        self.inflight = 0
+        self._waiters = {lane: deque() for lane in LANES}
+        self.bulk_waiting = 0
+        self._roles: Dict[str, Tuple[Optional[str], float]] = {}
+        self._service_s = 0.5  # EMA of seconds per admitted image
+        self.admitted = {lane: 0 for lane in LANES}
+        self.rejected = {lane: 0 for lane in LANES}
+        self.timeouts = {lane: 0 for lane in LANES}
+        self.wait_hist = {lane: Histogram([1, 5, 10, 50, 100, 250, 500, 1000, 5000, 10000]) for lane in LANES}
+
+    @property
+    def enabled(self) -> bool:
+        return self.slots > 0
+
+    async def is_priority_user(self, user_id: Optional[str]) -> bool:
+        """True if the user's role gets the priority lane (roles cached for `role_ttl_s`)."""
+        if not user_id or not self.priority_roles:
+            return False
+        cached = self._roles.get(user_id)
+        if cached is None or cached[1] < time.monotonic():
+            user = await database["users"].find_one({"id": user_id}, {"_id": 0, "role": 1})
+            cached = ((user or {}).get("role"), time.monotonic() + self.role_ttl_s)
+            self._roles[user_id] = cached
+        return cached[0] in self.priority_roles
+
+    def waiting(self, bulk: bool = True) -> int:
+        """Requests waiting for a slot; `bulk=False` leaves out the unbounded bulk waiters."""
+        total = sum(len(w) for w in self._waiters.values())
+        return total if bulk else total - self.bulk_waiting
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog has likely drained."""
+        backlog = self.waiting() + 1
+        return max(1, math.ceil(backlog * self._service_s / max(1, self.slots)))
+
+    def _release(self):
+        # Hand the slot straight to the next waiter, priority lane first
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters:
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                try:
+                    future.set_result(None)
+                except RuntimeError:
+                    # The waiter's event loop is gone
+                    continue
+                return
+        self.inflight -= 1
+
+    async def _acquire(self, lane: str, bulk: bool):
+        if self.inflight < self.slots and not self.waiting():
+            self.inflight += 1
+            return
+        if not bulk and len(self._waiters[lane]) >= self.depth[lane]:
+            self.rejected[lane] += 1
+            raise AdmissionRejected(lane, self.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        self.bulk_waiting += bulk
+        try:
+            await asyncio.wait_for(future, None if bulk else self.timeout_s)
+        except asyncio.TimeoutError:
+            self._discard(lane, future)
+            self.timeouts[lane] += 1
+            raise AdmissionTimeout(lane, self.retry_after())
+        except BaseException:
+            self._discard(lane, future)
+            # Cancelled after the slot was handed over: pass it on
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            self.bulk_waiting -= bulk
+
+    def _discard(self, lane: str, future):
+        try:
+            self._waiters[lane].remove(future)
+        except ValueError:
+            pass
+
+    @asynccontextmanager
+    async def slot(self, priority: bool = False, bulk: bool = False):
+        """Hold one inference slot for the duration of the block."""
+        if not self.enabled:
+            yield
+            return
+        lane = "priority" if priority else "routine"
+        start = time.perf_counter()
+        await self._acquire(lane, bulk)
+        admitted = time.perf_counter()
+        self.wait_hist[lane].observe((admitted - start) * 1000.0)
+        self.admitted[lane] += 1
+        try:
+            yield
+        finally:
+            self._service_s += 0.1 * ((time.perf_counter() - admitted) - self._service_s)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "slots": self.slots,
+            "inflight": self.inflight,
+            "service_ms": round(self._service_s * 1000.0, 1),
+            "lanes": {
+                lane: {
+                    "queue_depth": len(self._waiters[lane]),
+                    "max_depth": self.depth[lane],
+                    "admitted": self.admitted[lane],
+                    "rejected": self.rejected[lane],
+                    "timed_out": self.timeouts[lane],
+                    "wait_ms": self.wait_hist[lane].snapshot(),
+                }
+                for lane in LANES
+            },
+        }
+
+
+admission = AdmissionController(
+    slots=settings.inference_admission_slots,
+    queue_depth=settings.inference_queue_depth,
+    priority_depth=settings.inference_priority_queue_depth,
+    timeout_s=settings.inference_queue_timeout_s,
+    priority_roles=settings.inference_priority_roles,
+)
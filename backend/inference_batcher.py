@@ -0,0 +1,177 @@
+"""
+Dynamic micro-batching for the inference endpoints.
+
+Concurrent requests submit one item each; a background task groups whatever
+is queued into batches of up to `max_batch_size` items, waiting at most
+`max_wait_ms` after the first item arrives, runs the whole batch through a
+single `run_batch` call and resolves each caller's future with its own result.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative, Prometheus-style `le` buckets)."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = []
+        for upper, n in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += n
+            buckets.append({"le": "+Inf" if upper == float("inf") else upper, "count": cumulative})
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "avg": round(self.sum / self.count, 3) if self.count else None,
+            "buckets": buckets,
+        }
+
+
+class BatchScheduler:
+    """Queue single items and run them through `run_batch` in groups.
+
+    `run_batch` is an async callable taking a list of items and returning a
+    list of results of the same length. A result that is an Exception instance
+    is raised to that item's caller only; an exception raised by `run_batch`
+    itself fails every item in the batch.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 concurrency: int = 1):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.concurrency = max(1, int(concurrency))
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop = None
+        self._workers: List[asyncio.Task] = []
+
+        self.batch_size_hist = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_wait_hist = Histogram([1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000])
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the previous event loop went away (e.g. TestClient
+            # runs each request on its own loop): start fresh on this loop.
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._workers = []
+        alive = []
+        for worker in self._workers:
+            if not worker.done():
+                alive.append(worker)
+            elif not worker.cancelled() and worker.exception() is not None:
+                print(f"⚠️  Batch worker died ({worker.exception()!r}); restarting it")
+        # Replace dead workers one by one, so a single failure does not halve throughput
+        self._workers = alive + [loop.create_task(self._worker()) for _ in range(self.concurrency - len(alive))]
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its individual result."""
+        self._ensure_workers()
+        future = self._loop.create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect()
+            # Callers that gave up (cancelled/timed out) are dropped before running
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+
+            now = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_hist.observe((now - enqueued) * 1000.0)
+            self.batch_size_hist.observe(len(batch))
+            self.batches += 1
+            self.items += len(batch)
+
+            try:
+                results = await self.run_batch([item for item, _, _ in batch])
+            except BaseException as e:
+                self.errors += 1
+                stopping = asyncio.current_task().cancelling() > 0 or not isinstance(e, (Exception, asyncio.CancelledError))
+                if isinstance(e, asyncio.CancelledError):
+                    # Something below run_batch was cancelled, not necessarily this worker
+                    e = RuntimeError("Batch was cancelled before it finished")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if stopping:
+                    raise
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def close(self):
+        """Cancel the background batch workers (idempotent)."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        for worker in workers:
+            try:
+                await worker
+            except (asyncio.CancelledError, RuntimeError):
+                # RuntimeError: the worker belonged to an event loop that is gone
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+        }
@@ -0,0 +1,98 @@
+"""
+Content-addressed cache of crowd-count results.
+
+Keys are a SHA-256 of the uploaded image bytes combined with the model
+version and the preprocessing parameters, so a re-uploaded frame (client
+retry, relay hiccup) returns the earlier result without running the model,
+while a new model or input size never serves stale counts. The cache is an
+LRU bounded by an estimate of its memory use, with a per-entry TTL.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Rough per-entry overhead of the key string, tuple and OrderedDict slot
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+def cache_key(data, model_version: str, **params: Any) -> str:
+    """Hash of the image bytes plus model version and preprocessing params."""
+    digest = hashlib.sha256(data).hexdigest()
+    suffix = json.dumps(params, sort_keys=True, default=str)
+    return f"{digest}:{model_version}:{suffix}"
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int, ttl_s: float):
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def _size(key: str, value: Any) -> int:
+        return len(key) + len(json.dumps(value, default=str)) + _ENTRY_OVERHEAD_BYTES
+
+    def _drop(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, time.monotonic() + self.ttl_s, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
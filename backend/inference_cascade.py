@@ -0,0 +1,138 @@
+"""
+Two-tier counting: a cheap estimate first, the full model only when it matters.
+
+The cheap tier is the same model run on a much smaller input
+(`inference_cascade_size`, e.g. 128x128 instead of 512x512, about 1/16 of the
+compute). Its count is corrected by a running full/cheap ratio learned from
+the images that went through both tiers. When the frame's area is known, the
+corrected estimate is turned into people/m² and compared with the
+`calculate_density` level boundaries. If it is not within `margin` (relative)
+of a boundary, the level is unambiguous and the cheap count is the answer.
+Otherwise the image is escalated to the full model.
+
+The ratio has to be learned before the cheap count can be trusted: until
+`calibration_frames` images have run both tiers, every eligible image is
+escalated. Boundary frames alone would leave it stale (a scene that stays
+clearly Safe never escalates), so afterwards one in `audit_every` clear
+frames is escalated too, to keep the ratio tracking the scene. Each source
+zone (camera / event area) learns its own ratio, since the cheap pass's error
+depends on the scene.
+
+Images without a known area, or that need a density map, always use the full
+model.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Level boundaries of CrowdDensity.classify_density (people per m²)
+DENSITY_BOUNDARIES = (0.5, 2.0, 4.0)
+
+
+class _Calibration:
+    """Cheap-to-full ratio of one zone."""
+
+    __slots__ = ('scale', 'calibrated', 'clear_since_audit')
+
+    def __init__(self):
+        self.scale = 1.0  # full-model count / cheap count, learned from escalations
+        self.calibrated = 0
+        self.clear_since_audit = 0
+
+
+class CascadePolicy:
+    """Decides per image whether the cheap estimate is good enough (runs in the inference worker).
+
+    The calibration is kept per `zone` (the source zone key of
+    inference_scheduler, None for images without a source), so a camera whose
+    cheap pass is off by more than the average gets its own ratio. The
+    `max_zones` most recently seen zones are kept.
+    """
+
+    def __init__(self, cheap_size: int = 128, margin: float = 0.3, calibration_alpha: float = 0.1,
+                 calibration_frames: int = 8, audit_every: int = 20, max_zones: int = 1024):
+        self.cheap_size = cheap_size
+        self.margin = margin
+        self.calibration_alpha = calibration_alpha
+        self.calibration_frames = calibration_frames
+        self.audit_every = audit_every  # 0: escalate only near boundaries once calibrated
+        self.max_zones = max(1, max_zones)
+        self._zones: "OrderedDict[Optional[str], _Calibration]" = OrderedDict()
+
+    def _calibration(self, zone: Optional[str]) -> _Calibration:
+        cal = self._zones.get(zone)
+        if cal is None:
+            cal = self._zones[zone] = _Calibration()
+            while len(self._zones) > self.max_zones:
+                self._zones.popitem(last=False)
+        else:
+            self._zones.move_to_end(zone)
+        return cal
+
+    def scale(self, zone: Optional[str] = None) -> float:
+        cal = self._zones.get(zone)
+        return cal.scale if cal is not None else 1.0
+
+    def estimate(self, cheap_count: float, zone: Optional[str] = None) -> float:
+        return cheap_count * self.scale(zone)
+
+    def needs_full(self, estimate: Optional[float], area_m2: Optional[float], zone: Optional[str] = None) -> bool:
+        """True when the estimate's density level could be wrong, or the zone's calibration needs a sample."""
+        cal = self._calibration(zone)
+        if estimate is None or not area_m2 or cal.calibrated < self.calibration_frames:
+            return True
+        density = estimate / area_m2
+        if any(abs(density - b) <= self.margin * b for b in DENSITY_BOUNDARIES):
+            return True
+        cal.clear_since_audit += 1
+        if self.audit_every and cal.clear_since_audit >= self.audit_every:
+            cal.clear_since_audit = 0
+            return True
+        return False
+
+    def observe(self, cheap_count: float, full_count: float, zone: Optional[str] = None):
+        """Update the zone's cheap-to-full calibration from an image that ran both tiers."""
+        if cheap_count <= 0.5 or full_count <= 0:
+            return
+        cal = self._calibration(zone)
+        ratio = full_count / cheap_count
+        if cal.calibrated == 0:
+            cal.scale = ratio
+        else:
+            cal.scale += self.calibration_alpha * (ratio - cal.scale)
+        cal.calibrated += 1
+
+
+class CascadeStats:
+    """Which tier answered, and the model cost saved against always using the full model.
+
+    Cost is in full-model forward passes per image; a cheap pass costs
+    (cheap_size / input_size)² of one.
+    """
+
+    def __init__(self, cheap_size: int, input_size: int):
+        self.cheap_cost = (cheap_size / float(input_size)) ** 2
+        self.cheap = 0
+        self.escalated = 0
+        self.full = 0
+
+    def record(self, result: Dict[str, Any]):
+        tier = result.get('tier')
+        if tier == 'cheap':
+            self.cheap += 1
+        elif tier == 'escalated':
+            self.escalated += 1
+        elif tier == 'full':
+            self.full += 1
+
+    def stats(self) -> Dict[str, Any]:
+        images = self.cheap + self.escalated + self.full
+        cost = self.cheap * self.cheap_cost + self.escalated * (1 + self.cheap_cost) + self.full
+        return {
+            'images': images,
+            'answered_cheap': self.cheap,
+            'escalated': self.escalated,
+            'full_only': self.full,
+            'cheap_ratio': round(self.cheap / images, 3) if images else None,
+            'model_cost': round(cost, 3),
+            'cost_saved': round(1 - cost / images, 3) if images else None,
+        }
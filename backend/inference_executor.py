@@ -0,0 +1,157 @@
+"""
+Executor that keeps CPU-bound inference off the API event loop.
+
+With `inference_workers > 0` calls run in a pool of worker processes, each of
+which loads the model once in its initializer. A worker that crashes (segfault,
+OOM kill) only breaks the pool, which is rebuilt for the next call; a call that
+exceeds its timeout has its pool recycled so the stuck worker is killed.
+Other calls that were queued or running in that pool did nothing wrong: they
+are resubmitted once to the new pool, within their own timeout.
+With `inference_workers = 0` calls run on a single dedicated thread in the API
+process (development and tests); timeouts still apply to the caller.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from config import settings
+
+
+class InferenceWorkerError(RuntimeError):
+    """An inference worker process died while handling a call."""
+
+
+def _init_worker(threads: int):
+    """Process-pool initializer: size torch's thread pool and preload the model."""
+    import inference_utils as iu
+    from model_registry import registry
+
+    if iu.torch is not None and threads > 0:
+        try:
+            iu.torch.set_num_threads(threads)
+        except Exception:
+            pass
+    registry.get()
+
+
+class InferenceExecutor:
+    def __init__(self, workers: int = 0, timeout_s: float = 30.0):
+        self.workers = max(0, int(workers))
+        self.timeout_s = timeout_s
+        self._pool = None
+        self._lock = threading.Lock()
+        self._timed_out_pools = weakref.WeakSet()  # pools torn down because some call timed out
+        self.stats_counters = {"calls": 0, "timeouts": 0, "crashes": 0, "restarts": 0, "resubmitted": 0}
+
+    @property
+    def mode(self) -> str:
+        return "process" if self.workers else "thread"
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.workers:
+                    threads = max(1, (os.cpu_count() or 1) // self.workers)
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        initializer=_init_worker,
+                        initargs=(threads,),
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+            return self._pool
+
+    def _recycle(self, pool):
+        """Tear down `pool` (killing its worker processes) so the next call gets a fresh one."""
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            self.stats_counters["restarts"] += 1
+        if isinstance(pool, ProcessPoolExecutor):
+            for proc in list(getattr(pool, "_processes", {}).values()):
+                try:
+                    proc.terminate()
+                except Exception:
+                    pass
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Callable, *args: Any, timeout: Optional[float] = None) -> Any:
+        """Run `fn(*args)` in the executor and await its result.
+
+        Raises asyncio.TimeoutError after `timeout` (default `timeout_s`) and
+        InferenceWorkerError when the worker process died or the pool was
+        torn down under the call.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout_s)
+        self.stats_counters["calls"] += 1
+        for attempt in range(2):
+            pool = self._get_pool()
+            submitted = pool.submit(fn, *args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(submitted), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                self.stats_counters["timeouts"] += 1
+                if self.workers:
+                    self._timed_out_pools.add(pool)
+                    self._recycle(pool)
+                raise
+            except BrokenProcessPool as e:
+                if pool not in self._timed_out_pools:
+                    self.stats_counters["crashes"] += 1
+                    self._recycle(pool)
+                    raise InferenceWorkerError(f"Inference worker crashed: {e}") from e
+                # Its worker was killed to stop another call's stuck one
+            except asyncio.CancelledError:
+                if not submitted.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                if pool not in self._timed_out_pools:
+                    raise InferenceWorkerError("Inference executor shut down") from None
+                # Dropped from the queue of a pool recycled for another call's timeout
+            self.stats_counters["resubmitted"] += 1
+        raise InferenceWorkerError("Inference pool was recycled twice while this call waited")
+
+    async def startup(self, warmup: bool = True):
+        """Start the workers, have each load (and warm up) its model, and log which
+        backend every worker will serve counts from."""
+        import inference_pipeline
+        timeout = max(self.timeout_s, 300.0)
+        # One worker first: it builds any missing backend artifacts, which the others then load
+        first = await asyncio.gather(self.run(inference_pipeline.prepare, warmup, timeout=timeout),
+                                     return_exceptions=True)
+        rest = await asyncio.gather(
+            *(self.run(inference_pipeline.prepare, warmup, timeout=timeout) for _ in range(self.workers - 1)),
+            return_exceptions=True,
+        )
+        reports = first + rest
+        for report in reports:
+            if isinstance(report, BaseException):
+                print(f"⚠️  Inference worker failed to start: {report!r}")
+            else:
+                print(inference_pipeline.describe_health(report))
+        return reports
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "timeout_s": self.timeout_s,
+            **self.stats_counters,
+        }
+
+
+executor = InferenceExecutor(
+    workers=settings.inference_workers,
+    timeout_s=settings.inference_timeout_s,
+)
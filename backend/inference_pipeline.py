@@ -0,0 +1,303 @@
+"""
+CPU-bound counting pipeline run inside the inference executor.
+
+Everything here is synchronous and runs off the API event loop (in an
+inference worker process, or the inference thread when no worker processes
+are configured). Inputs and results are plain picklable values so batches can
+cross a process boundary.
+
+Backend order per image: the registry's torch model (one batched forward pass
+for the whole batch), then the cached LWCC model (one call for every image the
+model could not count), then the NumPy skin-tone heuristic.
+"""
+import contextlib
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import density_store
+import inference_utils as iu
+from config import settings
+from inference_cascade import CascadePolicy
+from inference_qos import tier_model
+from model_registry import lwcc_fallback, registry, registry_for
+
+cascade = CascadePolicy(settings.inference_cascade_size, settings.inference_cascade_margin,
+                        calibration_frames=settings.inference_cascade_calibration,
+                        audit_every=settings.inference_cascade_audit_every)
+
+
+def _infer_sources(model: Any, sources: List[Any], slots: List[int], target_size: Tuple[int, int],
+                   results: List[Any], outputs: Optional[List[Any]], device: str) -> List[int]:
+    """One batched pass over `sources[i] for i in slots`; returns the slots that were counted."""
+    tensors, ok = [], []
+    for i in slots:
+        try:
+            tensors.append(iu.preprocess_image(sources[i], target_size=target_size))
+            ok.append(i)
+        except Exception as e:
+            results[i] = e
+    for i, (c, raw) in zip(ok, iu.infer_batch(model, tensors, device=device)):
+        results[i] = c
+        if outputs is not None:
+            outputs[i] = raw
+    return ok
+
+
+def _count_with_model(sources: List[Any], target_size: Tuple[int, int],
+                      areas_m2: Optional[Sequence[Optional[float]]] = None,
+                      density_maps: Optional[Sequence[bool]] = None,
+                      backend: Optional[str] = None,
+                      zones: Optional[Sequence[Optional[str]]] = None) -> Tuple[List[Any], List[Any], List[Optional[str]]]:
+    """Counts, raw outputs and tiers for `sources` from the torch model.
+
+    Counts are None where the model is unavailable and the exception where an
+    image could not be decoded. With cascading enabled, images with a known
+    area (and no density map requested) get a cheap low-resolution pass first
+    and only go through the full-size pass when their density level is in
+    doubt (see inference_cascade), calibrated per source zone in `zones`.
+    `backend` selects another serving backend for the same weights (the QoS
+    quantized tier).
+    """
+    n = len(sources)
+    results: List[Any] = [None] * n
+    outputs: List[Any] = [None] * n
+    tiers: List[Optional[str]] = [None] * n
+    reg = registry_for(backend, target_size[0]) if backend else registry
+    model = reg.get()
+    if model is None:
+        return results, outputs, tiers
+
+    full = list(range(n))
+    escalate = set()
+    cheap: List[Any] = [None] * n
+    if settings.inference_cascade and areas_m2 is not None:
+        eligible = [i for i in full if areas_m2[i] and not (density_maps and density_maps[i])]
+        if eligible:
+            size = (cascade.cheap_size, cascade.cheap_size)
+            _infer_sources(model, sources, eligible, size, cheap, None, reg.device)
+            for i in eligible:
+                if isinstance(cheap[i], Exception):
+                    results[i] = cheap[i]
+                    continue
+                zone = zones[i] if zones else None
+                estimate = cascade.estimate(float(cheap[i]), zone)
+                if cascade.needs_full(estimate, areas_m2[i], zone):
+                    escalate.add(i)
+                else:
+                    results[i], tiers[i] = estimate, 'cheap'
+            full = [i for i in full if i not in eligible or i in escalate]
+
+    for i in _infer_sources(model, sources, full, target_size, results, outputs, reg.device):
+        if i in escalate:
+            cascade.observe(float(cheap[i]), float(results[i]), zones[i] if zones else None)
+            tiers[i] = 'escalated'
+        else:
+            tiers[i] = 'full'
+    return results, outputs, tiers
+
+
+def _count_lwcc(sources: List[Any]) -> List[Any]:
+    """LWCC counts for `sources` in one call with the cached model; the exception on failure."""
+    try:
+        # LWCC only reads from disk, so this is the one place temp files are written
+        with contextlib.ExitStack() as stack:
+            paths = [stack.enter_context(iu.image_path_for(source)) for source in sources]
+            counts = lwcc_fallback.count(paths)
+        print(f"[DEBUG] LWCC SUCCESS! Counts: {[int(round(c)) for c in counts]}")
+        return counts
+    except (OSError, PermissionError, FileNotFoundError) as e:
+        # LWCC failed due to filesystem issues - use fallback
+        print(f"[DEBUG] LWCC failed with filesystem error: {e}")
+        return [e] * len(sources)
+    except Exception as e:
+        # Other LWCC errors
+        print(f"[DEBUG] LWCC failed: {e}")
+        return [e] * len(sources)
+
+
+def _count_heuristic(source: Any, lwcc_error: Any) -> Dict[str, Any]:
+    """NumPy skin-tone estimate for one image, the last resort."""
+    print(f"[DEBUG] Using fallback crowd estimation...")
+    try:
+        count = iu.estimate_count_heuristic(source)
+        print(f"[DEBUG] Fallback estimation: {count} people (approximation)")
+        return {
+            'count': count,
+            'backend': 'heuristic',
+            'error': f"LWCC unavailable ({lwcc_error}), using fallback estimation",
+        }
+    except ImportError as e:
+        print(f"[DEBUG] Fallback failed - missing dependencies: {e}")
+        error = f"LWCC error: {lwcc_error}; Fallback error: Missing PIL or NumPy - install with 'pip install Pillow numpy'"
+    except Exception as fallback_error:
+        print(f"[DEBUG] Fallback failed: {type(fallback_error).__name__}: {fallback_error}")
+        if "cannot identify image file" in str(fallback_error):
+            error = f"LWCC error: {lwcc_error}; Fallback error: Invalid or corrupted image file"
+        else:
+            error = f"LWCC error: {lwcc_error}; Fallback error: {fallback_error}"
+    return {'count': None, 'backend': None, 'error': error}
+
+
+def estimate_count(source: Any) -> Dict[str, Any]:
+    """NumPy-only estimate for one image (the QoS 'estimate' tier; no model, no LWCC)."""
+    try:
+        return {'count': iu.estimate_count_heuristic(source), 'backend': 'heuristic', 'error': None}
+    except Exception as e:
+        return {'count': None, 'backend': None, 'error': str(e)}
+
+
+def _small_map(output: Any) -> Optional[Any]:
+    """Model output as a downsampled float16 map, small enough to send back to the API."""
+    density = iu.density_to_2d(output)
+    return density_store.downsample(density, settings.density_map_max_side) if density is not None else None
+
+
+def count_images(sources: List[Any], target_size: Tuple[int, int] = (512, 512),
+                 density_maps: Union[bool, Sequence[bool]] = False,
+                 areas_m2: Optional[Sequence[Optional[float]]] = None,
+                 backend: Optional[str] = None,
+                 zones: Optional[Sequence[Optional[str]]] = None) -> List[Dict[str, Any]]:
+    """Count people in each image; returns one result dict per source.
+
+    Sources are image paths or in-memory encoded images (bytes, memoryview).
+
+    Each result has `count` (int or None), `backend` ('model', 'lwcc',
+    'heuristic' or None) and `error` (the last backend error, if any).
+    `density_maps` (one flag for all sources, or one per source) adds a
+    `density_map` entry: the model output downsampled to float16 (see
+    density_store), or None when the count did not come from the model.
+    `areas_m2` (per source, None when unknown) enables the cheap-first
+    cascade; model results report which `tier` answered ('cheap',
+    'escalated' or 'full'); `zones` (per source, the source zone key or
+    None) selects whose calibration the cascade uses. `backend` overrides
+    the serving backend of the model (falling back to torch if it cannot be
+    built).
+    """
+    if isinstance(density_maps, bool):
+        density_maps = [density_maps] * len(sources)
+    model_error: Optional[str] = None
+    try:
+        model_counts, outputs, tiers = _count_with_model(sources, target_size, areas_m2, density_maps, backend, zones)
+    except Exception as e:
+        model_error = str(e)
+        model_counts = outputs = tiers = [None] * len(sources)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(sources)
+    for i, c in enumerate(model_counts):
+        if c is not None and not isinstance(c, Exception):
+            results[i] = {'count': int(round(float(c))), 'backend': 'model', 'error': None, 'tier': tiers[i]}
+            if density_maps[i]:
+                results[i]['density_map'] = _small_map(outputs[i])
+
+    # Images the model could not count go through LWCC together, then the heuristic
+    pending = [i for i, r in enumerate(results) if r is None]
+    if pending:
+        lwcc_counts = _count_lwcc([sources[i] for i in pending])
+        for i, c in zip(pending, lwcc_counts):
+            if not isinstance(c, Exception):
+                results[i] = {'count': int(round(float(c))), 'backend': 'lwcc', 'error': None}
+                continue
+            result = _count_heuristic(sources[i], c)
+            if result['count'] is None and result['error'] is None:
+                m = model_counts[i]
+                result['error'] = str(m) if isinstance(m, Exception) else model_error
+            results[i] = result
+    for i, result in enumerate(results):
+        if density_maps[i]:
+            result.setdefault('density_map', None)
+    return results
+
+
+def count_image_tiled(source: Any, tile_size: int = 512, overlap: int = 64,
+                      max_pixels: int = 16_000_000, density_map: bool = False) -> Dict[str, Any]:
+    """Count one large image with tiled inference (falls back to count_images without a model)."""
+    model = registry.get()
+    if model is None:
+        result = count_images([source], density_maps=density_map)[0]
+        result['tiled'] = False
+        return result
+    tiled = iu.count_tiled(model, source, tile_size=tile_size, overlap=overlap,
+                           max_pixels=max_pixels, device=registry.device)
+    stitched = tiled.pop('density_map')
+    if density_map:
+        tiled['density_map'] = _small_map(stitched)
+    count = tiled.pop('count')
+    return {'count': int(round(count)), 'backend': 'model', 'error': None, 'tiled': True, **tiled}
+
+
+def compare_backends(max_images: int = 4, batch_size: int = 1) -> List[Dict[str, Any]]:
+    """Compare every inference backend against fp32 on bundled samplecrowd images."""
+    paths, _ = iu.find_image_paths()
+    size = registry.input_size
+    return iu.compare_backends(registry.model_path, paths[:max_images],
+                               target_size=(size, size), batch_size=batch_size)
+
+
+def prepare(run_warmup: bool = True) -> Dict[str, Any]:
+    """Load (and optionally warm up) the model in this worker; returns its health report.
+
+    Without a primary model the LWCC fallback is loaded here instead, so the
+    first request does not pay for it.
+    """
+    if registry.get() is None:
+        try:
+            lwcc_fallback.get()
+        except Exception:
+            pass
+        return health_report()
+    if run_warmup and registry.stats['warmup_ms'] is None:
+        registry.warmup()
+    # Build the degrade tier's backend now, not during the overload that first needs it
+    degrade = _degrade_registry()
+    if degrade is not None:
+        degrade.get()
+        if run_warmup and degrade.stats['warmup_ms'] is None:
+            degrade.warmup()
+    return health_report()
+
+
+def _degrade_registry():
+    """The registry of the QoS 'quantized' tier when it uses its own backend, else None."""
+    if not settings.inference_qos or 'quantized' not in settings.inference_qos_tiers:
+        return None
+    size, backend = tier_model('quantized')
+    reg = registry_for(backend, size[0])
+    return reg if reg is not registry else None
+
+
+def health_report() -> Dict[str, Any]:
+    """Which backend this worker serves counts from: 'model', 'lwcc' or 'heuristic'."""
+    if registry.status()['loaded']:
+        active = 'model'
+    elif lwcc_fallback.available:
+        active = 'lwcc'
+    else:
+        active = 'heuristic'
+    degrade = _degrade_registry()
+    return {
+        'pid': os.getpid(),
+        'active_backend': active,
+        'degraded': active != 'model',
+        'model': registry.status(),
+        'qos_model': degrade.status() if degrade is not None else None,
+        'lwcc': lwcc_fallback.status(),
+    }
+
+
+def describe_health(report: Dict[str, Any]) -> str:
+    """One-line summary of a health report for the startup log."""
+    active = report['active_backend']
+    if active == 'model':
+        model = report['model']
+        return f"✓ Inference worker {report['pid']}: model ({model['active_backend']} on {model['device']})"
+    if active == 'lwcc':
+        lwcc = report['lwcc']
+        return (f"⚠️  Inference worker {report['pid']}: no model at {report['model']['model_path']}, "
+                f"serving LWCC {lwcc['model_name']}/{lwcc['model_weights']} counts")
+    return (f"⚠️  Inference worker {report['pid']}: no model and no LWCC "
+            f"({report['lwcc']['load_error']}), serving HEURISTIC counts")
+
+
+def model_status() -> Dict[str, Any]:
+    """Registry status of the worker that runs this call."""
+    return {'pid': os.getpid(), **registry.status()}
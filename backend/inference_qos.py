@@ -0,0 +1,107 @@
+"""
+Quality-of-service degrade mode for overload.
+
+Queue pressure is the number of images waiting for inference, as a fraction
+of `inference_queue_depth`. When it crosses the entry threshold of the next
+tier, counting degrades at once, one tier per threshold:
+
+- 'full': the configured model at the normal input size.
+- 'reduced': the same model at `inference_qos_reduced_size`.
+- 'quantized': the int8 backend at `inference_qos_quantized_size`, below the
+  reduced size, so the step saves compute even where int8 falls back to torch.
+- 'estimate': the NumPy estimator, with no model at all.
+
+Quality goes back up one tier per `hold_s` seconds that the pressure has
+stayed below half of the current tier's entry threshold. The hold counts from
+the last time the pressure was seen above that exit level, so a node that went
+idle after a burst recovers on its next request instead of starting the hold
+then. The pressure is sampled on every request and again when its count
+completes, so the drain itself is seen. The gap between the entry and exit
+levels, plus the hold time, keeps the tier from flapping while the queue
+hovers around a threshold.
+"""
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from config import settings
+
+FULL = "full"
+
+
+
+def tier_model(tier: str) -> Tuple[Tuple[int, int], Optional[str]]:
+    """(model input size, backend override) of a QoS tier that runs the model."""
+    if tier == "reduced":
+        side = settings.inference_qos_reduced_size
+        return (side, side), None
+    if tier == "quantized":
+        # Smaller than 'reduced' as well: the step stays cheaper when the int8 build falls back to torch
+        side = min(settings.inference_qos_quantized_size, settings.inference_qos_reduced_size)
+        return (side, side), settings.inference_qos_quantized_backend
+    return (settings.inference_input_size, settings.inference_input_size), None
+
+
+class QosController:
+    def __init__(self, tiers: Sequence[str] = ("reduced", "quantized", "estimate"),
+                 thresholds: Sequence[float] = (0.5, 0.75, 0.9), exit_ratio: float = 0.5,
+                 hold_s: float = 5.0, enabled: bool = True):
+        if len(thresholds) < len(tiers):
+            raise ValueError("QoS needs one entry threshold per degrade tier")
+        self.tiers = (FULL,) + tuple(tiers)
+        self.thresholds = tuple(thresholds[:len(tiers)])
+        self.exit_ratio = exit_ratio
+        self.hold_s = hold_s
+        self.enabled = enabled
+        self.level = 0
+        self.pressure = 0.0
+        self._busy_at = 0.0  # last time the pressure was at or above the current tier's exit level
+        self.transitions = 0
+        self.served = {tier: 0 for tier in self.tiers}
+
+    @property
+    def tier(self) -> str:
+        return self.tiers[self.level]
+
+    def update(self, pressure: float, now: Optional[float] = None) -> str:
+        """Feed the current queue pressure (0..1+); returns the tier to serve with."""
+        if not self.enabled:
+            return FULL
+        now = time.monotonic() if now is None else now
+        self.pressure = pressure
+        target = sum(1 for t in self.thresholds if pressure >= t)
+        if target > self.level:
+            self.level = target
+            self.transitions += 1
+            self._busy_at = now
+            print(f"⚠️  Inference overloaded (queue {pressure:.0%}); QoS tier {self.tier}")
+        elif self.level > 0 and pressure < self.thresholds[self.level - 1] * self.exit_ratio:
+            while self.level > 0 and now - self._busy_at >= self.hold_s:
+                self.level -= 1
+                self.transitions += 1
+                self._busy_at += self.hold_s
+                print(f"✓ Inference queue draining; QoS tier {self.tier}")
+        else:
+            self._busy_at = now
+        return self.tier
+
+    def record(self, tier: str):
+        self.served[tier] = self.served.get(tier, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "tier": self.tier,
+            "pressure": round(self.pressure, 3),
+            "thresholds": dict(zip(self.tiers[1:], self.thresholds)),
+            "hold_s": self.hold_s,
+            "transitions": self.transitions,
+            "served": dict(self.served),
+        }
+
+
+qos = QosController(
+    tiers=settings.inference_qos_tiers,
+    thresholds=settings.inference_qos_thresholds,
+    hold_s=settings.inference_qos_hold_s,
+    enabled=settings.inference_qos,
+)
@@ -0,0 +1,172 @@
+"""
+Adaptive per-zone frame scheduling.
+
+Every zone (one camera or frame source, within its event and area) gets an
+inference interval from its latest density level: frequent for
+Risky/Overcrowded, rare for Safe. The interval is shortened further while the
+zone's density is rising, in proportion to its recent rate of change. The sum
+of the requested rates of all active zones is held to a per-node frame budget.
+When it is over budget, the calm zones are slowed down first and the busy ones
+only if that is not enough.
+
+The count endpoint returns the advice (`next_frame_in_s`). Frames that arrive
+well before their zone is due are not counted again: the zone's last result is
+reused, which is how the budget is enforced against clients that ignore the
+advice.
+"""
+import time
+from typing import Any, Dict, Optional
+
+from config import settings
+
+LEVELS = ("Safe", "Moderate", "Risky", "Overcrowded")
+PRIORITY_LEVELS = ("Risky", "Overcrowded")
+
+
+def source_zone_key(event_id: Optional[str], area_name: Optional[str], source_id: Optional[str]) -> Optional[str]:
+    """Scheduler key of one source's view; None without a source, which cannot be told apart from others.
+
+    Two cameras on the same area, or one area name reused by two events, are
+    separate zones: each frame may only be answered with its own source's count.
+    """
+    if not source_id:
+        return None
+    return f"{event_id or '-'}:{area_name or source_id}:{source_id}"
+
+
+class _Zone:
+    __slots__ = ("level", "value", "seen_at", "counted_at", "trend", "result", "frames", "throttled")
+
+    def __init__(self):
+        self.level = None
+        self.value = None  # people/m² when the area is known, else the raw count
+        self.seen_at = 0.0
+        self.counted_at = 0.0
+        self.trend = 0.0  # EMA of the relative change per minute
+        self.result = None
+        self.frames = 0
+        self.throttled = 0
+
+
+class ZoneScheduler:
+    def __init__(self, intervals: Dict[str, float], budget_fps: float = 20.0,
+                 min_interval_s: float = 0.5, max_interval_s: float = 60.0,
+                 trend_gain: float = 2.0, trend_alpha: float = 0.5, early_slack: float = 0.2):
+        self.intervals = dict(intervals)
+        self.budget_fps = budget_fps
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max_interval_s
+        self.trend_gain = trend_gain
+        self.trend_alpha = trend_alpha
+        self.early_slack = early_slack
+        self._zones: Dict[str, _Zone] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_fps > 0
+
+    def _base_interval(self, zone: _Zone) -> float:
+        base = self.intervals.get(zone.level or "Moderate", self.intervals.get("Moderate", 10.0))
+        if zone.trend > 0:
+            # Rising: e.g. +50%/min with gain 2 halves the interval
+            base /= 1.0 + self.trend_gain * zone.trend
+        return min(self.max_interval_s, max(self.min_interval_s, base))
+
+    def _active(self, now: float):
+        horizon = 2 * self.max_interval_s
+        return {k: z for k, z in self._zones.items() if now - z.seen_at <= horizon}
+
+    def _budget_factors(self, zones: Dict[str, _Zone]):
+        """Interval multipliers (priority, routine) that keep the node within budget."""
+        hi = sum(1.0 / self._base_interval(z) for z in zones.values() if z.level in PRIORITY_LEVELS)
+        lo = sum(1.0 / self._base_interval(z) for z in zones.values() if z.level not in PRIORITY_LEVELS)
+        budget = self.budget_fps
+        if hi + lo <= budget:
+            return 1.0, 1.0
+        if hi < budget:
+            return 1.0, lo / (budget - hi)
+        # Busy zones alone exceed the budget: routine zones drop to the slowest rate
+        return hi / budget, float("inf")
+
+    def interval(self, key: str, now: Optional[float] = None) -> float:
+        """Seconds until the zone should send its next frame (budget applied)."""
+        now = time.time() if now is None else now
+        zone = self._zones.get(key)
+        if zone is None:
+            return self.min_interval_s
+        hi_factor, lo_factor = self._budget_factors(self._active(now))
+        factor = hi_factor if zone.level in PRIORITY_LEVELS else lo_factor
+        return min(self.max_interval_s, self._base_interval(zone) * factor)
+
+    def early_result(self, key: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """The zone's last result if this frame arrived well before the zone was due."""
+        now = time.time() if now is None else now
+        zone = self._zones.get(key)
+        if zone is None or zone.result is None:
+            return None
+        zone.frames += 1
+        zone.seen_at = now
+        due_in = zone.counted_at + self.interval(key, now) - now
+        if due_in > self.early_slack * self.interval(key, now):
+            zone.throttled += 1
+            return zone.result
+        return None
+
+    def observe(self, key: str, result: Dict[str, Any], value: Optional[float],
+                level: Optional[str], now: Optional[float] = None):
+        """Record a freshly counted frame for the zone."""
+        now = time.time() if now is None else now
+        zone = self._zones.get(key)
+        if zone is None:
+            zone = self._zones[key] = _Zone()
+            zone.frames += 1
+        if value is not None and zone.value is not None and now > zone.counted_at:
+            per_min = (value - zone.value) / max(abs(zone.value), 1e-3) * 60.0 / (now - zone.counted_at)
+            zone.trend += self.trend_alpha * (per_min - zone.trend)
+        zone.value = value
+        zone.level = level or zone.level
+        zone.result = result
+        zone.counted_at = zone.seen_at = now
+
+    def level(self, key: str) -> Optional[str]:
+        """The zone's latest density level, if it has been counted."""
+        zone = self._zones.get(key)
+        return zone.level if zone else None
+
+    def is_priority(self, key: Optional[str]) -> bool:
+        return key is not None and self.level(key) in PRIORITY_LEVELS
+
+    def advice(self, key: str, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        zone = self._zones.get(key)
+        interval = self.interval(key, now)
+        counted_at = zone.counted_at if zone else now
+        return {
+            "zone": key,
+            "level": zone.level if zone else None,
+            "trend_per_min": round(zone.trend, 3) if zone else 0.0,
+            "interval_s": round(interval, 2),
+            "next_frame_in_s": round(max(0.0, counted_at + interval - now), 2),
+        }
+
+    def stats(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        active = self._active(now)
+        demand = sum(1.0 / self.interval(k, now) for k in active)
+        return {
+            "enabled": self.enabled,
+            "budget_fps": self.budget_fps,
+            "scheduled_fps": round(demand, 3),
+            "zones": {
+                k: {**self.advice(k, now), "frames": z.frames, "throttled": z.throttled}
+                for k, z in active.items()
+            },
+        }
+
+
+zone_scheduler = ZoneScheduler(
+    settings.inference_schedule_intervals,
+    budget_fps=settings.inference_budget_fps,
+    min_interval_s=settings.inference_schedule_min_interval_s,
+    max_interval_s=settings.inference_schedule_max_interval_s,
+)
@@ -11,16 +11,28 @@ See README_NOTE.md for a short notebook cell you can paste to install deps and r
 from __future__ import annotations
 import os
 import sys
+import importlib
+import io
 import json
 import csv
+import tempfile
+import contextlib
+import tarfile
+import zipfile
 import math
 import random
+import time
+import warnings
 from pathlib import Path
-from typing import List, Tuple, Optional, Any, Dict
+from typing import List, Tuple, Optional, Any, Dict, Union, BinaryIO, Iterator
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+ARCHIVE_EXTS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
 
 def _safe_import(name: str):
     try:
-        module = __import__(name)
+        # import_module returns the submodule itself (e.g. PIL.Image), not the top-level package
+        module = importlib.import_module(name)
         return module
     except Exception:
         return None
@@ -29,7 +41,6 @@ torch = _safe_import('torch')
 np = _safe_import('numpy')
 Image = _safe_import('PIL.Image')
 cv2 = _safe_import('cv2')
-plt = _safe_import('matplotlib.pyplot')
 transforms = None
 if torch:
     try:
@@ -127,7 +138,6 @@ def find_image_paths(repo_sample_dir: str = './data/sample_images') -> Tuple[Lis
         candidates.append('./samplecrowd')
     candidates.append(repo_sample_dir)
 
-    image_exts = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
     found = []
     used_source = ''
     for cand in candidates:
@@ -138,7 +148,7 @@ def find_image_paths(repo_sample_dir: str = './data/sample_images') -> Tuple[Lis
         # walk and collect images
         for root, _, files in os.walk(cand):
             for f in files:
-                if f.lower().endswith(image_exts):
+                if f.lower().endswith(IMAGE_EXTS):
                     found.append(os.path.join(root, f))
         if found:
             used_source = cand
@@ -154,9 +164,12 @@ def find_image_paths(repo_sample_dir: str = './data/sample_images') -> Tuple[Lis
     found.sort()
     return found, used_source
 
-def load_model(model_path: str, device: Optional[str] = None) -> Optional[Any]:
+def load_model(model_path: str, device: Optional[str] = None, mmap: bool = False) -> Optional[Any]:
     """Attempt to load a model via torch.jit.load or torch.load.
 
+    With `mmap`, CPU checkpoints loaded through torch.load keep their tensor
+    storage memory-mapped from the file, so every process that loads the same
+    file shares its pages (TorchScript files are always read into memory).
     Returns loaded model or None if not available.
     """
     if torch is None:
@@ -178,7 +191,14 @@ def load_model(model_path: str, device: Optional[str] = None) -> Optional[Any]:
     except Exception:
         try:
             # Fall back to state_dict or normal model file
-            model = torch.load(model_path, map_location=device)
+            if mmap and device == 'cpu':
+                try:
+                    model = torch.load(model_path, map_location=device, mmap=True)
+                except TypeError:
+                    # torch < 2.1 has no mmap loading
+                    model = torch.load(model_path, map_location=device)
+            else:
+                model = torch.load(model_path, map_location=device)
             print(f"Loaded model via torch.load from {model_path}")
             # If a state_dict was returned, the notebook author must provide model architecture.
             if isinstance(model, dict) and 'state_dict' in model:
@@ -196,35 +216,426 @@ def load_model(model_path: str, device: Optional[str] = None) -> Optional[Any]:
         pass
     return model
 
-def _preprocess_pil(img, target_size=(512, 512)):
-    """Preprocess PIL image to tensor matching common models."""
-    if transforms is None:
-        # minimal numpy fallback
+# ---------------------------------------------------------------------------
+# Inference backends: optimized artifacts built from the same weights file
+# ---------------------------------------------------------------------------
+INFERENCE_BACKENDS = ('torch', 'int8', 'torchscript', 'onnx')
+_ARTIFACT_SUFFIX = {'int8': '.int8-static.pt', 'torchscript': '.frozen.pt', 'onnx': '.onnx'}
+
+class OnnxRuntimeModel:
+    """Wrap an onnxruntime session so it is called like a torch model."""
+
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        arr = batch.detach().cpu().numpy() if hasattr(batch, 'detach') else np.asarray(batch)
+        out = self.session.run(None, {self.input_name: arr.astype('float32')})[0]
+        return torch.from_numpy(out) if torch is not None else out
+
+    def eval(self):
+        return self
+
+def artifact_path(model_path: str, backend: str) -> str:
+    """Where the optimized artifact for `backend` lives, next to the weights."""
+    root, _ = os.path.splitext(model_path)
+    return root + _ARTIFACT_SUFFIX[backend]
+
+def _calibration_batches(input_size: int, limit: int = 8) -> List[Any]:
+    """Up to `limit` sample images (samplecrowd), preprocessed, for int8 calibration."""
+    paths, _ = find_image_paths()
+    return [preprocess_image(p, target_size=(input_size, input_size)).unsqueeze(0) for p in paths[:limit]]
+
+def _quantize_int8(model: Any, example: Any, calibration: List[Any]) -> Any:
+    """Static post-training int8 quantization (FX graph mode): weights and
+    activations of Conv/Linear layers, with activation ranges observed on
+    `calibration` batches."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if not any(isinstance(m, (torch.nn.Conv2d, torch.nn.Linear)) for m in model.modules()):
+        raise RuntimeError('int8 quantization found no Conv2d/Linear layers; the model would stay fp32')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        prepared = prepare_fx(model.cpu().eval(), get_default_qconfig_mapping(torch.backends.quantized.engine), (example,))
+        with torch.no_grad():
+            for batch in calibration:
+                prepared(batch)
+            traced = torch.jit.freeze(torch.jit.trace(convert_fx(prepared), example, check_trace=False).eval())
+    if not any(node.kind().startswith('quantized::') for node in traced.graph.nodes()):
+        raise RuntimeError('int8 quantization produced no quantized operators; the model would stay fp32')
+    return traced
+
+def build_backend(model: Any, backend: str, input_size: int = 512, calibration: Optional[List[Any]] = None) -> Any:
+    """Return the serializable optimized artifact of an fp32 model for `backend`.
+
+    'int8': static int8 quantization of Conv/Linear layers, calibrated on
+    `calibration` (N,C,H,W) batches (default: samplecrowd images), traced and
+    frozen to TorchScript. Models it would leave in fp32 are rejected.
+    'torchscript': frozen TorchScript graph.
+    """
+    example = torch.randn(1, 3, input_size, input_size)
+    if backend == 'int8':
+        if isinstance(model, torch.jit.ScriptModule):
+            raise RuntimeError('int8 quantization needs an eager nn.Module, not TorchScript weights')
+        return _quantize_int8(model, example, calibration if calibration is not None else _calibration_batches(input_size))
+    if backend == 'torchscript':
+        # Frozen graph only: optimize_for_inference output does not always
+        # survive save/load, so load_backend applies it after loading.
+        with torch.no_grad():
+            scripted = model if isinstance(model, torch.jit.ScriptModule) else torch.jit.trace(model, example, check_trace=False)
+            return torch.jit.freeze(scripted.eval())
+    raise ValueError(f'Unknown backend {backend!r}; expected one of {INFERENCE_BACKENDS}')
+
+def export_onnx(model: Any, path: str, input_size: int = 512):
+    """Export an fp32 model to ONNX with dynamic batch and spatial axes."""
+    example = torch.randn(1, 3, input_size, input_size)
+    torch.onnx.export(
+        model.cpu().eval(), example, path,
+        input_names=['input'], output_names=['density'],
+        dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'},
+                      'density': {0: 'batch'}},
+        dynamo=False,
+    )
+
+@contextlib.contextmanager
+def _atomic_artifact(path: str):
+    """Yield a temp path next to `path` and move it into place once written.
+
+    Worker processes that build the same artifact at once each replace it
+    whole, so none of them loads a half-written file.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def load_backend(model_path: str, backend: str = 'torch', device: Optional[str] = None,
+                 input_size: int = 512) -> Optional[Any]:
+    """Load `model_path` through the selected inference backend.
+
+    Non-'torch' backends use a cached artifact next to the weights (see
+    `artifact_path`), rebuilt from the fp32 weights whenever those are newer.
+    Optimized backends run on CPU.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f'Unknown backend {backend!r}; expected one of {INFERENCE_BACKENDS}')
+    if backend == 'torch':
+        return load_model(model_path, device=device)
+    if torch is None or not model_path or not os.path.isfile(model_path):
+        return None
+
+    artifact = artifact_path(model_path, backend)
+    fresh = os.path.isfile(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(model_path)
+    if backend == 'onnx':
+        ort = _safe_import('onnxruntime')
+        if ort is None:
+            raise RuntimeError("onnxruntime is not installed - install with 'pip install onnxruntime'")
+        if not fresh:
+            with _atomic_artifact(artifact) as tmp:
+                export_onnx(load_model(model_path, device='cpu'), tmp, input_size)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return OnnxRuntimeModel(ort.InferenceSession(artifact, opts, providers=['CPUExecutionProvider']))
+
+    if fresh:
+        model = torch.jit.load(artifact, map_location='cpu')
+    else:
+        base = load_model(model_path, device='cpu')
+        if base is None:
+            return None
+        model = build_backend(base, backend, input_size)
+        try:
+            with _atomic_artifact(artifact) as tmp:
+                torch.jit.save(model, tmp)
+        except Exception as e:
+            print(f"Could not cache {backend} artifact at {artifact}: {e}")
+    if backend == 'torchscript':
+        model = torch.jit.optimize_for_inference(model)
+    print(f"Loaded {backend} backend for {model_path}")
+    return model.eval()
+
+def compare_backends(model_path: str, image_paths: List[str], backends=INFERENCE_BACKENDS,
+                     target_size=(512, 512), batch_size: int = 1, repeats: int = 3) -> List[Dict[str, Any]]:
+    """Latency and count drift of each backend relative to the fp32 'torch' baseline.
+
+    Every backend counts the same preprocessed images; drift is the mean and
+    max absolute difference from the baseline counts.
+    """
+    tensors = [preprocess_image(p, target_size=target_size) for p in image_paths]
+    batches = [tensors[i:i + batch_size] for i in range(0, len(tensors), batch_size)]
+    rows, baseline = [], None
+    for backend in ['torch'] + [b for b in backends if b != 'torch']:
+        row: Dict[str, Any] = {'backend': backend}
+        try:
+            model = load_backend(model_path, backend, device='cpu', input_size=target_size[0])
+            if model is None:
+                raise RuntimeError('model not available')
+            for batch in batches[:1]:
+                infer_batch(model, batch)  # warm-up
+            timings, counts = [], []
+            for r in range(repeats):
+                for batch in batches:
+                    started = time.perf_counter()
+                    out = infer_batch(model, batch)
+                    timings.append((time.perf_counter() - started) * 1000.0 / len(batch))
+                    if r == 0:
+                        counts.extend(c for c, _ in out)
+            timings.sort()
+            row.update({
+                'ms_per_image_p50': round(timings[len(timings) // 2], 3),
+                'ms_per_image_mean': round(sum(timings) / len(timings), 3),
+                'counts': [round(c, 2) for c in counts],
+            })
+            if backend == 'torch':
+                baseline = row
+            elif baseline is not None:
+                drift = [abs(a - b) for a, b in zip(counts, baseline['counts'])]
+                row['count_drift_mean'] = round(sum(drift) / len(drift), 3)
+                row['count_drift_max'] = round(max(drift), 3)
+                row['speedup'] = round(baseline['ms_per_image_mean'] / row['ms_per_image_mean'], 3)
+        except Exception as e:
+            row['error'] = str(e)
+        rows.append(row)
+    return rows
+
+# ImageNet statistics the counting models were trained with
+_MEAN = (0.485, 0.456, 0.406)
+_STD = (0.229, 0.224, 0.225)
+
+class _Preprocessor:
+    """Resize + ToTensor + Normalize for one target size, built once and reused.
+
+    Normalization is a per-channel 256-entry lookup table (uint8 -> normalized
+    float32) applied with `np.take` straight into the output buffer, so there
+    are no intermediate float arrays.
+    """
+
+    def __init__(self, target_size: Optional[Tuple[int, int]]):
         if np is None:
-            raise RuntimeError('Neither torchvision.transforms nor numpy available for preprocessing')
-        arr = np.array(img.resize(target_size))
-        # convert to CHW normalized 0-1
-        arr = arr.astype('float32') / 255.0
-        arr = np.transpose(arr, (2,0,1))
-        return torch.from_numpy(arr)
-
-    t = transforms.Compose([
-        transforms.Resize(target_size),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                             std=[0.229, 0.224, 0.225])
-    ])
-    return t(img)
+            raise RuntimeError('numpy is required for preprocessing')
+        # (height, width), as torchvision's Resize takes it
+        self.target_size = tuple(target_size) if target_size else None
+        levels = np.arange(256, dtype=np.float32) / 255.0
+        self.lut = np.stack([(levels - m) / s for m, s in zip(_MEAN, _STD)]).astype(np.float32)
 
-def preprocess_image(image_path: str, target_size=(512,512)):
-    """Load image and return a tensor (C,H,W) on CPU. Caller moves to device/batch.
+    def __call__(self, img, out=None):
+        if self.target_size:
+            h, w = self.target_size
+            if img.size != (w, h):
+                img = img.resize((w, h), Image.BILINEAR)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        arr = np.asarray(img)
+        if out is None:
+            out = np.empty((3,) + arr.shape[:2], dtype=np.float32)
+        for c in range(3):
+            np.take(self.lut[c], arr[:, :, c], out=out[c])
+        return torch.from_numpy(out) if torch is not None else out
+
+_PREPROCESSORS: Dict[Any, _Preprocessor] = {}
+
+def get_preprocessor(target_size=(512, 512)) -> _Preprocessor:
+    """Cached preprocessing pipeline for `target_size` ((h, w) or None)."""
+    key = tuple(target_size) if target_size else None
+    pre = _PREPROCESSORS.get(key)
+    if pre is None:
+        pre = _PREPROCESSORS.setdefault(key, _Preprocessor(key))
+    return pre
+
+def _preprocess_pil(img, target_size=(512, 512)):
+    """Preprocess PIL image to tensor matching common models.
+
+    `target_size=None` keeps the image's own size (used for tiles).
+    """
+    return get_preprocessor(target_size)(img)
+
+ImageSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+class _MemoryReader(io.RawIOBase):
+    """Seekable read-only file object over a buffer, without copying it."""
+
+    def __init__(self, buf):
+        super().__init__()
+        self._view = memoryview(buf).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+def _as_file(source: ImageSource):
+    """Return something `Image.open` can read: a path or a seekable file object."""
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    if isinstance(source, bytes):
+        # BytesIO shares the bytes object's buffer until written to
+        return io.BytesIO(source)
+    if isinstance(source, (bytearray, memoryview)):
+        return _MemoryReader(source)
+    if hasattr(source, 'read'):
+        try:
+            source.seek(0)
+        except Exception:
+            pass
+        return source
+    raise TypeError(f'Unsupported image source type: {type(source).__name__}')
+
+def open_image(source: ImageSource, min_size: Optional[Tuple[int, int]] = None):
+    """Decode an image from a path, bytes, memoryview or file-like object into RGB PIL.
+
+    Already-decoded PIL images (e.g. video frames) are passed through. With
+    `min_size=(w, h)`, JPEGs are decoded at the smallest DCT scale (1/2, 1/4
+    or 1/8) that is still at least that large, which skips most of the
+    decode work for phone photos that are about to be shrunk anyway.
     """
     if Image is None:
         raise RuntimeError('Pillow is required to read images')
-    pil = Image.open(image_path).convert('RGB')
+    if isinstance(source, Image.Image):
+        return source if source.mode == 'RGB' else source.convert('RGB')
+    img = Image.open(_as_file(source))
+    if min_size and img.format == 'JPEG':
+        img.draft('RGB', tuple(min_size))
+    return img.convert('RGB')
+
+@contextlib.contextmanager
+def image_path_for(source: ImageSource, suffix: str = '.jpg') -> Iterator[str]:
+    """Yield a filesystem path for `source`, writing a temp file only if it is in memory.
+
+    For backends (e.g. LWCC) that strictly need a path; the temp file is
+    removed on exit.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source)
+        return
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            if Image is not None and isinstance(source, Image.Image):
+                source.convert('RGB').save(fh, format='JPEG', quality=95)
+            elif hasattr(source, 'read'):
+                source.seek(0)
+                fh.write(source.read())
+            else:
+                fh.write(source)
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def is_archive(filename: str, data: bytes) -> bool:
+    """True if an upload is a zip/tar archive (by extension or zip signature)."""
+    name = (filename or '').lower()
+    return name.endswith(ARCHIVE_EXTS) or data[:4] == b'PK\x03\x04'
+
+def iter_archive_images(data: bytes, max_files: Optional[int] = None, max_member_bytes: Optional[int] = None,
+                        max_total_bytes: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+    """Yield (name, bytes) for each image in a zip or tar(.gz/.bz2/.xz) archive.
+
+    Members are read one at a time, in archive order. Raises ValueError if the
+    archive holds more than `max_files` images, if one image decompresses to
+    more than `max_member_bytes`, or if the images together exceed
+    `max_total_bytes` (zip/tar bombs). The declared sizes are enough: zipfile
+    never returns more than a member's declared size (a member that lies
+    about it fails its CRC check), and tar stores members uncompressed.
+    """
+    n = 0
+    total = 0
+
+    def _check(name, size):
+        nonlocal n, total
+        n += 1
+        if max_files is not None and n > max_files:
+            raise ValueError(f'archive contains more than {max_files} images')
+        if max_member_bytes is not None and size > max_member_bytes:
+            raise ValueError(f'{name} is larger than {max_member_bytes} bytes uncompressed')
+        total += size
+        if max_total_bytes is not None and total > max_total_bytes:
+            raise ValueError(f'archive images exceed {max_total_bytes} bytes uncompressed')
+
+    buf = io.BytesIO(data)
+    if zipfile.is_zipfile(buf):
+        with zipfile.ZipFile(buf) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTS):
+                    continue
+                _check(info.filename, info.file_size)
+                yield info.filename, zf.read(info)
+        return
+
+    buf.seek(0)
+    with tarfile.open(fileobj=buf, mode='r:*') as tf:
+        for member in tf:
+            if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTS):
+                continue
+            _check(member.name, member.size)
+            fh = tf.extractfile(member)
+            if fh is not None:
+                yield member.name, fh.read()
+
+def preprocess_image(image_path: ImageSource, target_size=(512,512)):
+    """Load image and return a tensor (C,H,W) on CPU. Caller moves to device/batch.
+
+    `image_path` may also be in-memory data (bytes, memoryview, file-like),
+    or an already preprocessed (C,H,W) tensor (e.g. a shared-memory slot),
+    which is only resized if it is not `target_size` already.
+    """
+    if torch is not None and isinstance(image_path, torch.Tensor):
+        if not target_size or tuple(image_path.shape[-2:]) == tuple(target_size):
+            return image_path
+        return torch.nn.functional.interpolate(image_path[None], size=tuple(target_size), mode='bilinear',
+                                               align_corners=False, antialias=True)[0]
+    min_size = (target_size[1], target_size[0]) if target_size else None
+    pil = open_image(image_path, min_size=min_size)
     tensor = _preprocess_pil(pil, target_size=target_size)
     return tensor
 
+def _output_to_count(out0: Any) -> float:
+    """Convert one model output (density map or scalar) to a numeric count."""
+    try:
+        if hasattr(out0, 'detach'):
+            arr = out0.detach().cpu().numpy()
+        else:
+            arr = np.array(out0)
+        if arr.ndim >= 2:
+            return float(arr.sum())
+        return float(arr.mean())
+    except Exception:
+        # Fallback: try float conversion
+        try:
+            return float(out0)
+        except Exception:
+            return 0.0
+
 def infer_image(model: Any, tensor: Any, device: str = 'cpu') -> Tuple[float, Optional[Any]]:
     """Run model on a single tensor (C,H,W) or (1,C,H,W). Returns (count, raw_output).
     """
@@ -238,70 +649,480 @@ def infer_image(model: Any, tensor: Any, device: str = 'cpu') -> Tuple[float, Op
     with torch.no_grad():
         out = model(t)
     # Convert output to numeric count: sum if map-like, else flatten
-    try:
-        if isinstance(out, (list, tuple)):
-            out0 = out[0]
-        else:
-            out0 = out
-        if hasattr(out0, 'detach'):
-            arr = out0.detach().cpu().numpy()
-        else:
-            arr = np.array(out0)
-        if arr.ndim >= 2:
-            count = float(arr.sum())
-        else:
-            count = float(arr.mean())
-    except Exception:
-        # Fallback: try float conversion
-        try:
-            count = float(out)
-        except Exception:
-            count = 0.0
+    if isinstance(out, (list, tuple)):
+        out0 = out[0]
+    else:
+        out0 = out
+    count = _output_to_count(out0)
     return count, out
 
-def visualize_and_save(image_path: str, output_any: Any, count: float, outputs_dir: str = './outputs'):
-    """Save overlay/heatmap and write CSV/JSON entries for the prediction.
+def infer_batch(model: Any, tensors: List[Any], device: str = 'cpu') -> List[Tuple[float, Optional[Any]]]:
+    """Run model once on a list of same-sized (C,H,W) tensors.
+
+    Returns one (count, raw_output) pair per input, where raw_output is that
+    image's slice of the batched output.
     """
-    os.makedirs(outputs_dir, exist_ok=True)
-    base = os.path.splitext(os.path.basename(image_path))[0]
-    img_out_path = os.path.join(outputs_dir, f"{base}_pred.png")
-    json_out_path = os.path.join(outputs_dir, f"{base}_pred.json")
-    csv_out_path = os.path.join(outputs_dir, "predictions.csv")
+    if model is None:
+        raise RuntimeError('Model is not loaded')
+    if torch is None:
+        raise RuntimeError('torch is required for inference')
+    if not tensors:
+        return []
 
-    # Load original image
-    if Image is None:
-        return
-    pil = Image.open(image_path).convert('RGB')
-    # Make a simple matplotlib figure with image and title
-    if plt:
-        fig = plt.figure(figsize=(8,6))
-        ax = fig.add_subplot(1,1,1)
-        ax.imshow(pil)
-        ax.set_title(f"Predicted: {int(round(count))} people")
-        ax.axis('off')
-        try:
-            fig.savefig(img_out_path, bbox_inches='tight')
-        except Exception:
-            pil.save(img_out_path)
+    batch = torch.stack(list(tensors)).to(device)
+    with torch.no_grad():
+        out = model(batch)
+    if isinstance(out, (list, tuple)):
+        out = out[0]
+
+    results = []
+    for i in range(len(tensors)):
         try:
-            plt.close(fig)
+            out_i = out[i]
         except Exception:
-            pass
+            out_i = out
+        results.append((_output_to_count(out_i), out_i))
+    return results
+
+def _tile_starts(length: int, tile: int, stride: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)  # last tile flush with the edge
+    return starts
+
+def plan_tiles(width: int, height: int, tile_size: int = 512, overlap: int = 64) -> List[Tuple[int, int, int, int]]:
+    """Overlapping (x0, y0, x1, y1) tiles covering a width x height image.
+
+    All tiles have the same size (so they can be stacked into one batch):
+    `tile_size` square, or the whole dimension if the image is smaller.
+    """
+    tw, th = min(tile_size, width), min(tile_size, height)
+    stride = max(1, tile_size - overlap)
+    return [(x, y, x + tw, y + th)
+            for y in _tile_starts(height, th, stride)
+            for x in _tile_starts(width, tw, stride)]
+
+def count_tiled(model: Any, image: ImageSource, tile_size: int = 512, overlap: int = 64,
+                max_pixels: int = 16_000_000, device: str = 'cpu') -> Dict[str, Any]:
+    """Count a large image by running overlapping native-resolution tiles as one batch.
+
+    Images above `max_pixels` are first downscaled to fit that budget. Each
+    tile's density map is pasted into a full-image canvas and divided by how
+    many tiles covered each cell, so people in overlap regions are counted
+    once. Returns the count, the stitched density map and tile timings.
+    """
+    if model is None:
+        raise RuntimeError('Model is not loaded')
+    pil = open_image(image)
+    width, height = pil.size
+    scale = 1.0
+    if max_pixels and width * height > max_pixels:
+        scale = math.sqrt(max_pixels / float(width * height))
+        width, height = max(1, int(width * scale)), max(1, int(height * scale))
+        pil = pil.resize((width, height), Image.BILINEAR)
+
+    started = time.perf_counter()
+    tiles = plan_tiles(width, height, tile_size, overlap)
+    tensors = [_preprocess_pil(pil.crop(box), target_size=None) for box in tiles]
+    outputs = infer_batch(model, tensors, device=device)
+
+    maps = []
+    for (c, out), (x0, y0, x1, y1) in zip(outputs, tiles):
+        arr = density_to_2d(out)
+        if arr is None:
+            # Scalar-per-image model: spread the count evenly over an 8x-downsampled tile
+            h, w = max(1, (y1 - y0) // 8), max(1, (x1 - x0) // 8)
+            arr = np.full((h, w), c / float(h * w), dtype=np.float32)
+        maps.append(arr)
+
+    # Output-map cells per input pixel (density models usually downsample)
+    fy = maps[0].shape[0] / float(tiles[0][3] - tiles[0][1])
+    fx = maps[0].shape[1] / float(tiles[0][2] - tiles[0][0])
+    canvas = np.zeros((max(1, int(round(height * fy))), max(1, int(round(width * fx)))), dtype=np.float32)
+    coverage = np.zeros_like(canvas)
+    for arr, (x0, y0, _, _) in zip(maps, tiles):
+        oy = min(int(round(y0 * fy)), canvas.shape[0] - arr.shape[0])
+        ox = min(int(round(x0 * fx)), canvas.shape[1] - arr.shape[1])
+        canvas[oy:oy + arr.shape[0], ox:ox + arr.shape[1]] += arr
+        coverage[oy:oy + arr.shape[0], ox:ox + arr.shape[1]] += 1.0
+    density = canvas / np.maximum(coverage, 1.0)
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+    return {
+        'count': float(density.sum()),
+        'density_map': density,
+        'tiles': len(tiles),
+        'tile_size': [tiles[0][2] - tiles[0][0], tiles[0][3] - tiles[0][1]],
+        'overlap': overlap,
+        'scale': round(scale, 4),
+        'total_ms': round(elapsed_ms, 2),
+        'ms_per_tile': round(elapsed_ms / len(tiles), 2),
+    }
+
+def estimate_count_heuristic(image: ImageSource) -> int:
+    """Very rough people estimate from skin-tone-like pixels (NumPy only).
+
+    Used when neither the torch model nor LWCC is available. This is an
+    approximation, not crowd counting.
+    """
+    if Image is None or np is None:
+        raise ImportError("Missing PIL or NumPy - install with 'pip install Pillow numpy'")
+
+    img_array = np.asarray(open_image(image))
+    height, width = img_array.shape[:2]
+
+    # Simple heuristic: detect regions with skin-tone-like colors
+    lower_skin = np.array([80, 50, 50], dtype=np.uint8)
+    upper_skin = np.array([255, 200, 180], dtype=np.uint8)
+    skin_mask = np.all((img_array >= lower_skin) & (img_array <= upper_skin), axis=2)
+    skin_pixel_count = int(np.sum(skin_mask))
+
+    # Estimate: assume average person occupies ~3000 skin-like pixels
+    total_pixels = height * width
+    if total_pixels <= 0:
+        return 0
+    density_ratio = skin_pixel_count / total_pixels
+    estimated_count = max(1, int(density_ratio * total_pixels / 3000))
+    return min(estimated_count, 1000)  # Cap at reasonable maximum
+
+def density_to_2d(output_any: Any) -> Optional[Any]:
+    """Model output as a 2-D float32 density map (channels summed), or None for scalars."""
+    if output_any is None or np is None:
+        return None
+    arr = output_any.detach().float().cpu().numpy() if hasattr(output_any, 'detach') else np.asarray(output_any)
+    arr = np.asarray(arr, dtype=np.float32)
+    while arr.ndim > 2:
+        arr = arr.sum(axis=0)
+    return arr if arr.ndim == 2 else None
+
+def _heat_lut():
+    """256x3 uint8 blue -> cyan -> yellow -> red ramp (jet-like, NumPy only)."""
+    x = np.linspace(0.0, 1.0, 256, dtype=np.float32)
+    r = np.clip(1.5 - np.abs(4 * x - 3), 0, 1)
+    g = np.clip(1.5 - np.abs(4 * x - 2), 0, 1)
+    b = np.clip(1.5 - np.abs(4 * x - 1), 0, 1)
+    return (np.stack([r, g, b], axis=1) * 255).astype(np.uint8)
+
+_HEAT_LUT = None
+
+def render_overlay(image: Any, output_any: Any, count: float, alpha: float = 0.45):
+    """Draw the density heatmap over `image` with a count label; returns an RGB PIL image.
+
+    The density map is colorized with a lookup table and upscaled once with
+    Pillow; scalar outputs just get the label.
+    """
+    global _HEAT_LUT
+    from PIL import ImageDraw
+    pil = open_image(image)
+    density = density_to_2d(output_any)
+    if density is not None and density.size:
+        if _HEAT_LUT is None:
+            _HEAT_LUT = _heat_lut()
+        peak = float(density.max())
+        norm = density / peak if peak > 0 else np.zeros_like(density)
+        idx = np.clip(norm * 255, 0, 255).astype(np.uint8)
+        heat = Image.fromarray(_HEAT_LUT[idx]).resize(pil.size, Image.BILINEAR)
+        # Fade the heatmap out where there is no density so the scene stays visible
+        mask = Image.fromarray((np.sqrt(norm) * 255 * alpha).astype(np.uint8)).resize(pil.size, Image.BILINEAR)
+        pil = Image.composite(heat, pil, mask)
+    draw = ImageDraw.Draw(pil)
+    label = f"Predicted: {int(round(count))} people"
+    draw.rectangle((0, 0, 8 + 7 * len(label), 22), fill=(0, 0, 0))
+    draw.text((4, 5), label, fill=(255, 255, 255))
+    return pil
+
+class ResultsLog:
+    """Buffered, append-only results table written to CSV in chunks.
+
+    Rows are kept in memory and written `flush_every` at a time with a single
+    file open per chunk, instead of reopening the CSV for every image.
+    An existing CSV with a different header (e.g. the older
+    image/prediction_count/json_path layout) is renamed aside before the
+    first write, so rows are never appended under mismatched columns.
+    """
+
+    COLUMNS = ('image', 'prediction_count', 'overlay_path', 'error')
+
+    def __init__(self, outputs_dir: str = './outputs', filename: str = 'predictions.csv',
+                 flush_every: int = 256):
+        os.makedirs(outputs_dir, exist_ok=True)
+        self.path = os.path.join(outputs_dir, filename)
+        self.flush_every = max(1, flush_every)
+        self._rows: List[Tuple[Any, ...]] = []
+        self.rows_written = 0
+        self.rotated_to: Optional[str] = None
+        self._checked = False
+
+    def append(self, image: str, count: Optional[float], overlay_path: Optional[str] = None,
+               error: Optional[str] = None):
+        self._rows.append((image, int(round(count)) if count is not None else '', overlay_path or '', error or ''))
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def _rotate_mismatched(self):
+        """Move an existing CSV aside if its header is not COLUMNS."""
+        self._checked = True
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, newline='', encoding='utf-8') as cf:
+            header = next(csv.reader(cf), None)
+        if header is not None and tuple(header) == self.COLUMNS:
+            return
+        root, ext = os.path.splitext(self.path)
+        target = f"{root}.{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+        n = 1
+        while os.path.exists(target):
+            target = f"{root}.{time.strftime('%Y%m%d-%H%M%S')}-{n}{ext}"
+            n += 1
+        os.replace(self.path, target)
+        self.rotated_to = target
+        print(f"⚠️  {self.path} had columns {header}; moved it to {target}")
+
+    def flush(self):
+        if not self._rows:
+            return
+        if not self._checked:
+            self._rotate_mismatched()
+        write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, 'a', newline='', encoding='utf-8') as cf:
+            writer = csv.writer(cf)
+            if write_header:
+                writer.writerow(self.COLUMNS)
+            writer.writerows(self._rows)
+        self.rows_written += len(self._rows)
+        self._rows.clear()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def visualize_and_save(image_path: str, output_any: Any, count: float, outputs_dir: str = './outputs',
+                       image: Any = None, log: Optional[ResultsLog] = None, render: bool = True) -> Optional[str]:
+    """Save a heatmap overlay PNG and log the prediction; returns the overlay path.
+
+    Pass an already-decoded `image` to avoid reading the file again, and a
+    shared `log` to batch result rows; without one, a single row is appended
+    to `<outputs_dir>/predictions.csv`.
+    """
+    os.makedirs(outputs_dir, exist_ok=True)
+    img_out_path = None
+    if render and Image is not None:
+        base = os.path.splitext(os.path.basename(image_path))[0]
+        img_out_path = os.path.join(outputs_dir, f"{base}_pred.png")
+        # PNG compression level 1: several times faster than the default, slightly larger files
+        render_overlay(image if image is not None else image_path, output_any, count).save(
+            img_out_path, compress_level=1)
+    if log is not None:
+        log.append(image_path, count, img_out_path)
     else:
-        # Pillow fallback — just save original
-        pil.save(img_out_path)
+        with ResultsLog(outputs_dir, flush_every=1) as single:
+            single.append(image_path, count, img_out_path)
+    return img_out_path
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+def read_manifest(outputs_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Completed results recorded by `batch_inference_loop`, keyed by image path.
+
+    Later lines win, so an image that failed and was retried reports its
+    latest outcome. A truncated last line (run killed mid-write) is ignored.
+    """
+    done: Dict[str, Dict[str, Any]] = {}
+    path = os.path.join(outputs_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            done[entry['image']] = entry
+    return done
+
+def model_fingerprint(model: Any) -> str:
+    """Short hash of a model's class and weights, to tell runs of different weights apart."""
+    import hashlib
+
+    digest = hashlib.blake2b(type(model).__name__.encode(), digest_size=8)
+    try:
+        for name, tensor in model.state_dict().items():
+            digest.update(name.encode())
+            digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    except Exception:
+        pass
+    return digest.hexdigest()
+
+def _load_for_batch(path: str, target_size, keep_image: bool = False):
+    """(tensor, decoded PIL image or None, error) for one image."""
+    try:
+        min_size = (target_size[1], target_size[0]) if target_size else None
+        pil = open_image(path, min_size=min_size)
+        return _preprocess_pil(pil, target_size=target_size), (pil if keep_image else None), None
+    except Exception as e:
+        return None, None, e
+
+def _infer_chunk(model: Any, tensors: List[Any], device: str) -> List[Tuple[Optional[float], Any, Optional[Exception]]]:
+    """Batched forward pass; on failure, retry image by image to isolate bad inputs."""
+    try:
+        return [(c, raw, None) for c, raw in infer_batch(model, tensors, device=device)]
+    except Exception:
+        out = []
+        for t in tensors:
+            try:
+                c, raw = infer_image(model, t, device=device)
+                out.append((c, raw, None))
+            except Exception as e:
+                out.append((None, None, e))
+        return out
+
+def batch_inference_loop(
+    model: Any,
+    image_paths: List[str],
+    device: Optional[str] = None,
+    target_size: Tuple[int,int] = (512,512),
+    outputs_dir: str = './outputs',
+    max_images: Optional[int] = None,
+    batch_size: int = 8,
+    workers: int = 4,
+    prefetch: int = 2,
+    resume: bool = True,
+    save_visuals: bool = True,
+    model_version: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Pipelined offline inference over many images; returns one summary per image.
+
+    Decoding/preprocessing runs in `workers` threads, up to `prefetch` batches
+    ahead of the model. Images go through the model `batch_size` at a time and
+    a writer thread renders optional heatmap overlays and records each result
+    in the buffered `<outputs_dir>/predictions.csv` log and in
+    `<outputs_dir>/manifest.jsonl`. With `resume=True`, images already in the
+    manifest without an error are skipped, so an interrupted run continues
+    where it stopped. Manifest entries record the run (`model_version`,
+    default a hash of the weights, and `target_size`); entries of another
+    run are counted again rather than returned stale.
+    """
+    import queue
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    if device is None:
+        device = 'cuda' if torch is not None and torch.cuda.is_available() else 'cpu'
+    os.makedirs(outputs_dir, exist_ok=True)
+    paths = list(image_paths[:max_images] if max_images else image_paths)
+    run = f"{model_version or model_fingerprint(model)}@{target_size[0]}x{target_size[1]}"
+    done = {p: e for p, e in read_manifest(outputs_dir).items() if e.get('run') == run} if resume else {}
+    todo = [p for p in paths if not (p in done and done[p].get('error') is None)]
+
+    results: Dict[str, Dict[str, Any]] = {p: done[p] for p in paths if p in done}
+    write_q: 'queue.Queue' = queue.Queue(maxsize=max(1, prefetch) * batch_size)
+    write_errors: List[Exception] = []
+    writer_failed: List[BaseException] = []
+
+    def _writer():
+        manifest = open(os.path.join(outputs_dir, MANIFEST_NAME), 'a' if resume else 'w', encoding='utf-8')
+        log = ResultsLog(outputs_dir)
+        if not resume and os.path.exists(log.path):
+            os.remove(log.path)
+        unflushed: List[str] = []
+
+        def _flush():
+            # Results log first: anything the manifest marks done is also in the log
+            log.flush()
+            manifest.write(''.join(unflushed))
+            manifest.flush()
+            unflushed.clear()
+
+        try:
+            while True:
+                item = write_q.get()
+                if item is None:
+                    break
+                path, count, raw, image, entry = item
+                overlay = None
+                if save_visuals and count is not None:
+                    try:
+                        overlay = visualize_and_save(path, raw, count, outputs_dir=outputs_dir,
+                                                     image=image, log=log)
+                    except Exception as e:
+                        write_errors.append(e)
+                if overlay is None:
+                    log.append(path, count, None, entry['error'])
+                unflushed.append(json.dumps(entry) + '\n')
+                # Flush in chunks, and whenever the writer catches up so progress survives a kill
+                if write_q.empty() or len(unflushed) >= log.flush_every:
+                    _flush()
+        except BaseException as e:
+            writer_failed.append(e)
+        finally:
+            _flush()
+            manifest.close()
+
+    writer = threading.Thread(target=_writer, name='inference-writer', daemon=True)
+    writer.start()
 
-    # Save json
-    with open(json_out_path, 'w', encoding='utf-8') as jf:
-        json.dump({'image': image_path, 'count': int(round(count))}, jf, indent=2)
+    def _put(item):
+        # Never block on a full queue whose writer is gone
+        while True:
+            try:
+                write_q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if not writer.is_alive():
+                    raise RuntimeError(f"Results writer stopped: {writer_failed[0] if writer_failed else 'unknown error'}")
 
-    # Append to CSV
-    write_header = not os.path.exists(csv_out_path)
-    with open(csv_out_path, 'a', newline='', encoding='utf-8') as cf:
-        writer = csv.writer(cf)
-        if write_header:
-            writer.writerow(['image', 'prediction_count', 'json_path'])
-        writer.writerow([image_path, int(round(count)), json_out_path])
+    progress = None
+    try:
+        from tqdm import tqdm as _tqdm
+        progress = _tqdm(total=len(todo), desc='Inferring')
+    except Exception:
+        pass
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='inference-decode') as pool:
+            window = max(1, prefetch + 1) * batch_size
+            pending = [pool.submit(_load_for_batch, p, target_size, save_visuals) for p in todo[:window]]
+            next_idx = len(pending)
+            start = 0
+            while start < len(todo):
+                chunk = todo[start:start + batch_size]
+                loaded = [pending.pop(0).result() for _ in chunk]
+                # Keep the decoders `prefetch` batches ahead of the model
+                while next_idx < len(todo) and len(pending) < window:
+                    pending.append(pool.submit(_load_for_batch, todo[next_idx], target_size, save_visuals))
+                    next_idx += 1
+
+                ok = [(p, t) for p, (t, _, err) in zip(chunk, loaded) if err is None]
+                inferred = dict(zip([p for p, _ in ok], _infer_chunk(model, [t for _, t in ok], device))) if ok else {}
+                for p, (_, image, load_err) in zip(chunk, loaded):
+                    count, raw, err = inferred.get(p, (None, None, load_err))
+                    if err is not None:
+                        print(f"[!] Error on {os.path.basename(p)}: {err}")
+                        entry = {'image': p, 'count': None, 'error': str(err), 'run': run}
+                    else:
+                        entry = {'image': p, 'count': int(round(count)), 'error': None, 'run': run}
+                    results[p] = entry
+                    _put((p, count, raw, image, entry))
+                if progress is not None:
+                    progress.update(len(chunk))
+                start += len(chunk)
+    finally:
+        if writer.is_alive():
+            _put(None)
+        writer.join()
+        if progress is not None:
+            progress.close()
+    if writer_failed:
+        raise RuntimeError(f"Results writer stopped: {writer_failed[0]}")
+    if write_errors:
+        print(f"⚠️  {len(write_errors)} visual(s) could not be saved: {write_errors[0]}")
+    return [results[p] for p in paths]
 
 def safe_inference_loop(
     model: Any,
@@ -309,28 +1130,19 @@ def safe_inference_loop(
     device: Optional[str] = None,
     target_size: Tuple[int,int] = (512,512),
     outputs_dir: str = './outputs',
-    max_images: Optional[int] = None
+    max_images: Optional[int] = None,
+    batch_size: int = 8,
+    workers: int = 4,
+    resume: bool = False,
 ):
     """Run inference on list of images safely and save outputs; returns summary list.
-    """
-    if device is None and torch:
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    elif device is None:
-        device = 'cpu'
 
-    results = []
-    from tqdm import tqdm as _tqdm
-    iterator = image_paths[:max_images] if max_images else image_paths
-    for p in _tqdm(iterator, desc='Inferring'):
-        try:
-            tensor = preprocess_image(p, target_size=target_size)
-            count, raw = infer_image(model, tensor, device=device)
-            visualize_and_save(p, raw, count, outputs_dir=outputs_dir)
-            results.append({'image': p, 'count': int(round(count))})
-        except Exception as e:
-            print(f"[!] Error on {os.path.basename(p)}: {e}")
-            results.append({'image': p, 'count': None, 'error': str(e)})
-    return results
+    Thin wrapper over `batch_inference_loop` (prefetching, batched). Every
+    image is counted again unless `resume=True` is passed explicitly.
+    """
+    return batch_inference_loop(model, image_paths, device=device, target_size=target_size,
+                                outputs_dir=outputs_dir, max_images=max_images,
+                                batch_size=batch_size, workers=workers, resume=resume)
 
 def unit_test_inference(model: Any, repo_sample_dir: str = './data/sample_images') -> Dict[str, Any]:
     """Quick smoke test: run inference on first 2 sample images and report counts.
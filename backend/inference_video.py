@@ -0,0 +1,205 @@
+"""
+Video and frame-sequence crowd counting with adaptive frame skipping.
+
+Frames are decoded one at a time (OpenCV for video files, Pillow for
+animated images and zip/tar frame sequences). Each frame is compared with the
+last frame that actually went through the model using a small grayscale
+thumbnail; if the scene barely changed the previous count is reused, so model
+cost tracks how fast the scene changes rather than the frame rate. Frames that
+do need counting are grouped into batches. The raw count series is then
+smoothed with an exponential moving average.
+"""
+import io
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import inference_utils as iu
+
+Frame = Tuple[float, Any]  # (timestamp in seconds, RGB PIL image)
+
+
+def _iter_video_file(data: bytes, filename: str, max_fps: Optional[float]) -> Iterator[Frame]:
+    """Decode a video container with OpenCV, keeping at most `max_fps` frames per second."""
+    cv2 = iu.cv2
+    if cv2 is None:
+        raise RuntimeError("opencv-python is required to decode video files - install with 'pip install opencv-python'")
+    suffix = os.path.splitext(filename or '')[1] or '.mp4'
+    # OpenCV can only open videos by path
+    with iu.image_path_for(data, suffix=suffix) as path:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise ValueError('Unable to open video')
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            step = max(1, int(round(fps / max_fps))) if max_fps else 1
+            index = 0
+            while True:
+                # grab() skips decoding for frames we do not keep
+                if not cap.grab():
+                    break
+                if index % step == 0:
+                    ok, bgr = cap.retrieve()
+                    if not ok:
+                        break
+                    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+                    yield index / fps, iu.Image.fromarray(rgb)
+                index += 1
+        finally:
+            cap.release()
+
+
+def _iter_animated_image(img, frame_interval_s: float) -> Iterator[Frame]:
+    t = 0.0
+    for index in range(getattr(img, 'n_frames', 1)):
+        img.seek(index)
+        yield t, img.convert('RGB')
+        duration = img.info.get('duration')
+        t += duration / 1000.0 if duration else frame_interval_s
+
+
+def iter_frames(data: bytes, filename: str = '', frame_interval_s: float = 1.0,
+                max_fps: Optional[float] = None, archive_limits: Optional[Dict[str, int]] = None) -> Iterator[Frame]:
+    """Yield (timestamp_s, RGB PIL image) for each frame, decoding lazily.
+
+    Accepts a video file, an animated GIF/WebP/TIFF, or a zip/tar archive of
+    still frames (ordered by member name, `frame_interval_s` apart). Archive
+    members are buffered to sort them, within `archive_limits` (keyword
+    arguments of `iu.iter_archive_images`).
+    """
+    if iu.is_archive(filename, data):
+        members = sorted(iu.iter_archive_images(data, **(archive_limits or {})), key=lambda m: m[0])
+        for index, (_, frame) in enumerate(members):
+            yield index * frame_interval_s, iu.open_image(frame)
+        return
+    try:
+        img = iu.Image.open(io.BytesIO(data))
+    except Exception:
+        # Not something Pillow can read: treat it as a video container
+        img = None
+    if img is not None:
+        yield from _iter_animated_image(img, frame_interval_s)
+    else:
+        yield from _iter_video_file(data, filename, max_fps)
+
+
+class ChangeDetector:
+    """Decide whether a frame differs enough from the last counted one.
+
+    The difference is the mean absolute difference of `thumb_size` grayscale
+    thumbnails, on a 0-255 scale. A frame is counted when the difference is at
+    least `threshold`, or when `max_skip` consecutive frames were skipped.
+    """
+
+    def __init__(self, threshold: float = 4.0, max_skip: int = 30, thumb_size=(32, 32)):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.thumb_size = thumb_size
+        self._reference = None
+        self._skipped = 0
+
+    def thumbnail(self, img):
+        small = img.convert('L').resize(self.thumb_size, iu.Image.BILINEAR)
+        return iu.np.asarray(small, dtype=iu.np.float32)
+
+    def should_count(self, img) -> Tuple[bool, Optional[float]]:
+        thumb = self.thumbnail(img)
+        if self._reference is None:
+            self._reference = thumb
+            return True, None
+        diff = float(iu.np.abs(thumb - self._reference).mean())
+        if diff >= self.threshold or self._skipped >= self.max_skip:
+            self._reference = thumb
+            self._skipped = 0
+            return True, diff
+        self._skipped += 1
+        return False, diff
+
+
+def smooth(values: Sequence[float], alpha: float) -> List[float]:
+    """Exponential moving average; alpha=1 disables smoothing."""
+    out: List[float] = []
+    prev = None
+    for v in values:
+        prev = float(v) if prev is None else alpha * v + (1 - alpha) * prev
+        out.append(prev)
+    return out
+
+
+class StreamCounter:
+    """Frame selection and the count series of one frame stream.
+
+    `chunks(frames)` decodes and change-checks the frames and yields the
+    frames that need counting, at most `batch_size` at a time. The caller
+    counts each chunk and hands the counts back with `add_counts` before
+    asking for the next one, so the counting can happen elsewhere (e.g.
+    through the API's admission control and micro-batcher).
+    """
+
+    def __init__(self, change_threshold: float = 4.0, max_skip: int = 30,
+                 smoothing: float = 0.5, batch_size: int = 8):
+        self.detector = ChangeDetector(change_threshold, max_skip)
+        self.smoothing = smoothing
+        self.batch_size = max(1, batch_size)
+        self.entries: List[Dict[str, Any]] = []
+        self.counts: List[Optional[float]] = []  # one per counted frame
+        self._selected = 0
+
+    def chunks(self, frames: Iterator[Frame]) -> Iterator[List[Any]]:
+        pending: List[Any] = []
+        for t, img in frames:
+            counted, diff = self.detector.should_count(img)
+            if counted:
+                pending.append(img)
+                self._selected += 1
+            # Index of the most recent counted frame (this one, or the one it reuses)
+            self.entries.append({'t': round(t, 3), 'ref': self._selected - 1, 'counted': counted,
+                                 'change': round(diff, 3) if diff is not None else None})
+            if len(pending) >= self.batch_size:
+                yield pending
+                pending = []
+        if pending:
+            yield pending
+
+    def add_counts(self, counts: Sequence[Optional[float]]):
+        self.counts.extend(counts)
+
+    def result(self) -> Dict[str, Any]:
+        raw = [self.counts[e['ref']] for e in self.entries]
+        # Frames whose count failed carry the last good value forward
+        filled, last = [], 0.0
+        for value in raw:
+            last = value if value is not None else last
+            filled.append(last)
+        smoothed = smooth(filled, self.smoothing)
+
+        series = []
+        for e, r, s in zip(self.entries, raw, smoothed):
+            series.append({
+                't': e['t'],
+                'raw_count': int(round(r)) if r is not None else None,
+                'count': round(s, 2),
+                'counted': e['counted'],
+                'change': e['change'],
+            })
+        frames_counted = sum(1 for e in self.entries if e['counted'])
+        return {
+            'frames': len(self.entries),
+            'frames_counted': frames_counted,
+            'skip_ratio': round(1 - frames_counted / len(self.entries), 3) if self.entries else 0.0,
+            'series': series,
+        }
+
+
+def count_stream(frames: Iterator[Frame], count_batch: Callable[[List[Any]], List[Optional[float]]],
+                 change_threshold: float = 4.0, max_skip: int = 30,
+                 smoothing: float = 0.5, batch_size: int = 8) -> Dict[str, Any]:
+    """Count a frame stream, running the model only on frames that changed.
+
+    `count_batch` takes a list of RGB PIL images and returns their counts.
+    Returns the per-timestamp series plus how many frames were decoded and
+    how many were actually counted.
+    """
+    counter = StreamCounter(change_threshold, max_skip, smoothing, batch_size)
+    for chunk in counter.chunks(frames):
+        counter.add_counts(count_batch(chunk))
+    return counter.result()
@@ -4,17 +4,34 @@ from contextlib import asynccontextmanager
 from routes import (
     auth, events, crowd_density, medical_emergencies, lost_person, 
     feedback, facilities, alerts, inference, washroom_facilities,
-    emergency_exits, zones, medical_facilities
+    emergency_exits, zones, medical_facilities, camera_masks
 )
 from database import init_db
+from config import settings
+from inference_executor import executor
+from camera_ingest import ingest, load_cameras
+from process_memory import launcher_pid
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting Crowd Management System API...")
     await init_db()
+    await executor.startup(settings.model_warmup)
+    if settings.camera_ingest_config and launcher_pid():
+        # Every serve.py worker runs this lifespan; one ingest per worker would poll each camera N times
+        print("⚠️  Camera ingest not started in serve.py workers; run `python camera_ingest.py` once per node")
+    elif settings.camera_ingest_config:
+        try:
+            await ingest.start(load_cameras(settings.camera_ingest_config), inference._count_contents)
+        except Exception as e:
+            print(f"⚠️  Camera ingest not started: {e}")
     yield
     # Shutdown
+    await ingest.stop()
+    await inference.batcher.close()
+    inference.close_tensor_ring()
+    executor.shutdown()
     print("👋 Shutting down Crowd Management System API...")
 
 app = FastAPI(
@@ -49,6 +66,7 @@ app.include_router(washroom_facilities.router)
 app.include_router(emergency_exits.router)
 app.include_router(zones.router)
 app.include_router(medical_facilities.router)
+app.include_router(camera_masks.router)
 
 @app.get("/", tags=["Root"])
 def home():
@@ -0,0 +1,374 @@
+"""
+Process-wide model registry for the crowd-counting inference path.
+
+The counting model is loaded once (from the FastAPI lifespan, or lazily on the
+first request) and shared by every request in the process. When hot reload is
+enabled the weights file is re-stat'ed at most every `model_reload_check_s`
+seconds and a changed file is loaded and swapped in; the previous model keeps
+serving if the new weights fail to load.
+
+The LWCC fallback (used when no weights file is available) is held the same
+way: its DM-Count model is loaded once and passed to every `get_count` call.
+"""
+import contextlib
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import inference_utils as iu
+from config import settings
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of the current process in bytes (Linux/macOS)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import resource
+        import sys
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, kilobytes on Linux
+        return rss if sys.platform == "darwin" else rss * 1024
+    except Exception:
+        return None
+
+
+def _model_nbytes(model: Any) -> Optional[int]:
+    """Bytes held by the model's parameters and buffers."""
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return int(total)
+    except Exception:
+        return None
+
+
+class ModelRegistry:
+    """Holds the loaded counting model and its load/warm-up statistics."""
+
+    def __init__(self, model_path: str, device: Optional[str] = None,
+                 hot_reload: bool = True, reload_check_s: float = 2.0,
+                 backend: str = "torch", input_size: int = 512, mmap: bool = False):
+        self.model_path = model_path
+        self.mmap = mmap
+        self.backend = backend
+        self.input_size = input_size
+        # Optimized backends (int8, frozen TorchScript, ONNX Runtime) are CPU-only
+        self.device = device or ("cpu" if backend != "torch" else self._default_device())
+        self.hot_reload = hot_reload
+        self.reload_check_s = reload_check_s
+
+        self._model = None
+        self._mtime = None
+        self._loaded = False
+        self._last_check = 0.0
+        self._version = None
+        self._version_checked = 0.0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            "loads": 0,
+            "reloads": 0,
+            "load_errors": 0,
+            "last_load_ms": None,
+            "last_loaded_at": None,
+            "model_bytes": None,
+            "rss_delta_bytes": None,
+            "warmup_ms": None,
+            "warmup_image": None,
+            "active_backend": None,
+            "backend_error": None,
+        }
+
+    @staticmethod
+    def _default_device() -> str:
+        torch = iu.torch
+        try:
+            if torch is not None and torch.cuda.is_available():
+                return "cuda"
+        except Exception:
+            pass
+        return "cpu"
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.model_path)
+        except OSError:
+            return None
+
+    def load(self) -> Optional[Any]:
+        """(Re)load the weights from `model_path`; returns the active model."""
+        with self._lock:
+            return self._load_locked()
+
+    def _load_locked(self) -> Optional[Any]:
+        mtime = self._file_mtime()
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        model = self._load_backend()
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self._loaded = True
+        self._last_check = time.monotonic()
+
+        if model is None:
+            if mtime is not None:
+                # File exists but could not be loaded; keep serving the old model
+                self.stats["load_errors"] += 1
+            self._mtime = mtime
+            return self._model
+
+        if self._model is not None:
+            self.stats["reloads"] += 1
+        self._model = model
+        self._mtime = mtime
+        rss_after = _rss_bytes()
+        self.stats["loads"] += 1
+        self.stats["last_load_ms"] = round(elapsed_ms, 2)
+        self.stats["last_loaded_at"] = time.time()
+        self.stats["model_bytes"] = _model_nbytes(model)
+        if rss_before is not None and rss_after is not None:
+            self.stats["rss_delta_bytes"] = rss_after - rss_before
+        print(f"✓ Model loaded from {self.model_path} on {self.device} in {elapsed_ms:.0f} ms")
+        return model
+
+    def _load_backend(self) -> Optional[Any]:
+        """Load through the configured backend, falling back to plain torch on failure."""
+        self.stats["backend_error"] = None
+        if self.backend != "torch":
+            try:
+                model = iu.load_backend(str(self.model_path), self.backend,
+                                        device=self.device, input_size=self.input_size)
+                if model is not None:
+                    self.stats["active_backend"] = self.backend
+                return model
+            except Exception as e:
+                self.stats["backend_error"] = str(e)
+                print(f"⚠️  {self.backend} backend unavailable ({e}); using torch")
+        model = iu.load_model(str(self.model_path), device=self.device, mmap=self.mmap)
+        if model is not None:
+            self.stats["active_backend"] = "torch"
+        return model
+
+    def get(self) -> Optional[Any]:
+        """Return the shared model, loading it on first use or when the file changed."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    return self._load_locked()
+        if self.hot_reload and time.monotonic() - self._last_check >= self.reload_check_s:
+            with self._lock:
+                if time.monotonic() - self._last_check >= self.reload_check_s:
+                    self._last_check = time.monotonic()
+                    if self._file_mtime() != self._mtime:
+                        self._load_locked()
+        return self._model
+
+    def version(self) -> str:
+        """Identifier of the weights file on disk; changes when the file is replaced.
+
+        Does not load the model, so the API process can use it (e.g. for cache
+        keys) while the model itself lives in inference workers.
+        """
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked >= self.reload_check_s:
+            try:
+                st = os.stat(self.model_path)
+                self._version = f"{st.st_mtime_ns}-{st.st_size}"
+            except OSError:
+                self._version = "none"
+            self._version_checked = now
+        return self._version
+
+    def warmup(self) -> Optional[float]:
+        """Run one bundled `samplecrowd` image through the model; returns ms."""
+        model = self.get()
+        if model is None:
+            return None
+        try:
+            paths, _ = iu.find_image_paths()
+        except FileNotFoundError:
+            return None
+        started = time.perf_counter()
+        try:
+            tensor = iu.preprocess_image(paths[0], target_size=(self.input_size, self.input_size))
+            iu.infer_image(model, tensor, device=self.device)
+        except Exception as e:
+            print(f"⚠️  Model warm-up failed: {e}")
+            return None
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.stats["warmup_ms"] = round(elapsed_ms, 2)
+        self.stats["warmup_image"] = os.path.basename(paths[0])
+        return elapsed_ms
+
+    def startup(self, warmup: bool = True):
+        """Load the model (and optionally warm it up); called from the app lifespan."""
+        self.load()
+        if warmup:
+            self.warmup()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "model_path": str(self.model_path),
+            "backend": self.backend,
+            "device": self.device,
+            "mmap": self.mmap,
+            "loaded": self._model is not None,
+            "hot_reload": self.hot_reload,
+            "rss_bytes": _rss_bytes(),
+            **self.stats,
+        }
+
+
+@contextlib.contextmanager
+def _lwcc_home():
+    """Point HOME at a writable directory while LWCC imports or downloads weights.
+
+    LWCC keeps its weights under `~/.lwcc`; `LWCC_HOME` wins when set,
+    otherwise an unwritable HOME (e.g. `/` in containers) is swapped for a
+    temp directory.
+    """
+    home = os.environ.get("HOME")
+    target = os.environ.get("LWCC_HOME")
+    if not target and (not home or not os.access(home, os.W_OK)):
+        target = os.path.join(tempfile.gettempdir(), "lwcc-home")
+    if not target:
+        yield
+        return
+    os.makedirs(target, exist_ok=True)
+    os.environ["HOME"] = target
+    try:
+        yield
+    finally:
+        if home is None:
+            os.environ.pop("HOME", None)
+        else:
+            os.environ["HOME"] = home
+
+
+class LWCCFallback:
+    """LWCC counting model, loaded once and reused for every fallback call."""
+
+    def __init__(self, model_name: str = "DM-Count", model_weights: str = "SHA"):
+        self.model_name = model_name
+        self.model_weights = model_weights
+        self._lwcc = None
+        self._model = None
+        self._module = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            "loads": 0,
+            "last_load_ms": None,
+            "load_error": None,
+            "calls": 0,
+            "images": 0,
+        }
+
+    def get(self):
+        """Return (LWCC class, cached model); raises if LWCC cannot be imported or loaded.
+
+        Reloads when the `lwcc` module object changes (e.g. reinstalled or
+        replaced), otherwise reuses the first load, including its failure.
+        """
+        module = sys.modules.get("lwcc")
+        if self._loaded and (module is None or module is self._module):
+            if self._lwcc is None:
+                raise RuntimeError(self.stats["load_error"])
+            return self._lwcc, self._model
+        with self._lock:
+            module = sys.modules.get("lwcc")
+            if not self._loaded or (module is not None and module is not self._module):
+                self._load_locked()
+        if self._lwcc is None:
+            raise RuntimeError(self.stats["load_error"])
+        return self._lwcc, self._model
+
+    def _load_locked(self):
+        started = time.perf_counter()
+        self._lwcc = self._model = None
+        try:
+            with _lwcc_home():
+                module = importlib.import_module("lwcc")
+                lwcc = module.LWCC
+                load_model = getattr(lwcc, "load_model", None)
+                model = load_model(model_name=self.model_name, model_weights=self.model_weights) if load_model else None
+            self._module, self._lwcc, self._model = module, lwcc, model
+            self.stats["load_error"] = None
+            self.stats["loads"] += 1
+            self.stats["last_load_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+            print(f"✓ LWCC fallback ({self.model_name}/{self.model_weights}) loaded in {self.stats['last_load_ms']:.0f} ms")
+        except Exception as e:
+            self._module = sys.modules.get("lwcc")
+            self.stats["load_error"] = f"{type(e).__name__}: {e}"
+            print(f"⚠️  LWCC fallback unavailable: {e}")
+        self._loaded = True
+
+    def count(self, paths: List[str]) -> List[float]:
+        """Counts for image files, in one LWCC call where the package supports it."""
+        lwcc, model = self.get()
+        kwargs = {"model_name": self.model_name, "model_weights": self.model_weights, "resize_img": True}
+        if model is not None:
+            kwargs["model"] = model
+        self.stats["calls"] += 1
+        self.stats["images"] += len(paths)
+        result = lwcc.get_count(list(paths), **kwargs)
+        if isinstance(result, dict):
+            # LWCC keys multi-image results by file name without extension
+            return [float(result[os.path.splitext(os.path.basename(p))[0]]) for p in paths]
+        if len(paths) == 1:
+            return [float(result)]
+        return [float(lwcc.get_count([p], **kwargs)) for p in paths]
+
+    @property
+    def available(self) -> bool:
+        return self._lwcc is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "model_weights": self.model_weights,
+            "loaded": self._loaded,
+            "available": self.available,
+            **self.stats,
+        }
+
+
+registry = ModelRegistry(
+    settings.model_path,
+    device=settings.inference_device,
+    hot_reload=settings.model_hot_reload,
+    reload_check_s=settings.model_reload_check_s,
+    backend=settings.inference_backend,
+    input_size=settings.inference_input_size,
+    mmap=settings.model_mmap,
+)
+
+lwcc_fallback = LWCCFallback(settings.lwcc_model_name, settings.lwcc_model_weights)
+
+_backend_registries: Dict[str, ModelRegistry] = {}
+
+
+def registry_for(backend: Optional[str], input_size: Optional[int] = None) -> ModelRegistry:
+    """The shared registry, or a lazily loaded one serving the same weights through `backend`.
+
+    Used by the QoS degrade tiers; like `registry` it lives in the inference
+    worker that first asks for it.
+    """
+    if not backend or backend == registry.backend:
+        return registry
+    reg = _backend_registries.get(backend)
+    if reg is None:
+        reg = _backend_registries[backend] = ModelRegistry(
+            registry.model_path,
+            hot_reload=registry.hot_reload,
+            reload_check_s=registry.reload_check_s,
+            backend=backend,
+            input_size=input_size or registry.input_size,
+        )
+    return reg
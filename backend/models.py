@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, field_validator
 from typing import Optional, Literal, List
 from datetime import datetime
 import math
@@ -61,6 +61,9 @@ class EventBase(BaseModel):
     capacity: Optional[int] = Field(None, gt=0, description="Total event capacity")
     attendees_count: int = Field(0, ge=0, description="Current number of attendees")
     areas: List[Area] = Field(default_factory=list, description="Predefined areas for this event")
+    frame_dedup_threshold: Optional[float] = Field(
+        None, ge=0, description="Thumbnail difference below which a camera's previous count is reused; unset uses the server default, 0 disables"
+    )
     date: Optional[str] = None  # Frontend compatibility: ISO date string
 
 class EventCreate(EventBase):
@@ -76,6 +79,30 @@ class Event(EventBase):
         from_attributes = True
 
 
+# ---------------------------------------------------
+# 📷 Camera Area Masks
+# ---------------------------------------------------
+class CameraAreaMaskBase(BaseModel):
+    polygon: List[List[float]] = Field(
+        ..., min_length=3, example=[[0.05, 0.4], [0.6, 0.35], [0.7, 1.0], [0.0, 1.0]],
+        description="Area outline in the camera image, normalized [x, y] (0..1, origin top-left)"
+    )
+
+    @field_validator("polygon")
+    @classmethod
+    def check_points(cls, polygon):
+        for point in polygon:
+            if len(point) != 2 or not all(0.0 <= v <= 1.0 for v in point):
+                raise ValueError("each point must be [x, y] with 0 <= x, y <= 1")
+        return polygon
+
+class CameraAreaMask(CameraAreaMaskBase):
+    event_id: str
+    camera_id: str
+    area_name: str
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 # ---------------------------------------------------
 # 👥 Crowd Density Models
 # ---------------------------------------------------
@@ -116,6 +143,22 @@ class CrowdDensity(CrowdDensityBase):
             return "Overcrowded"
 
 
+class DensityRegion(BaseModel):
+    """Image region in normalized coordinates (0..1, origin top-left); give `box` or `polygon`."""
+    box: Optional[List[float]] = Field(None, min_length=4, max_length=4, example=[0.0, 0.5, 0.5, 1.0])
+    polygon: Optional[List[List[float]]] = Field(None, example=[[0.1, 0.2], [0.6, 0.2], [0.4, 0.9]])
+
+class DensityRecountRequest(BaseModel):
+    """Recount stored density maps over new regions without rerunning the model."""
+    regions: dict[str, DensityRegion] = Field(..., description="Named regions to integrate over")
+    event_id: Optional[str] = None
+    area_name: Optional[str] = None
+    record_ids: Optional[List[str]] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    limit: int = Field(1000, ge=1, le=10000)
+
+
 # ---------------------------------------------------
 # 🧒 Lost Person Models
 # ---------------------------------------------------
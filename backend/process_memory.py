@@ -0,0 +1,113 @@
+"""
+Per-process memory accounting for the API and inference workers (Linux).
+
+RSS counts every resident page a process maps. That includes pages it shares
+copy-on-write with its parent, so summing RSS over forked workers counts the
+preloaded model once per worker. PSS divides each shared page among the
+processes that map it. USS counts only the pages a process alone holds. Both
+come from /proc/<pid>/smaps_rollup.
+
+`memory_report()` covers the process tree of the serving launcher (see
+serve.py, which exports SERVE_LAUNCHER_PID to its workers). Outside the
+launcher it covers the current process. The tree includes the API workers and
+their inference pool processes. `shared_savings_bytes` is what the tree would
+use if nothing were shared, minus what it actually uses.
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+LAUNCHER_ENV = "SERVE_LAUNCHER_PID"
+
+_FIELDS = {
+    "Rss": "rss_bytes",
+    "Pss": "pss_bytes",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def parse_smaps_rollup(text: str) -> Dict[str, int]:
+    """rss/pss/uss/shared bytes from the text of /proc/<pid>/smaps_rollup."""
+    values = {}
+    for line in text.splitlines():
+        key, _, rest = line.partition(":")
+        if key in _FIELDS:
+            values[_FIELDS[key]] = int(rest.split()[0]) * 1024
+    return {
+        "rss_bytes": values.get("rss_bytes", 0),
+        "pss_bytes": values.get("pss_bytes", 0),
+        "uss_bytes": values.get("private_clean", 0) + values.get("private_dirty", 0),
+        "shared_bytes": values.get("shared_clean", 0) + values.get("shared_dirty", 0),
+    }
+
+
+def process_memory(pid: Any = "self") -> Optional[Dict[str, int]]:
+    """Memory of one process, or None if it cannot be read (not Linux, process gone)."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as fh:
+            return parse_smaps_rollup(fh.read())
+    except OSError:
+        return None
+
+
+def child_pids(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as fh:
+            return [int(p) for p in fh.read().split()]
+    except OSError:
+        return []
+
+
+def _process_tree(root: int) -> List[Dict[str, Any]]:
+    rows, stack = [], [(root, 0)]
+    while stack:
+        pid, depth = stack.pop()
+        rows.append({"pid": pid, "depth": depth})
+        stack.extend((child, depth + 1) for child in reversed(child_pids(pid)))
+    return rows
+
+
+def launcher_pid() -> Optional[int]:
+    value = os.environ.get(LAUNCHER_ENV)
+    return int(value) if value and value.isdigit() else None
+
+
+def memory_report(root: Optional[int] = None) -> Dict[str, Any]:
+    """Memory of every process in the serving tree, with totals and the copy-on-write savings."""
+    launcher = launcher_pid()
+    root = root or launcher or os.getpid()
+    processes = []
+    for entry in _process_tree(root):
+        mem = process_memory(entry["pid"])
+        if mem is None:
+            continue
+        if entry["pid"] == launcher:
+            role = "launcher"
+        elif entry["depth"] == (1 if launcher == root else 0):
+            role = "api"
+        else:
+            role = "inference"
+        processes.append({"pid": entry["pid"], "role": role, "current": entry["pid"] == os.getpid(), **mem})
+    rss = sum(p["rss_bytes"] for p in processes)
+    pss = sum(p["pss_bytes"] for p in processes)
+    return {
+        "launcher_pid": launcher,
+        "processes": processes,
+        "total_rss_bytes": rss,
+        "total_pss_bytes": pss,
+        "shared_savings_bytes": rss - pss,
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Plain-text table of a memory report (MB)."""
+    mb = lambda b: f"{b / 2 ** 20:9.1f}"
+    lines = [f"{'pid':>8} {'role':<10} {'rss MB':>9} {'pss MB':>9} {'uss MB':>9} {'shared MB':>9}"]
+    for p in report["processes"]:
+        lines.append(f"{p['pid']:>8} {p['role']:<10} {mb(p['rss_bytes'])} {mb(p['pss_bytes'])} "
+                     f"{mb(p['uss_bytes'])} {mb(p['shared_bytes'])}")
+    lines.append(f"{'total':>8} {'':<10} {mb(report['total_rss_bytes'])} {mb(report['total_pss_bytes'])}"
+                 f"   (copy-on-write saves {report['shared_savings_bytes'] / 2 ** 20:.1f} MB)")
+    return "\n".join(lines)
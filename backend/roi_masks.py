@@ -0,0 +1,87 @@
+"""
+Per-camera region-of-interest masks for event areas.
+
+Each camera of an event can have one polygon per area (normalized image
+coordinates, stored in the `camera_area_masks` collection). A camera's
+polygons are rasterized once per density-map shape into a single
+(areas x cells) float32 matrix and cached, so turning one frame's density map
+into per-area counts is a single matrix-vector product: one inference feeds
+every area the camera overlaps, and people outside all polygons are not
+counted towards any area.
+
+Mask definitions are re-read from the database at most every `ttl_s`
+seconds; the camera-mask routes also invalidate the cache on every change.
+"""
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import database
+from density_store import polygon_mask
+
+
+class CameraMasks:
+    """The area polygons of one camera and their compiled rasters."""
+
+    def __init__(self, areas: Sequence[Tuple[str, Sequence[Sequence[float]], Optional[float]]]):
+        self.names = [name for name, _, _ in areas]
+        self.polygons = [np.asarray(poly, dtype=np.float64) for _, poly, _ in areas]
+        self.radii = {name: radius for name, _, radius in areas}
+        self._compiled: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def compiled(self, shape: Tuple[int, int]) -> np.ndarray:
+        """(areas, h*w) mask matrix for a density map of `shape`, built once per shape."""
+        shape = tuple(shape)
+        matrix = self._compiled.get(shape)
+        if matrix is None:
+            matrix = np.stack([polygon_mask(p, shape).ravel() for p in self.polygons])
+            self._compiled[shape] = matrix
+        return matrix
+
+    def area_counts(self, density: np.ndarray) -> Dict[str, float]:
+        """People inside each area's polygon for one density map."""
+        counts = self.compiled(density.shape) @ np.asarray(density, dtype=np.float32).ravel()
+        return {name: round(float(c), 3) for name, c in zip(self.names, counts)}
+
+
+class RoiMaskCache:
+    """Compiled camera masks keyed by (event_id, camera_id), refreshed every `ttl_s`."""
+
+    def __init__(self, ttl_s: float = 60.0):
+        self.ttl_s = ttl_s
+        self._entries: Dict[Tuple[str, str], Tuple[Optional[CameraMasks], float]] = {}
+        self.hits = 0
+        self.loads = 0
+
+    async def _load(self, event_id: str, camera_id: str) -> Optional[CameraMasks]:
+        docs = await database["camera_area_masks"].find(
+            {"event_id": event_id, "camera_id": camera_id}, {"_id": 0}
+        ).sort("area_name", 1).to_list(1000)
+        if not docs:
+            return None
+        event = await database["events"].find_one({"id": event_id}, {"_id": 0, "areas": 1}) or {}
+        radii = {a.get("name"): a.get("radius_m") for a in event.get("areas") or []}
+        return CameraMasks([(d["area_name"], d["polygon"], radii.get(d["area_name"])) for d in docs])
+
+    async def get(self, event_id: str, camera_id: str) -> Optional[CameraMasks]:
+        """Masks for a camera, or None if it has no area polygons."""
+        key = (event_id, camera_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[0]
+        masks = await self._load(event_id, camera_id)
+        self.loads += 1
+        self._entries[key] = (masks, time.monotonic() + self.ttl_s)
+        return masks
+
+    def invalidate(self, event_id: str, camera_id: Optional[str] = None):
+        for key in [k for k in self._entries if k[0] == event_id and (camera_id is None or k[1] == camera_id)]:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cameras": len(self._entries), "hits": self.hits, "loads": self.loads, "ttl_s": self.ttl_s}
+
+
+roi_masks = RoiMaskCache()
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from datetime import datetime
+
+from models import CameraAreaMask, CameraAreaMaskBase
+from database import database
+from roi_masks import roi_masks
+
+router = APIRouter(prefix="/camera-masks", tags=["Camera Masks"])
+
+
+@router.put("/{event_id}/{camera_id}/{area_name}", response_model=CameraAreaMask)
+async def put_camera_mask(event_id: str, camera_id: str, area_name: str, mask: CameraAreaMaskBase):
+    """Create or replace the polygon of `area_name` as seen by `camera_id`.
+
+    Frames uploaded to `/inference/count` with this `event_id` and
+    `camera_id` are then also counted per area, inside each polygon.
+    """
+    event = await database["events"].find_one({"id": event_id}, {"_id": 0, "areas": 1})
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if area_name not in {a.get("name") for a in event.get("areas") or []}:
+        raise HTTPException(status_code=404, detail=f"Event has no area named '{area_name}'")
+
+    doc = CameraAreaMask(event_id=event_id, camera_id=camera_id, area_name=area_name,
+                         polygon=mask.polygon, updated_at=datetime.utcnow()).model_dump()
+    await database["camera_area_masks"].replace_one(
+        {"event_id": event_id, "camera_id": camera_id, "area_name": area_name}, doc, upsert=True
+    )
+    roi_masks.invalidate(event_id, camera_id)
+    return CameraAreaMask(**doc)
+
+
+@router.get("/", response_model=List[CameraAreaMask])
+async def get_camera_masks(event_id: str, camera_id: Optional[str] = None):
+    """List area polygons for an event, optionally for one camera"""
+    query = {"event_id": event_id}
+    if camera_id:
+        query["camera_id"] = camera_id
+    docs = await database["camera_area_masks"].find(query, {"_id": 0}).to_list(1000)
+    return [CameraAreaMask(**d) for d in docs]
+
+
+@router.delete("/{event_id}/{camera_id}/{area_name}")
+async def delete_camera_mask(event_id: str, camera_id: str, area_name: str):
+    """Remove one area polygon from a camera"""
+    result = await database["camera_area_masks"].delete_one(
+        {"event_id": event_id, "camera_id": camera_id, "area_name": area_name}
+    )
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Camera mask not found")
+    roi_masks.invalidate(event_id, camera_id)
+    return {"message": "Camera mask deleted successfully"}
@@ -5,6 +5,7 @@ import secrets
 
 from models import Event, EventCreate, Area
 from database import database
+from frame_dedup import frame_dedup
 
 router = APIRouter(prefix="/events", tags=["Events"])
 
@@ -94,6 +95,7 @@ async def update_event(event_id: str, event_update: EventCreate):
         {"id": event_id},
         {"$set": update_dict}
     )
+    frame_dedup.forget_event(event_id)
     
     updated_event = await database["events"].find_one({"id": event_id})
     return Event(**{k: v for k, v in updated_event.items() if k != "_id"})
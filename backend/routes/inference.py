@@ -1,11 +1,313 @@
-from fastapi import APIRouter, Request, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Request, HTTPException, status, UploadFile, File, WebSocket, WebSocketDisconnect
+from starlette.concurrency import iterate_in_threadpool
+from bson import ObjectId
 from typing import Optional
-import os
-import tempfile
+from datetime import datetime
 from pathlib import Path
+import asyncio
+import json
+import math
+import time
+
+import inference_pipeline
+import inference_utils as iu
+import inference_video
+import process_memory
+import shm_ring
+from camera_ingest import CameraConfig, ingest
+from config import settings
+from database import database
+from density_store import DensityMapStore, region_polygon
+from frame_dedup import frame_dedup, thumbnail as frame_thumbnail
+from inference_admission import AdmissionRejected, AdmissionTimeout, admission
+from inference_batcher import BatchScheduler
+from inference_cache import ResultCache, cache_key
+from inference_cascade import CascadeStats
+from inference_executor import InferenceWorkerError, executor
+from inference_qos import FULL as QOS_FULL, qos, tier_model as qos_tier_model
+from inference_scheduler import source_zone_key, zone_scheduler
+from model_registry import registry
+from models import DensityRecountRequest
+from roi_masks import roi_masks
+from ws_ingest import FORMAT_RAW, FrameError, FrameWindow, parse_frames, stream_stats
+from routes.crowd_density import generate_density_id, calculate_density
 
 router = APIRouter(prefix="/inference", tags=["Inference"])
 
+TARGET_SIZE = (settings.inference_input_size, settings.inference_input_size)
+
+
+_tensor_ring = None
+_tensor_ring_failed = False
+
+
+def _get_tensor_ring():
+    """The shared-memory slot ring for inference worker processes, or None (thread mode, disabled, failed)."""
+    global _tensor_ring, _tensor_ring_failed
+    if _tensor_ring is None and not _tensor_ring_failed and executor.workers and settings.inference_shm_slots > 0:
+        side = max(settings.inference_input_size, settings.inference_qos_reduced_size)
+        try:
+            _tensor_ring = shm_ring.TensorRing(settings.inference_shm_slots, (3, side, side))
+            print(f"✓ Shared-memory tensor ring: {settings.inference_shm_slots} slots of 3x{side}x{side}")
+        except Exception as e:
+            _tensor_ring_failed = True
+            print(f"⚠️  Shared-memory tensor ring unavailable ({e}); sending encoded images to workers")
+    return _tensor_ring
+
+
+def close_tensor_ring():
+    """Unlink the shared-memory ring (app shutdown)."""
+    global _tensor_ring
+    ring, _tensor_ring = _tensor_ring, None
+    if ring is not None:
+        ring.close()
+
+
+def _fill_slots(ring, jobs, size):
+    """Decode + preprocess each (slot, image bytes) into its slot; None where the image cannot be decoded."""
+    refs = []
+    for index, contents in jobs:
+        try:
+            refs.append(ring.write_image(index, contents, size))
+        except Exception:
+            refs.append(None)
+    return refs
+
+
+async def _count_via_ring(ring, group, size, backend):
+    """Count `group` items through shared-memory slots; returns (results, indices still to count from bytes).
+
+    Items that find no free slot, cannot be decoded here, come back stale or
+    need a fallback backend are left to the bytes path.
+    """
+    results = [None] * len(group)
+    held, rest = [], []
+    for j in range(len(group)):
+        try:
+            held.append((j, ring.acquire()))
+        except shm_ring.SlotsExhausted:
+            rest.append(j)
+    try:
+        refs = await asyncio.to_thread(_fill_slots, ring, [(index, group[j][0]) for j, index in held], size)
+        jobs = []
+        for (j, _), ref in zip(held, refs):
+            if ref is None:
+                rest.append(j)
+            else:
+                jobs.append((j, ref))
+        if jobs:
+            metas = await executor.run(
+                shm_ring.count_slots, ring.spec, [ref for _, ref in jobs], size,
+                [group[j][1] for j, _ in jobs], [group[j][2] for j, _ in jobs], backend,
+                [group[j][4] for j, _ in jobs],
+            )
+            for (j, ref), meta in zip(jobs, metas):
+                if meta.get('stale') or meta.get('fallback'):
+                    ring.stale += 1 if meta.get('stale') else 0
+                    rest.append(j)
+                    continue
+                count = float(ring.counts[ref[0]])
+                results[j] = {'count': None if math.isnan(count) else int(round(count)), **meta}
+    finally:
+        for _, index in held:
+            ring.release(index)
+    return results, sorted(rest)
+
+
+async def _run_count_batch(items):
+    """Count a batch of queued (image bytes, want density map, area m², QoS tier, cascade zone) items in the inference executor.
+
+    Items of different QoS tiers go to the executor as separate calls. With
+    worker processes, images travel as shared-memory tensor slots (see
+    shm_ring) rather than pickled bytes where a slot is free.
+    """
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item[3], []).append(i)
+
+    async def _run(tier, slots):
+        size, backend = qos_tier_model(tier)
+        group = [items[i] for i in slots]
+        out, rest = [None] * len(group), list(range(len(group)))
+        ring = _get_tensor_ring()
+        if ring is not None:
+            out, rest = await _count_via_ring(ring, group, size, backend)
+        if rest:
+            counted = await executor.run(
+                inference_pipeline.count_images,
+                [group[j][0] for j in rest], size, [group[j][1] for j in rest], [group[j][2] for j in rest], backend,
+                [group[j][4] for j in rest],
+            )
+            for j, result in zip(rest, counted):
+                out[j] = result
+        return out
+
+    results = [None] * len(items)
+    outputs = await asyncio.gather(*(_run(tier, slots) for tier, slots in groups.items()))
+    for slots, out in zip(groups.values(), outputs):
+        for i, result in zip(slots, out):
+            results[i] = result
+    return results
+
+
+batcher = BatchScheduler(
+    _run_count_batch,
+    max_batch_size=settings.inference_batch_size,
+    max_wait_ms=settings.inference_batch_wait_ms,
+    concurrency=max(1, executor.workers),
+)
+
+result_cache = ResultCache(
+    max_bytes=int(settings.inference_cache_mb * 1024 * 1024),
+    ttl_s=settings.inference_cache_ttl_s,
+)
+
+density_maps = DensityMapStore(settings.density_map_dir, max_side=settings.density_map_max_side)
+
+cascade_stats = CascadeStats(settings.inference_cascade_size, settings.inference_input_size)
+
+
+def _parse_bool(v):
+    if v is None:
+        return False
+    if isinstance(v, bool):
+        return v
+    s = str(v).lower()
+    return s in ('1','true','yes','y')
+
+
+def _parse_float(v):
+    try:
+        return float(v) if v not in (None, '') else None
+    except Exception:
+        return None
+
+
+def _archive_limits():
+    """Keyword arguments capping what `iu.iter_archive_images` may unpack from one upload."""
+    return {
+        'max_files': settings.inference_batch_max_files,
+        'max_member_bytes': int(settings.inference_archive_max_image_mb * 1024 * 1024),
+        'max_total_bytes': int(settings.inference_archive_max_total_mb * 1024 * 1024),
+    }
+
+
+def _queue_pressure():
+    """Interactive images waiting for inference, as a fraction of the configured queue depth.
+
+    Bulk waiters are left out: their queue is unbounded by design, and one
+    large batch would otherwise degrade (and shed) every other client.
+    """
+    return (admission.waiting(bulk=False) + batcher.queue_depth) / float(max(1, settings.inference_queue_depth))
+
+
+def _cascade_zone(event_id: Optional[str], area_name: Optional[str], source_id: Optional[str]) -> Optional[str]:
+    """Key of the cascade calibration a frame uses: its source's zone, else its event area, else the shared one."""
+    if source_id:
+        return source_zone_key(event_id, area_name, source_id)
+    if area_name:
+        return f"{event_id or '-'}:{area_name}"
+    return None
+
+
+async def _count_contents(contents: bytes, tiled: bool = False, density_map: bool = False,
+                          area_m2: Optional[float] = None, priority: bool = False, bulk: bool = False,
+                          zone: Optional[str] = None):
+    """Count one image through the result cache and the micro-batcher.
+
+    `contents` is the encoded image, or a decoded PIL image (raw WebSocket
+    frames), which skips the cache.
+
+    With `tiled` the image is split into overlapping native-resolution tiles
+    that form their own batch, so it goes straight to the executor. With
+    `density_map` the result also carries the downsampled density map; those
+    results bypass the cache. A known `area_m2` lets the cascade answer
+    clear-cut frames from the cheap tier, scaled by the calibration of
+    `zone` (see _cascade_zone).
+    Cache misses wait for an admission slot in the `priority` or routine lane
+    (`bulk` work waits without a depth limit or timeout). Under overload the
+    QoS tier degrades the count (smaller input, quantized backend, NumPy
+    estimate; bulk work stops at the cheapest model tier); the result reports
+    it as `qos_tier`, and only full-quality results are cached. The estimate
+    tier skips admission but still runs in the executor.
+    Returns (result, cached). Raises AdmissionRejected / AdmissionTimeout, and
+    asyncio.TimeoutError / InferenceWorkerError from the executor.
+    """
+    key = None
+    if not density_map and isinstance(contents, (bytes, bytearray, memoryview)):
+        if tiled:
+            key = cache_key(contents, registry.version(), tile_size=settings.inference_tile_size,
+                            overlap=settings.inference_tile_overlap, max_pixels=settings.inference_tile_max_pixels)
+        else:
+            cascade_area = area_m2 if settings.inference_cascade else None
+            key = cache_key(contents, registry.version(), target_size=TARGET_SIZE, area_m2=cascade_area,
+                            zone=zone if cascade_area else None)
+        result = result_cache.get(key)
+        if result is not None:
+            return result, True
+    tier = qos.update(_queue_pressure())
+    if tier == 'estimate' and (density_map or bulk):
+        # The estimator has no density map, and bulk counts are saved; use the cheapest model tier
+        tier = qos.tiers[qos.tiers.index('estimate') - 1]
+    if tier == 'estimate':
+        # Runs in the executor like every count, but without an admission
+        # slot: it is the answer for when the queue is full, and is cheap
+        result = await executor.run(inference_pipeline.estimate_count, contents)
+    else:
+        # Decoding, the forward pass and the LWCC/heuristic fallbacks all run
+        # in the inference executor; this coroutine only waits for the result.
+        async with admission.slot(priority=priority, bulk=bulk):
+            if tiled and tier == QOS_FULL:
+                result = await executor.run(
+                    inference_pipeline.count_image_tiled, contents,
+                    settings.inference_tile_size, settings.inference_tile_overlap,
+                    settings.inference_tile_max_pixels, density_map,
+                )
+            else:
+                result = await batcher.submit((contents, density_map, area_m2, tier, zone))
+    result['qos_tier'] = tier
+    qos.record(tier)
+    # Sample again on the way out, so the pressure seen last is the drained queue
+    qos.update(_queue_pressure())
+    cascade_stats.record(result)
+    if key is not None and tier == QOS_FULL and result['count'] is not None:
+        result_cache.put(key, result)
+    return result, False
+
+
+async def _attach_density_map(record, density):
+    """Store `density` for a crowd_density record; returns True if a map was saved."""
+    if density is None:
+        return False
+    record['density_map'] = await asyncio.to_thread(
+        density_maps.save, record['id'], density, record.get('event_id'))
+    return True
+
+
+def _density_record(count, radius_m, event_id, area_name):
+    """Build a `crowd_density` document for an inference result."""
+    record = {
+        'id': generate_density_id(),
+        'timestamp': datetime.utcnow(),
+        'person_count': int(count),
+        'radius_m': float(radius_m) if radius_m else 0.0,
+        'event_id': event_id,
+        'area_name': area_name,
+        'location': None,
+    }
+    # calculate derived metrics
+    return calculate_density(record)
+
+
+async def _read_upload(upload) -> bytes:
+    """Read an uploaded file fully into memory, rejecting empty uploads."""
+    # Seek to beginning first in case it was read before
+    await upload.seek(0)
+    contents = await upload.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty file uploaded")
+    return contents
+
 
 @router.post('/count')
 async def infer_count(request: Request, 
@@ -17,221 +319,122 @@ file: UploadFile = File(None)):
     - If `save_record` is true, the endpoint will attempt to persist a
       crowd-density record into the existing `crowd_density` collection
       (if available in the application scope).
+    - If `tiled` is true, large images are counted as overlapping
+      native-resolution tiles instead of being shrunk to the model input size;
+      the response reports the tile count and time per tile.
+    - If `save_density_map` is also true (with `save_record`), the model's
+      density map is stored, downsampled, with the record so regions can be
+      recounted later via `/inference/recount`.
+    - If `camera_id` (with `event_id`) names a camera that has area polygons
+      (see `/camera-masks`), the frame is also counted inside each polygon
+      and the response lists per-area counts; with `save_record` one record
+      is saved per area instead of one for the whole frame.
+    - Frames that name their source (`source_id`, or `camera_id`) are checked
+      against that source's last counted frame; a near-identical frame reuses
+      that count (`deduplicated: true`) instead of running the model. The
+      threshold is the event's `frame_dedup_threshold`.
+    - Frames that name their source are scheduled per source (within the
+      event and `area_name`) by its density level and trend:
+      `schedule.next_frame_in_s` says when to send the next frame. A frame
+      that arrives well before it is due gets that source's last count back
+      (`throttled: true`) and is not saved, which keeps the node within
+      `inference_budget_fps`.
+    - `qos_tier` says how the frame was counted: 'full', or under overload
+      'reduced', 'quantized' or 'estimate' (see `/inference/stats`).
+    - Inference is admission-controlled: frames of zones already at
+      Risky/Overcrowded, or sent by a medical/police `user_id`, take the
+      priority lane. When the queue is full the request gets 429 (or 503
+      after waiting too long) with a `Retry-After` header.
     """
-    # If FastAPI provided an UploadFile (standard multipart handling), prefer it — this works with Postman
-    if file is not None:
-        upload = file
-        save_record = False
-        radius_m = None
-        event_id = None
-        area_name = None
-        # try to parse optional form fields from request.form() if present
-        try:
-            form = await request.form()
-            def _parse_bool(v):
-                if v is None:
-                    return False
-                if isinstance(v, bool):
-                    return v
-                s = str(v).lower()
-                return s in ('1','true','yes','y')
-            save_record = _parse_bool(form.get('save_record'))
-            radius_raw = form.get('radius_m')
-            try:
-                radius_m = float(radius_raw) if radius_raw not in (None, '') else None
-            except Exception:
-                radius_m = None
-            event_id = form.get('event_id')
-            area_name = form.get('area_name')
-        except Exception:
-            # form may not be present or python-multipart missing; continue with defaults
-            pass
+    form = {}
+    try:
+        form = await request.form()
+    except Exception as e:
+        # If FastAPI provided an UploadFile (standard multipart handling) the optional
+        # fields just keep their defaults; otherwise the form is required.
+        if file is None:
+            raise HTTPException(status_code=400, detail=f"Unable to parse form data: {e}\nInstall python-multipart if using multipart form uploads.")
 
-        suffix = Path(getattr(upload, 'filename', 'upload.jpg')).suffix or '.jpg'
-        
-        # Read upload contents - seek to beginning first
-        await upload.seek(0)
-        contents = await upload.read()
-        
-        # Validate that we have image data
-        if not contents or len(contents) == 0:
-            raise HTTPException(status_code=400, detail="Empty file uploaded")
-        
-        print(f"[DEBUG] Direct upload: {len(contents)} bytes, suffix: {suffix}")
-        
-        # Create temp file and write contents
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, mode='wb')
-        bytes_written = tmp.write(contents)
-        tmp.flush()
-        os.fsync(tmp.fileno())  # Force write to disk
-        tmp_path = tmp.name
-        tmp.close()  # Close but don't delete (delete=False)
-        
-        # Verify the file was written correctly
-        actual_size = os.path.getsize(tmp_path)
-        print(f"[DEBUG] Temp file created: {tmp_path}, wrote {bytes_written} bytes, actual size: {actual_size} bytes")
-        
-        if actual_size == 0:
-            raise HTTPException(status_code=500, detail=f"Failed to write temp file - size is 0 bytes")
-    else:
-        # Fallback: parse form data (older behavior). This requires python-multipart installed at runtime.
+    upload = file if file is not None else form.get('file')
+    if upload is None:
+        raise HTTPException(status_code=400, detail='Missing form field "file"')
+
+    save_record = _parse_bool(form.get('save_record'))
+    radius_m = _parse_float(form.get('radius_m'))
+    event_id = form.get('event_id')
+    area_name = form.get('area_name')
+    tiled = _parse_bool(form.get('tiled'))
+    save_density_map = save_record and _parse_bool(form.get('save_density_map'))
+    camera_id = form.get('camera_id')
+
+    # The image stays in memory: it is decoded straight from these bytes, and
+    # only backends that need a path (LWCC) write a temp file.
+    contents = await _read_upload(upload)
+    print(f"[DEBUG] Received upload: {len(contents)} bytes")
+
+    masks = None
+    masks_error = None
+    if event_id and camera_id:
         try:
-            form = await request.form()
+            masks = await roi_masks.get(event_id, camera_id)
         except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Unable to parse form data: {e}\nInstall python-multipart if using multipart form uploads.")
+            masks_error = f'Unable to load camera masks: {e}'
 
-        upload = form.get('file')
-        if upload is None:
-            raise HTTPException(status_code=400, detail='Missing form field "file"')
+    need_map = save_density_map or masks is not None
+    source_id = form.get('source_id') or camera_id
+    zone_key = source_zone_key(event_id, area_name, source_id)
+    throttled = None
+    if zone_scheduler.enabled and zone_key:
+        throttled = zone_scheduler.early_result(zone_key)
+        if throttled is not None and need_map and 'density_map' not in throttled:
+            throttled = None
 
-        def _parse_bool(v):
-            if v is None:
-                return False
-            if isinstance(v, bool):
-                return v
-            s = str(v).lower()
-            return s in ('1','true','yes','y')
-
-        save_record = _parse_bool(form.get('save_record'))
-        radius_raw = form.get('radius_m')
+    dedup_key = thumb = reused = None
+    if throttled is None and frame_dedup.enabled and source_id:
         try:
-            radius_m = float(radius_raw) if radius_raw not in (None, '') else None
-        except Exception:
-            radius_m = None
-        event_id = form.get('event_id')
-        area_name = form.get('area_name')
-
-        # Write upload to a temporary file
-        suffix = Path(getattr(upload, 'filename', 'upload.jpg')).suffix or '.jpg'
-        
-        # Read upload contents - seek to beginning first in case it was read before
-        await upload.seek(0)
-        contents = await upload.read()
-        
-        # Validate that we have image data
-        if not contents or len(contents) == 0:
-            raise HTTPException(status_code=400, detail="Empty file uploaded")
-        
-        print(f"[DEBUG] Received upload: {len(contents)} bytes, suffix: {suffix}")
-        
-        # Create temp file and write contents
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, mode='wb')
-        bytes_written = tmp.write(contents)
-        tmp.flush()
-        os.fsync(tmp.fileno())  # Force write to disk
-        tmp_path = tmp.name
-        tmp.close()  # Close but don't delete (delete=False)
-        
-        # Verify the file was written correctly
-        actual_size = os.path.getsize(tmp_path)
-        print(f"[DEBUG] Temp file created: {tmp_path}, wrote {bytes_written} bytes, actual size: {actual_size} bytes")
-        
-        if actual_size == 0:
-            raise HTTPException(status_code=500, detail=f"Failed to write temp file - size is 0 bytes")
+            threshold = await frame_dedup.threshold_for(event_id)
+            thumb = await asyncio.to_thread(frame_thumbnail, contents)
+            dedup_key = f"{event_id or '-'}:{source_id}:{'tiled' if tiled else 'full'}"
+            reused = frame_dedup.match(dedup_key, thumb, threshold)
+        except Exception as e:
+            print(f"[DEBUG] Frame dedup skipped: {e}")
+            dedup_key = None
+        if reused is not None and need_map and 'density_map' not in reused:
+            reused = None
 
     count = None
     backend_error = None
-    # Try to use inference_utils (preferred)
+    cached = False
     try:
-        from .. import inference_utils as iu  # relative import
-    except Exception:
-        iu = None
-
-    # Try torch-based model if available via inference_utils
-    try:
-        if iu is not None:
-            model_path = os.getenv('MODEL_PATH', './model_weights.pt')
-            device = 'cuda' if getattr(iu, 'torch', None) and iu.torch.cuda.is_available() else 'cpu'
-            model = iu.load_model(str(model_path), device=device)
-            if model is not None:
-                tensor = iu.preprocess_image(tmp_path, target_size=(512,512))
-                c, _ = iu.infer_image(model, tensor, device=device)
-                count = int(round(float(c)))
+        if throttled is not None:
+            result = throttled
+        elif reused is not None:
+            result = reused
+        else:
+            area_m2 = math.pi * radius_m ** 2 if radius_m else None
+            priority = zone_scheduler.is_priority(zone_key)
+            if not priority and admission.enabled and form.get('user_id'):
+                try:
+                    priority = await admission.is_priority_user(form.get('user_id'))
+                except Exception as e:
+                    print(f"[DEBUG] User role lookup failed: {e}")
+            result, cached = await _count_contents(contents, tiled=tiled, density_map=need_map, area_m2=area_m2,
+                                                   priority=priority, zone=_cascade_zone(event_id, area_name, source_id))
+            if dedup_key is not None and result['count'] is not None:
+                frame_dedup.remember(dedup_key, thumb, result)
+        count = result['count']
+        backend_error = result['error']
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    except AdmissionTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail='Inference timed out')
+    except InferenceWorkerError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         backend_error = str(e)
 
-    # Fallback to LWCC if still None
-    # Note: LWCC has a critical bug - uses hardcoded /.lwcc path which is read-only on macOS
-    # Even importing LWCC can fail if it tries to create /.lwcc during initialization
-    if count is None:
-        lwcc_error = None
-        try:
-            from lwcc import LWCC
-            c = LWCC.get_count([tmp_path], model_name='DM-Count', model_weights='SHA', resize_img=True)
-            count = int(round(float(c)))
-            print(f"[DEBUG] LWCC SUCCESS! Count: {count}")
-        except (OSError, PermissionError, FileNotFoundError) as e:
-            # LWCC failed due to filesystem issues - use fallback
-            lwcc_error = e
-            print(f"[DEBUG] LWCC failed with filesystem error: {e}")
-        except Exception as e:
-            # Other LWCC errors
-            lwcc_error = e
-            print(f"[DEBUG] LWCC failed: {e}")
-        
-        # Use fallback if LWCC failed
-        if count is None:
-            print(f"[DEBUG] Using fallback crowd estimation...")
-            print(f"[DEBUG] Temp file path: {tmp_path}")
-            print(f"[DEBUG] File exists: {os.path.exists(tmp_path)}")
-            try:
-                from PIL import Image
-                import numpy as np
-                
-                # Verify file exists and is readable
-                print(f"[DEBUG] Checking temp file: {tmp_path}")
-                if not os.path.exists(tmp_path):
-                    raise FileNotFoundError(f"Temp file not found: {tmp_path}")
-                
-                file_size = os.path.getsize(tmp_path)
-                print(f"[DEBUG] Temp file exists, size: {file_size} bytes")
-                
-                if file_size == 0:
-                    raise ValueError(f"Temp file is empty: {tmp_path}")
-                
-                # Open image and analyze
-                print(f"[DEBUG] Opening image with PIL...")
-                img = Image.open(tmp_path)
-                print(f"[DEBUG] Image opened successfully: {img.format} {img.size} {img.mode}")
-                img_array = np.array(img.convert('RGB'))
-                height, width = img_array.shape[:2]
-                
-                # Simple heuristic: detect regions with skin-tone-like colors
-                # This is a rough estimation, not accurate crowd counting
-                lower_skin = np.array([80, 50, 50], dtype=np.uint8)
-                upper_skin = np.array([255, 200, 180], dtype=np.uint8)
-                
-                skin_mask = np.all((img_array >= lower_skin) & (img_array <= upper_skin), axis=2)
-                skin_pixel_count = np.sum(skin_mask)
-                
-                # Estimate: assume average person occupies ~5000 pixels in typical crowd photo
-                total_pixels = height * width
-                if total_pixels > 0:
-                    density_ratio = skin_pixel_count / total_pixels
-                    # Rough estimation formula
-                    estimated_count = max(1, int(density_ratio * total_pixels / 3000))
-                    count = min(estimated_count, 1000)  # Cap at reasonable maximum
-                    
-                print(f"[DEBUG] Fallback estimation: {count} people (approximation)")
-                backend_error = f"LWCC unavailable (filesystem error), using fallback estimation"
-            except ImportError as e:
-                print(f"[DEBUG] Fallback failed - missing dependencies: {e}")
-                backend_error = f"LWCC error: {lwcc_error}; Fallback error: Missing PIL or NumPy - install with 'pip install Pillow numpy'"
-            except Exception as fallback_error:
-                print(f"[DEBUG] Fallback failed: {type(fallback_error).__name__}: {fallback_error}")
-                # Provide more specific error message
-                error_msg = str(fallback_error)
-                if "cannot identify image file" in error_msg:
-                    backend_error = f"LWCC error: {lwcc_error}; Fallback error: Invalid or corrupted image file"
-                else:
-                    backend_error = f"LWCC error: {lwcc_error}; Fallback error: {fallback_error}"
-
-    # Clean up temporary file
-    try:
-        os.unlink(tmp_path)
-    except Exception:
-        pass
-
     if count is None:
         raise HTTPException(status_code=500, detail={
             'message': 'Could not run inference; no backend available',
@@ -241,7 +444,46 @@ file: UploadFile = File(None)):
     response = {
         'image_filename': getattr(upload, 'filename', 'uploaded'),
         'person_count': int(count),
+        'cached': cached,
     }
+    if result.get('tier'):
+        response['tier'] = result['tier']
+    if result.get('qos_tier'):
+        response['qos_tier'] = result['qos_tier']
+    if zone_scheduler.enabled and zone_key is not None:
+        if throttled is None:
+            level = value = None
+            if radius_m:
+                density = calculate_density({'radius_m': radius_m, 'person_count': count})
+                level, value = density['density_level'], density['people_per_m2']
+            else:
+                value = float(count)
+            zone_scheduler.observe(zone_key, result, value, level)
+        response['throttled'] = throttled is not None
+        response['schedule'] = zone_scheduler.advice(zone_key)
+    if dedup_key is not None:
+        response['deduplicated'] = reused is not None
+        response['frame_change'] = result.get('change') if reused is not None else None
+        if reused is not None:
+            response['reused_from'] = datetime.utcfromtimestamp(reused['counted_at']).isoformat()
+    if tiled:
+        response['tiled'] = result.get('tiled', False)
+        for key in ('tiles', 'tile_size', 'overlap', 'scale', 'total_ms', 'ms_per_tile'):
+            if key in result:
+                response[key] = result[key]
+
+    # Per-area counts: one multiply-sum of the density map with the camera's masks
+    area_counts = None
+    if masks is not None:
+        if result.get('density_map') is not None:
+            area_counts = {name: int(round(c)) for name, c in masks.area_counts(result['density_map']).items()}
+            response['camera_id'] = camera_id
+            response['areas'] = [{'area_name': name, 'person_count': c} for name, c in area_counts.items()]
+        else:
+            masks_error = 'Per-area counts need the density model; only the whole frame was counted'
+    if masks_error:
+        response['areas'] = None
+        response['areas_error'] = masks_error
 
     # Optionally compute density if radius provided
     if radius_m:
@@ -254,24 +496,36 @@ file: UploadFile = File(None)):
             pass
 
     # Optionally save into crowd_density collection if available
-    if save_record:
+    if save_record and throttled is not None:
+        # A throttled frame repeats the source's last count; saving it would log a stale count as new
+        response['saved'] = False
+        response['save_skipped'] = 'throttled'
+    elif save_record and area_counts is not None:
         try:
-            # import here to avoid circular imports at module load
-            from ..routes.crowd_density import generate_density_id, calculate_density, crowd_density_collection
-            from datetime import datetime
-            record = {
-                'id': generate_density_id(),
-                'timestamp': datetime.utcnow(),
-                'person_count': int(count),
-                'radius_m': float(radius_m) if radius_m else 0.0,
-                'event_id': event_id,
-                'area_name': area_name,
-                'location': None,
-            }
-            # calculate derived metrics
-            record = calculate_density(record)
+            records = []
+            for name, c in area_counts.items():
+                record = _density_record(c, masks.radii.get(name), event_id, name)
+                record['camera_id'] = camera_id
+                records.append(record)
+            if save_density_map and records:
+                # One map per frame, shared by that frame's area records
+                response['density_map_saved'] = await _attach_density_map(records[0], result.get('density_map'))
+                for record in records[1:]:
+                    record['density_map'] = records[0].get('density_map')
+            if records:
+                await database["crowd_density"].insert_many(records, ordered=False)
+            response['saved'] = len(records)
+            response['record_ids'] = [r['id'] for r in records]
+        except Exception as e:
+            response['saved'] = 0
+            response['save_error'] = str(e)
+    elif save_record:
+        try:
+            record = _density_record(count, radius_m, event_id, area_name)
+            if save_density_map:
+                response['density_map_saved'] = await _attach_density_map(record, result.get('density_map'))
             # insert (best effort)
-            await crowd_density_collection.insert_one(record)
+            await database["crowd_density"].insert_one(record)
             response['saved'] = True
             response['record_id'] = record['id']
         except Exception as e:
@@ -280,3 +534,469 @@ file: UploadFile = File(None)):
             response['save_error'] = str(e)
 
     return response
+
+
+@router.post('/count-batch')
+async def infer_count_batch(request: Request):
+    """Count people in many images in one request.
+
+    Form fields:
+    - `files` (repeatable): image files, or a single zip/tar(.gz) archive of images.
+      Archives are unpacked off the event loop. An archive is rejected (400) if
+      one image is larger than `inference_archive_max_image_mb` uncompressed,
+      or all its images together exceed `inference_archive_max_total_mb`.
+    - `save_record`, `save_density_map`, `radius_m`, `event_id`: as for
+      `/inference/count`, applied to every image.
+    - `metadata` (optional JSON): per-file overrides keyed by filename, e.g.
+      `{"gate1.jpg": {"area_name": "Gate 1", "radius_m": 12}}`. `area_name`
+      defaults to the file name without extension.
+
+    All images go through the shared micro-batcher, so they are counted in as
+    few forward passes as the batch size allows. With `save_record` the
+    crowd-density records are written with a single `insert_many`. The images
+    queue in the routine admission lane and are never rejected, but frames
+    in the priority lane go first.
+    """
+    try:
+        form = await request.form()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unable to parse form data: {e}\nInstall python-multipart if using multipart form uploads.")
+
+    uploads = [u for u in form.getlist('files') + form.getlist('file') if hasattr(u, 'read')]
+    if not uploads:
+        raise HTTPException(status_code=400, detail='Missing form field "files"')
+
+    save_record = _parse_bool(form.get('save_record'))
+    save_density_map = save_record and _parse_bool(form.get('save_density_map'))
+    default_radius = _parse_float(form.get('radius_m'))
+    default_event_id = form.get('event_id')
+    try:
+        metadata = json.loads(form.get('metadata') or '{}')
+        if not isinstance(metadata, dict):
+            raise ValueError('metadata must be a JSON object')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f'Invalid metadata: {e}')
+
+    def _meta_for(name):
+        return metadata.get(name) or metadata.get(Path(name).name) or {}
+
+    async def _count_one(name, contents):
+        radius_m = _parse_float(_meta_for(name).get('radius_m')) or default_radius
+        area_m2 = math.pi * radius_m ** 2 if radius_m else None
+        try:
+            result, cached = await _count_contents(contents, density_map=save_density_map, area_m2=area_m2, bulk=True)
+        except asyncio.TimeoutError:
+            return {'image_filename': name, 'person_count': None, 'error': 'Inference timed out'}
+        except Exception as e:
+            return {'image_filename': name, 'person_count': None, 'error': str(e)}
+        item = {'image_filename': name, 'person_count': result['count'], 'cached': cached}
+        if result.get('tier'):
+            item['tier'] = result['tier']
+        if result.get('qos_tier'):
+            item['qos_tier'] = result['qos_tier']
+        if result['count'] is None:
+            item['error'] = result['error']
+        if save_density_map:
+            # Kept out of the response; popped before it is built
+            item['_density_map'] = result.get('density_map')
+        return item
+
+    # Each image is queued as soon as it has been read, so the batcher can
+    # start counting while the rest of the upload / archive is still unpacked.
+    tasks = []
+    for upload in uploads:
+        contents = await _read_upload(upload)
+        filename = getattr(upload, 'filename', None) or 'uploaded'
+        if len(uploads) == 1 and iu.is_archive(filename, contents):
+            try:
+                # Decompression runs in the threadpool, one member at a time
+                async for name, data in iterate_in_threadpool(iu.iter_archive_images(contents, **_archive_limits())):
+                    tasks.append(asyncio.create_task(_count_one(name, data)))
+            except Exception as e:
+                for task in tasks:
+                    task.cancel()
+                raise HTTPException(status_code=400, detail=f'Unable to read archive: {e}')
+        else:
+            tasks.append(asyncio.create_task(_count_one(filename, contents)))
+        if len(tasks) > settings.inference_batch_max_files:
+            for task in tasks:
+                task.cancel()
+            raise HTTPException(status_code=413, detail=f'Too many images (max {settings.inference_batch_max_files})')
+
+    if not tasks:
+        raise HTTPException(status_code=400, detail='No images found in upload')
+    items = await asyncio.gather(*tasks)
+
+    maps = [item.pop('_density_map', None) for item in items]
+    response = {
+        'total_images': len(items),
+        'total_person_count': sum(i['person_count'] for i in items if i['person_count'] is not None),
+        'failed': sum(1 for i in items if i['person_count'] is None),
+        'images': items,
+    }
+
+    if save_record:
+        records = []
+        for item, density in zip(items, maps):
+            if item['person_count'] is None:
+                continue
+            meta = _meta_for(item['image_filename'])
+            record = _density_record(
+                item['person_count'],
+                _parse_float(meta.get('radius_m')) or default_radius,
+                meta.get('event_id', default_event_id),
+                meta.get('area_name') or Path(item['image_filename']).stem,
+            )
+            item['record_id'] = record['id']
+            if save_density_map:
+                try:
+                    item['density_map_saved'] = await _attach_density_map(record, density)
+                except Exception as e:
+                    item['density_map_saved'] = False
+                    item['density_map_error'] = str(e)
+            records.append(record)
+        try:
+            if records:
+                await database["crowd_density"].insert_many(records, ordered=False)
+            response['saved'] = len(records)
+        except Exception as e:
+            response['saved'] = 0
+            response['save_error'] = str(e)
+
+    return response
+
+
+@router.post('/count-video')
+async def infer_count_video(request: Request, file: UploadFile = File(None)):
+    """Count people over time in a video or an ordered frame sequence.
+
+    Form fields:
+    - `file`: a video (needs opencv-python), an animated GIF/WebP, or a zip/tar
+      of still frames ordered by filename.
+    - `frame_interval_s` (default 1.0): spacing of frames in a frame sequence.
+    - `max_fps` (optional): decode at most this many video frames per second.
+    - `change_threshold` (default 4.0): mean grayscale difference (0-255) below
+      which a frame reuses the previous count instead of running the model.
+    - `max_skip` (default 30): count at least every N+1 frames regardless.
+    - `smoothing` (default 0.5): EMA weight of the newest count; 1 disables it.
+
+    Returns one entry per decoded frame with the raw and smoothed count and
+    whether the model actually ran on it.
+
+    Frames are decoded and change-checked in the threadpool. The frames that
+    need counting go through admission control (routine lane, bulk) and the
+    micro-batcher, at most `inference_batch_size` at a time. A long video
+    therefore shares the inference workers with `/count` rather than holding
+    one for the whole upload. Archives of frames get the `/count-batch` limits.
+    """
+    try:
+        form = await request.form()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unable to parse form data: {e}\nInstall python-multipart if using multipart form uploads.")
+    upload = file if file is not None else form.get('file')
+    if upload is None:
+        raise HTTPException(status_code=400, detail='Missing form field "file"')
+    contents = await _read_upload(upload)
+
+    def _opt(name, default):
+        value = _parse_float(form.get(name))
+        return default if value is None else value
+
+    smoothing = _opt('smoothing', 0.5)
+    if not 0 < smoothing <= 1:
+        raise HTTPException(status_code=400, detail='smoothing must be in (0, 1]')
+    counter = inference_video.StreamCounter(
+        _opt('change_threshold', 4.0), int(_opt('max_skip', 30)), smoothing, settings.inference_batch_size)
+    frames = inference_video.iter_frames(
+        contents, getattr(upload, 'filename', '') or '', frame_interval_s=_opt('frame_interval_s', 1.0),
+        max_fps=_parse_float(form.get('max_fps')), archive_limits=_archive_limits())
+
+    async def _count_frame(image):
+        try:
+            result, _ = await _count_contents(image, bulk=True)
+            return result['count']
+        except (asyncio.TimeoutError, InferenceWorkerError):
+            raise
+        except Exception:
+            return None
+
+    async def _count_frames():
+        async for chunk in iterate_in_threadpool(counter.chunks(frames)):
+            counter.add_counts(await asyncio.gather(*(_count_frame(img) for img in chunk)))
+
+    try:
+        await asyncio.wait_for(_count_frames(), settings.inference_video_timeout_s)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail='Video inference timed out')
+    except InferenceWorkerError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=f'Unable to decode video: {e}')
+
+    result = counter.result()
+    result['video_filename'] = getattr(upload, 'filename', 'uploaded')
+    return result
+
+
+async def _count_stream_frame(frame, event_id, area_name, radius_m, zone_id, save_record, cameras):
+    """Count one WebSocket frame; returns the reply message (without `credits`)."""
+    reply = {'camera_id': frame.camera_id, 'ts': frame.ts}
+    area = area_name or frame.camera_id
+    zone_key = source_zone_key(event_id, area, frame.camera_id)
+    start = time.perf_counter()
+    throttled = zone_scheduler.early_result(zone_key) if zone_scheduler.enabled else None
+    try:
+        if throttled is not None:
+            result, cached = throttled, False
+        else:
+            image = frame.image()
+            area_m2 = math.pi * radius_m ** 2 if radius_m else None
+            result, cached = await _count_contents(image, area_m2=area_m2, priority=zone_scheduler.is_priority(zone_key),
+                                                   zone=zone_key)
+    except (AdmissionRejected, AdmissionTimeout) as e:
+        stream_stats.shed += 1
+        return {'type': 'flow', **reply, 'shed': True, 'retry_after_s': e.retry_after}
+    except asyncio.TimeoutError:
+        stream_stats.errors += 1
+        return {'type': 'error', **reply, 'error': 'Inference timed out'}
+    except Exception as e:
+        stream_stats.errors += 1
+        return {'type': 'error', **reply, 'error': str(e)}
+    if result['count'] is None:
+        stream_stats.errors += 1
+        return {'type': 'error', **reply, 'error': result['error']}
+
+    stream_stats.counted += 1
+    count = int(result['count'])
+    reply.update({'type': 'count', 'person_count': count, 'cached': cached,
+                  'latency_ms': round((time.perf_counter() - start) * 1000.0, 1)})
+    if result.get('qos_tier'):
+        reply['qos_tier'] = result['qos_tier']
+    if zone_scheduler.enabled:
+        if throttled is None:
+            level, value = None, float(count)
+            if radius_m:
+                density = calculate_density({'radius_m': radius_m, 'person_count': count})
+                level, value = density['density_level'], density['people_per_m2']
+            zone_scheduler.observe(zone_key, result, value, level)
+        reply['throttled'] = throttled is not None
+        reply['schedule'] = zone_scheduler.advice(zone_key)
+    if save_record and event_id and throttled is None:
+        camera = cameras.get(frame.camera_id)
+        if camera is None:
+            camera = cameras[frame.camera_id] = CameraConfig(
+                frame.camera_id, event_id, 'websocket', zone_id=zone_id, area_name=area, radius_m=radius_m)
+        ingest.record(camera, result, datetime.utcfromtimestamp(frame.ts).isoformat(), observe=False)
+    return reply
+
+
+@router.websocket('/stream')
+async def stream_frames(websocket: WebSocket, event_id: Optional[str] = None, area_name: Optional[str] = None,
+                        radius_m: Optional[float] = None, zone_id: Optional[str] = None, save_record: bool = False):
+    """Persistent binary frame ingest for cameras; see ws_ingest for the frame format.
+
+    Frames skip the per-request HTTP and multipart overhead of
+    `/inference/count`, and raw uint8 frames also skip JPEG decoding. Each
+    frame is answered once on the socket with a JSON message ("count",
+    "error", "dropped" or "flow") carrying `credits`, the frames the camera
+    may send before its next answer. Frames beyond that are coalesced: the
+    newest waits and older waiting frames are answered "dropped". While the
+    inference queue is full, frames are shed with a "flow" answer and
+    `retry_after_s`.
+    With `save_record` (and `event_id`), counts are written in bulk to
+    `crowd_density` and, given `zone_id`, to the zone (see camera_ingest).
+    """
+    await websocket.accept()
+    if save_record and zone_id is not None and not ObjectId.is_valid(zone_id):
+        await websocket.close(code=1008, reason=f'zone_id {zone_id!r} is not a zone ObjectId')
+        return
+    stream_stats.connections += 1
+    stream_stats.open += 1
+    window = FrameWindow(settings.inference_ws_max_inflight)
+    send_lock = asyncio.Lock()
+    tasks = set()
+    cameras = {}
+
+    async def send(message):
+        async with send_lock:
+            # Credits as of sending, so answers that overtake each other stay consistent
+            message['credits'] = window.credits
+            await websocket.send_json(message)
+
+    async def count_frames(frame):
+        while frame is not None:
+            try:
+                reply = await _count_stream_frame(frame, event_id, area_name, radius_m, zone_id, save_record, cameras)
+            except Exception as e:
+                stream_stats.errors += 1
+                reply = {'type': 'error', 'camera_id': frame.camera_id, 'ts': frame.ts, 'error': str(e)}
+            finally:
+                # Always give the credit back, or the connection loses it for good
+                frame = window.done()
+            try:
+                await send(reply)
+            except Exception:
+                return
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            data = message.get('bytes')
+            if data is None:
+                # Text messages are keep-alives
+                await send({'type': 'pong'})
+                continue
+            try:
+                frames = list(parse_frames(data, settings.inference_ws_max_frame_bytes))
+            except FrameError as e:
+                stream_stats.errors += 1
+                await send({'type': 'error', 'error': str(e)})
+                continue
+            for frame in frames:
+                stream_stats.frames += 1
+                stream_stats.bytes += len(frame.payload)
+                stream_stats.raw_frames += frame.format == FORMAT_RAW
+                if _queue_pressure() >= 1.0:
+                    stream_stats.shed += 1
+                    await send({'type': 'flow', 'camera_id': frame.camera_id, 'ts': frame.ts, 'shed': True,
+                                'retry_after_s': admission.retry_after()})
+                    continue
+                run, replaced = window.offer(frame)
+                if replaced is not None:
+                    stream_stats.dropped += 1
+                    await send({'type': 'dropped', 'camera_id': replaced.camera_id, 'ts': replaced.ts})
+                if run is not None:
+                    task = asyncio.create_task(count_frames(run))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stream_stats.open -= 1
+        for task in tasks:
+            task.cancel()
+
+
+def _recount_records(records, regions):
+    """Integrate each record's stored density map over `regions` (runs in a thread)."""
+    rows = []
+    for record in records:
+        meta = record.get('density_map') or {}
+        row = {
+            'record_id': record.get('id'),
+            'timestamp': record.get('timestamp'),
+            'event_id': record.get('event_id'),
+            'area_name': record.get('area_name'),
+            'person_count': record.get('person_count'),
+        }
+        try:
+            density = density_maps.load(meta['path'])
+            row['map_total'] = meta.get('total')
+            row['regions'] = density_maps.region_counts(density, regions)
+        except Exception as e:
+            row['regions'] = None
+            row['error'] = f'Density map unavailable: {e}'
+        rows.append(row)
+    return rows
+
+
+@router.post('/recount')
+async def recount_regions(body: DensityRecountRequest):
+    """Recount stored crowd_density records over new image regions, without the model.
+
+    Only records saved with `save_density_map` have a map to integrate over.
+    Regions are boxes or polygons in normalized image coordinates, so they can
+    redefine an event's areas after the fact; each map is read memory-mapped
+    and every region is one multiply-sum over it.
+    """
+    regions = {name: r.model_dump(exclude_none=True) for name, r in body.regions.items()}
+    for name, region in regions.items():
+        try:
+            region_polygon(region)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f'Invalid region "{name}": {e}')
+
+    query = {'density_map': {'$exists': True}}
+    if body.event_id:
+        query['event_id'] = body.event_id
+    if body.area_name:
+        query['area_name'] = body.area_name
+    if body.record_ids:
+        query['id'] = {'$in': body.record_ids}
+    if body.since or body.until:
+        query['timestamp'] = {}
+        if body.since:
+            query['timestamp']['$gte'] = body.since
+        if body.until:
+            query['timestamp']['$lte'] = body.until
+
+    records = await database["crowd_density"].find(query, {'_id': 0}).sort("timestamp", 1).to_list(body.limit)
+    rows = await asyncio.to_thread(_recount_records, records, regions)
+    return {'total_records': len(rows), 'records': rows}
+
+
+@router.get('/model')
+async def model_status():
+    """Report the shared inference model: device, load time, memory and warm-up.
+
+    The status comes from an inference worker, which is where the model lives.
+    """
+    return await executor.run(inference_pipeline.model_status)
+
+
+@router.get('/memory')
+async def inference_memory():
+    """RSS/PSS/USS of every API and inference worker process (Linux).
+
+    Under `serve.py` this covers the launcher and all its workers. The gap
+    between the summed RSS and the summed PSS is the memory saved by sharing
+    the preloaded model copy-on-write.
+    """
+    return await asyncio.to_thread(process_memory.memory_report)
+
+
+@router.get('/health')
+async def inference_health():
+    """Which backend an inference worker is serving counts from.
+
+    `active_backend` is 'model', 'lwcc' or 'heuristic'; `degraded` is true
+    whenever the primary model is not loaded.
+    """
+    return await executor.run(inference_pipeline.health_report)
+
+
+@router.get('/backends')
+async def compare_backends(images: int = 4, batch_size: int = 1):
+    """Latency and count drift of the int8 / frozen TorchScript / ONNX Runtime
+    backends against the fp32 baseline, measured on samplecrowd images.
+
+    Builds any missing backend artifacts, so the first call can be slow.
+    Select the serving backend with the `INFERENCE_BACKEND` setting.
+    """
+    try:
+        rows = await executor.run(inference_pipeline.compare_backends, images, batch_size,
+                                  timeout=max(settings.inference_timeout_s, 600.0))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail='Backend comparison timed out')
+    return {'active': settings.inference_backend, 'backends': rows}
+
+
+@router.get('/stats')
+async def inference_stats():
+    """Batching histograms, executor counters and cache statistics."""
+    return {
+        'admission': admission.stats(),
+        'qos': qos.stats(),
+        'shm': _tensor_ring.stats() if _tensor_ring is not None else {'enabled': False},
+        'batching': batcher.stats(),
+        'executor': executor.stats(),
+        'cache': result_cache.stats(),
+        'roi_masks': roi_masks.stats(),
+        'dedup': frame_dedup.stats(),
+        'cascade': cascade_stats.stats(),
+        'schedule': zone_scheduler.stats(),
+        'ingest': ingest.stats(),
+        'stream': stream_stats.stats(),
+    }
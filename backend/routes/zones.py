@@ -7,6 +7,17 @@ from bson import ObjectId
 
 router = APIRouter(prefix="/zones", tags=["Zones"])
 
+
+def zone_density_status(current_density: int, capacity: int) -> str:
+    """'crowded' / 'moderate' / 'low' from a zone's occupancy and capacity"""
+    ratio = current_density / capacity
+    if ratio >= 0.8:
+        return "crowded"
+    elif ratio >= 0.5:
+        return "moderate"
+    return "low"
+
+
 @router.post("/", response_model=Zone, status_code=201)
 async def create_zone(zone: ZoneCreate):
     """Create a new zone for crowd density tracking"""
@@ -89,14 +100,7 @@ async def update_zone_density(zone_id: str, current_density: int, density_status
     if not density_status:
         zone = await database["zones"].find_one({"_id": ObjectId(zone_id)})
         if zone and zone.get("capacity"):
-            ratio = current_density / zone["capacity"]
-            if ratio >= 0.8:
-                density_status = "crowded"
-            elif ratio >= 0.5:
-                density_status = "moderate"
-            else:
-                density_status = "low"
-            update_fields["density_status"] = density_status
+            update_fields["density_status"] = zone_density_status(current_density, zone["capacity"])
     else:
         update_fields["density_status"] = density_status
     
@@ -1,6 +1,8 @@
 """
 Entry point for running the Expense Splitter API
 Run from backend directory: python run.py
+(development: one process with auto-reload; for production use serve.py,
+which preloads the model and forks the workers)
 """
 import uvicorn
 import dotenv
@@ -16,5 +18,6 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=True
+        reload=True,
+        ws_per_message_deflate=False,
     )
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Production launcher: preload the model once, then fork the API workers.
+
+Run from the backend directory:
+    python serve.py --workers 4 --port 8000
+
+The parent process imports the app and loads the counting model before
+forking. It does not warm the model up. Each worker is a plain uvicorn server
+on the shared listening socket, and it inherits the weights copy-on-write.
+Tensor data is never written after loading, so those pages stay shared
+between all workers, and their inference pool processes (fork start method)
+share them too. The garbage collector is frozen before the fork, which stops
+later collections from touching, and so copying, the preloaded objects.
+
+Each worker warms up in its own lifespan. Workers that exit unexpectedly are
+restarted. SIGTERM/SIGINT stops all of them. A per-process RSS/PSS/USS report
+is printed once the workers are up (and every `--report-interval` seconds).
+The same report is available from `GET /inference/memory`.
+
+Use `python run.py` for development (single process, auto-reload).
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import dotenv
+
+dotenv.load_dotenv()
+
+
+def _run_worker(app, sock: socket.socket, args, threads: int):
+    """Body of a forked worker process; never returns."""
+    import uvicorn
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    try:
+        import inference_utils as iu
+        if iu.torch is not None:
+            iu.torch.set_num_threads(threads)
+    except Exception:
+        pass
+    # Camera frames (/inference/stream) are JPEG or raw pixels; deflating them costs more than it saves
+    config = uvicorn.Config(app, log_level=args.log_level, proxy_headers=True,
+                            timeout_keep_alive=args.keep_alive, ws_per_message_deflate=False)
+    uvicorn.Server(config).run(sockets=[sock])
+    os._exit(0)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Preload-then-fork production server.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="let every worker load its own model")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--report-after", type=float, default=15.0, help="seconds until the first memory report")
+    parser.add_argument("--report-interval", type=float, default=0.0, help="repeat the report every N seconds (0: once)")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, "fork"):
+        import uvicorn
+        print("⚠️  fork() is not available; starting uvicorn workers without model sharing")
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+        return 0
+
+    import process_memory
+    from config import settings
+
+    os.environ[process_memory.LAUNCHER_ENV] = str(os.getpid())
+    if settings.inference_workers == 0:
+        threads = max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    else:
+        # Each API worker's inference pool sizes its own processes
+        threads = 1
+    if args.preload:
+        from model_registry import registry
+        registry.load()
+        if registry.stats["model_bytes"]:
+            print(f"✓ Preloaded {registry.stats['model_bytes'] / 2 ** 20:.1f} MB of weights for "
+                  f"{args.workers} workers (pid {os.getpid()})")
+    from main import app
+
+    sock = socket.create_server((args.host, args.port), backlog=2048)
+    sock.set_inheritable(True)
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, sock, args, threads)
+        workers[pid] = index
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for i in range(args.workers):
+        spawn(i)
+    print(f"✓ Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    next_report = time.monotonic() + args.report_after
+    deadline = None
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            index = workers.pop(pid, None)
+            if index is not None and not stopping:
+                print(f"⚠️  Worker {pid} exited with status {status}; restarting")
+                time.sleep(1.0)
+                spawn(index)
+            continue
+        now = time.monotonic()
+        if stopping:
+            deadline = deadline or now + args.graceful_timeout
+            if now > deadline:
+                for pid in list(workers):
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+        elif next_report is not None and now >= next_report:
+            print(process_memory.format_report(process_memory.memory_report()))
+            next_report = now + args.report_interval if args.report_interval > 0 else None
+        time.sleep(0.2)
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Shared-memory tensor slots for handing images to inference worker processes.
+
+With `inference_workers > 0`, the API process decodes and preprocesses each
+queued image straight into a slot of a shared-memory ring. Each slot is a
+fixed-size float32 buffer big enough for one (3, input_size, input_size)
+tensor. Only a slot reference (index, generation, shape) crosses the process
+pool's pipe. The worker views the slot as a tensor without copying, and writes
+each count back into the ring's shared `counts` array. The result that goes
+back through the pipe is metadata only.
+
+Slots are allocated and released by the owning (API) process only. Releasing
+a slot bumps its generation. A worker that is still reading a slot after its
+caller gave up (timeout) then sees a stale reference and discards its result,
+instead of reporting a count for an image that has since been overwritten.
+When all slots are taken, `acquire` raises SlotsExhausted and the caller
+sends the encoded bytes instead. Exhaustion is counted in `stats()`.
+"""
+import math
+import threading
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import inference_utils as iu
+
+SlotRef = Tuple[int, int, Tuple[int, ...]]  # (slot index, generation, tensor shape)
+
+
+class SlotsExhausted(RuntimeError):
+    """Every slot of the ring is in use."""
+
+
+class StaleSlot(RuntimeError):
+    """The slot was released (and possibly reused) while a worker was reading it."""
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    """Map an existing block without registering it with this process's resource tracker.
+
+    A tracked attach would unlink the block when the worker exits (bpo-38119),
+    or unregister the owner's entry when the tracker is shared after fork.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class TensorRing:
+    """`slots` float32 buffers of `slot_shape` in one shared-memory block, plus per-slot counts."""
+
+    def __init__(self, slots: int, slot_shape: Sequence[int], name: Optional[str] = None, create: bool = True):
+        self.slots = int(slots)
+        self.slot_shape = tuple(int(v) for v in slot_shape)
+        self.slot_elems = math.prod(self.slot_shape)
+        data_bytes = self.slots * self.slot_elems * 4
+        size = data_bytes + self.slots * 16
+        self.owner = create
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size) if create else _attach_untracked(name)
+        self.data = np.ndarray((self.slots, self.slot_elems), dtype=np.float32, buffer=self.shm.buf)
+        self.generations = np.ndarray((self.slots,), dtype=np.int64, buffer=self.shm.buf, offset=data_bytes)
+        self.counts = np.ndarray((self.slots,), dtype=np.float64, buffer=self.shm.buf,
+                                 offset=data_bytes + self.slots * 8)
+        self._lock = threading.Lock()
+        self._free = deque(range(self.slots)) if create else deque()
+        self.peak_in_use = 0
+        self.acquired = 0
+        self.exhausted = 0
+        self.stale = 0
+
+    @property
+    def spec(self) -> Tuple[str, int, Tuple[int, ...]]:
+        """What a worker needs to attach to this ring."""
+        return self.shm.name, self.slots, self.slot_shape
+
+    @classmethod
+    def attach(cls, spec: Tuple[str, int, Tuple[int, ...]]) -> "TensorRing":
+        """This process's mapping of the ring described by `spec` (cached)."""
+        ring = _ATTACHED.get(spec[0])
+        if ring is None:
+            ring = _ATTACHED[spec[0]] = cls(spec[1], spec[2], name=spec[0], create=False)
+        return ring
+
+    @property
+    def in_use(self) -> int:
+        return self.slots - len(self._free)
+
+    def acquire(self) -> int:
+        with self._lock:
+            if not self._free:
+                self.exhausted += 1
+                raise SlotsExhausted(f"all {self.slots} shared-memory slots are in use")
+            index = self._free.popleft()
+            self.acquired += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            return index
+
+    def release(self, index: int):
+        with self._lock:
+            self.generations[index] += 1
+            self.counts[index] = np.nan
+            self._free.append(index)
+
+    def view(self, index: int, shape: Sequence[int]) -> np.ndarray:
+        """Slot `index` as an array of `shape` (no copy)."""
+        n = math.prod(shape)
+        if n > self.slot_elems:
+            raise ValueError(f"shape {tuple(shape)} does not fit a slot of {self.slot_shape}")
+        return self.data[index, :n].reshape(shape)
+
+    def write_image(self, index: int, source: Any, target_size: Tuple[int, int]) -> SlotRef:
+        """Decode and preprocess an encoded image straight into slot `index`."""
+        shape = (3,) + tuple(target_size)
+        out = self.view(index, shape)
+        pil = iu.open_image(source, min_size=(target_size[1], target_size[0]))
+        iu.get_preprocessor(target_size)(pil, out=out)
+        return index, int(self.generations[index]), shape
+
+    def read(self, ref: SlotRef) -> np.ndarray:
+        """The slot's tensor data for `ref`; raises StaleSlot if the slot was recycled."""
+        if not self.valid(ref):
+            raise StaleSlot(f"slot {ref[0]} was recycled")
+        return self.view(ref[0], ref[2])
+
+    def valid(self, ref: SlotRef) -> bool:
+        return int(self.generations[ref[0]]) == ref[1]
+
+    def close(self):
+        """Unmap the block; the owner also unlinks it."""
+        self.data = self.generations = self.counts = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (FileNotFoundError, BufferError):
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "slot_shape": list(self.slot_shape),
+            "slot_bytes": self.slot_elems * 4,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "acquired": self.acquired,
+            "exhausted": self.exhausted,
+            "stale": self.stale,
+        }
+
+
+_ATTACHED: Dict[str, TensorRing] = {}
+
+
+def count_slots(spec, refs: List[SlotRef], target_size: Tuple[int, int],
+                density_maps: Sequence[bool], areas_m2: Sequence[Optional[float]],
+                backend: Optional[str] = None,
+                zones: Optional[Sequence[Optional[str]]] = None) -> List[Dict[str, Any]]:
+    """Worker side: count the tensors in `refs` in place and write the counts into the ring.
+
+    Returns each result without its count (it is in `ring.counts`). A slot
+    that was recycled meanwhile gets `stale: True`. Without a model (LWCC and
+    the heuristic need the encoded image) every result is `fallback: True`,
+    and the caller sends the bytes instead.
+    """
+    import inference_pipeline
+    from model_registry import registry_for
+
+    reg = registry_for(backend, target_size[0]) if backend else inference_pipeline.registry
+    if reg.get() is None:
+        return [{'fallback': True} for _ in refs]
+    ring = TensorRing.attach(spec)
+    sources, metas = [], []
+    for ref in refs:
+        try:
+            sources.append(iu.torch.from_numpy(ring.read(ref)))
+        except StaleSlot:
+            sources.append(None)
+    live = [i for i, s in enumerate(sources) if s is not None]
+    results = inference_pipeline.count_images(
+        [sources[i] for i in live], target_size,
+        [density_maps[i] for i in live], [areas_m2[i] for i in live], backend,
+        [zones[i] for i in live] if zones else None,
+    ) if live else []
+    by_slot = dict(zip(live, results))
+    for i, ref in enumerate(refs):
+        result = by_slot.get(i)
+        if result is None or not ring.valid(ref):
+            metas.append({'stale': True})
+            continue
+        if result['backend'] != 'model':
+            metas.append({'fallback': True})
+            continue
+        count = result.pop('count')
+        ring.counts[ref[0]] = np.nan if count is None else float(count)
+        metas.append(result)
+    return metas
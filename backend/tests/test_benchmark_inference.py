@@ -0,0 +1,49 @@
+from pathlib import Path
+
+import pytest
+
+import benchmark_inference as bench
+
+
+def test_percentiles_use_nearest_rank():
+    stats = bench.percentiles([float(v) for v in range(1, 101)])
+    assert (stats["p50"], stats["p95"], stats["p99"]) == (50.0, 95.0, 99.0)
+    assert stats["mean"] == 50.5
+    assert bench.percentiles([])["p50"] is None
+
+
+def test_ground_truth_from_csv(tmp_path):
+    path = tmp_path / "truth.csv"
+    path.write_text("filename,count\nimages/1.jpg,12\n2.jpg,30.5\n")
+    assert bench.load_ground_truth(str(path)) == {"1.jpg": 12.0, "2.jpg": 30.5}
+
+
+def test_run_config_times_every_stage_and_scores_accuracy(tmp_path):
+    torch = pytest.importorskip("torch")
+
+    class Constant(torch.nn.Module):
+        def forward(self, x):
+            return torch.nn.functional.avg_pool2d(x[:, :1] * 0 + 1, 8) * 0.01
+
+    imgs = sorted((Path(__file__).resolve().parents[2] / "samplecrowd").glob("*.jpg"))[:3]
+    images = [(p.name, p.read_bytes()) for p in imgs]
+    row = bench.run_config(Constant().eval(), "torch", images, batch_size=2,
+                           target_size=(64, 64), repeats=2)
+
+    assert row["images"] == 6
+    assert set(row["stages_ms"]) == set(bench.STAGES)
+    assert row["latency_ms"]["p95"] >= row["latency_ms"]["p50"] > 0
+    # 8x8 cells of 0.01 per image
+    assert row["counts"][imgs[0].name] == pytest.approx(0.64, rel=1e-3)
+    truth = {imgs[0].name: 1.64, imgs[1].name: 0.64}
+    assert bench.accuracy(row["counts"], truth)["mae"] == pytest.approx(0.5, rel=1e-3)
+
+
+def test_compare_flags_throughput_and_p95_regressions():
+    def report(ips, p95):
+        return {"results": [{"backend": "torch", "threads": 1, "batch_size": 4, "image_set": "samplecrowd",
+                             "input_size": 512, "images_per_s": ips, "latency_ms": {"p95": p95}}]}
+
+    assert bench.compare(report(10.0, 100.0), report(9.5, 105.0)) == []
+    assert len(bench.compare(report(10.0, 100.0), report(8.0, 100.0))) == 1
+    assert len(bench.compare(report(10.0, 100.0), report(10.0, 130.0))) == 1
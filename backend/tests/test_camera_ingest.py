@@ -0,0 +1,110 @@
+import json
+import os
+import time
+
+import pytest
+
+from camera_ingest import CameraConfig, CameraIngest, CameraState, FolderReader, load_cameras
+
+ZONE = '65f0c0ffee0000000000abcd'
+
+
+def _touch(folder, name, mtime):
+    path = folder / name
+    path.write_bytes(name.encode())
+    os.utime(path, (mtime, mtime))
+
+
+def test_folder_reader_returns_the_newest_new_frame(tmp_path):
+    _touch(tmp_path, 'a.jpg', 100)
+    _touch(tmp_path, 'b.jpg', 200)
+    _touch(tmp_path, 'c.jpg.part', 300)
+    _touch(tmp_path, '.d.jpg', 300)
+    reader = FolderReader(str(tmp_path))
+    assert reader.read() == (b'b.jpg', 'b.jpg', 1)
+    assert reader.read() is None
+    _touch(tmp_path, 'e.png', 400)
+    assert reader.read() == (b'e.png', 'e.png', 0)
+
+
+def test_load_cameras_rejects_duplicate_ids(tmp_path):
+    config = tmp_path / 'cameras.json'
+    config.write_text(json.dumps({'cameras': [{'camera_id': 'c1', 'event_id': 'E', 'source': str(tmp_path)}] * 2}))
+    with pytest.raises(ValueError):
+        load_cameras(str(config))
+
+
+def test_camera_zone_id_must_be_an_object_id(tmp_path):
+    with pytest.raises(ValueError, match='zone_id'):
+        CameraConfig('c1', 'E', str(tmp_path), zone_id='gate-zone')
+    assert CameraConfig('c1', 'E', str(tmp_path), zone_id=ZONE).zone_id == ZONE
+
+
+async def test_frames_are_counted_and_written_in_bulk(tmp_path):
+    folders = [tmp_path / 'cam1', tmp_path / 'cam2']
+    for folder in folders:
+        folder.mkdir()
+    cameras = [CameraConfig(f'cam{i}', 'ingest-test', str(folder), zone_id=ZONE, radius_m=10)
+               for i, folder in enumerate(folders, 1)]
+    counts = iter([4, 9])
+    written = []
+
+    async def count(contents, **kwargs):
+        assert kwargs['bulk'] is True
+        return {'count': next(counts), 'error': None}, False
+
+    async def write(records, zones):
+        written.append((records, zones))
+
+    ingest = CameraIngest(flush_s=60)
+    ingest._write = write
+    ingest._count = count
+    ingest.cameras = {c.camera_id: CameraState(c, time.monotonic()) for c in cameras}
+    for folder in folders:
+        _touch(folder, 'f1.jpg', time.time())
+    for state in ingest.cameras.values():
+        await ingest.step(state)
+    await ingest.stop()  # stops the writer and flushes
+
+    assert len(written) == 1
+    records, zones = written[0]
+    assert [(r['camera_id'], r['person_count']) for r in records] == [('cam1', 4), ('cam2', 9)]
+    assert records[0]['density_level'] == 'Safe' and records[0]['event_id'] == 'ingest-test'
+    # Both cameras feed the same zone; only the latest count is written
+    assert list(zones) == [ZONE] and zones[ZONE]['current_density'] == 9
+    stats = ingest.stats()
+    assert stats['counted'] == 2 and stats['records_written'] == 2 and stats['zone_updates'] == 1
+
+
+async def test_failing_cameras_back_off_and_go_stale(tmp_path):
+    camera = CameraConfig('broken', 'ingest-test', str(tmp_path / 'missing'))
+    ingest = CameraIngest(backoff_s=1.0, backoff_max_s=4.0, stale_after_s=0.0)
+    state = CameraState(camera, time.monotonic())
+    delays = [await ingest.step(state) for _ in range(4)]
+    assert delays == [1.0, 2.0, 4.0, 4.0]
+    assert state.stale and state.errors == 4 and 'does not exist' in state.last_error
+
+
+def test_ingest_binds_to_the_running_loop_and_stops_its_writer(tmp_path):
+    import asyncio
+
+    ingest = CameraIngest(flush_s=60)
+    assert ingest._flush_now is None  # nothing bound at construction (import) time
+    written = []
+
+    async def write(records, zones):
+        written.append(len(records))
+
+    ingest._write = write
+    camera = CameraConfig('cam', 'ingest-test', str(tmp_path))
+
+    async def session():
+        ingest.record(camera, {'count': 3, 'error': None}, 'f.jpg', observe=False)
+        assert not ingest._writer.done()
+        await ingest.stop()
+        assert ingest._writer is None
+
+    # Two event loops, as TestClient or a restarted app would use
+    asyncio.run(session())
+    asyncio.run(session())
+    assert written == [1, 1]
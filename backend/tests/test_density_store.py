@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from density_store import DensityMapStore, downsample, polygon_mask
+
+
+def test_downsample_keeps_total_count():
+    density = np.random.default_rng(0).random((97, 130)).astype(np.float32)
+    small = downsample(density, max_side=32)
+    assert small.dtype == np.float16
+    assert max(small.shape) <= 32
+    assert float(small.sum(dtype=np.float64)) == pytest.approx(float(density.sum()), rel=1e-3)
+
+
+def test_polygon_mask_matches_box_and_triangle():
+    box = polygon_mask([[0, 0], [0.5, 0], [0.5, 0.5], [0, 0.5]], (8, 8))
+    assert box.sum() == 16 and box[:4, :4].all()
+    triangle = polygon_mask([[0, 0], [1, 0], [0, 1]], (10, 10))
+    assert 40 <= triangle.sum() <= 60  # about half the grid
+
+
+def test_saved_maps_are_memory_mapped_and_recounted_by_region(tmp_path):
+    store = DensityMapStore(str(tmp_path), max_side=16)
+    density = np.zeros((64, 64), dtype=np.float32)
+    density[:32, :32] = 10.0 / (32 * 32)  # 10 people in the top-left quadrant
+    density[40:, 40:] = 5.0 / (24 * 24)  # 5 people bottom-right
+    meta = store.save('CD1', density, event_id='EVT 1')
+    assert meta['shape'] == [16, 16]
+    assert meta['total'] == pytest.approx(15.0, rel=1e-3)
+
+    stored = store.load(meta['path'])
+    assert isinstance(stored, np.memmap)
+    counts = store.region_counts(stored, {
+        'gate': {'box': [0, 0, 0.5, 0.5]},
+        'stage': {'polygon': [[0.5, 0.5], [1, 0.5], [1, 1], [0.5, 1]]},
+        'all': {'box': [0, 0, 1, 1]},
+    })
+    assert counts['gate'] == pytest.approx(10.0, rel=1e-3)
+    assert counts['stage'] == pytest.approx(5.0, rel=1e-3)
+    assert counts['all'] == pytest.approx(15.0, rel=1e-3)
+    # Masks are rasterized once per region and map shape
+    assert store.mask({'box': [0, 0, 0.5, 0.5]}, (16, 16)) is store.mask({'box': [0, 0, 0.5, 0.5]}, (16, 16))
+
+
+def test_count_images_returns_density_maps_from_the_model(tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    from pathlib import Path
+
+    import inference_pipeline
+    from model_registry import ModelRegistry
+
+    class Uniform(torch.nn.Module):
+        def forward(self, x):
+            return torch.nn.functional.avg_pool2d(x[:, :1] * 0 + 1, 8) * 0.01
+
+    weights = tmp_path / 'uniform.pt'
+    torch.jit.save(torch.jit.script(Uniform()), str(weights))
+    monkeypatch.setattr(inference_pipeline, 'registry', ModelRegistry(str(weights), device='cpu', hot_reload=False))
+
+    image = sorted((Path(__file__).resolve().parents[2] / 'samplecrowd').glob('*.jpg'))[0]
+    with_map, without = inference_pipeline.count_images([str(image), str(image)], (256, 256), [True, False])
+    assert with_map['density_map'].dtype == np.float16
+    assert float(with_map['density_map'].sum()) == pytest.approx(32 * 32 * 0.01, rel=1e-2)
+    assert 'density_map' not in without
@@ -0,0 +1,47 @@
+import io
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from frame_dedup import FrameDeduplicator, thumbnail
+
+
+def _jpeg(shade, size=(640, 480)):
+    buf = io.BytesIO()
+    img = Image.new('RGB', size, (shade, shade, shade))
+    img.paste((255, 255, 255), (0, 0, size[0] // 4, size[1] // 4))
+    img.save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def test_near_identical_frames_reuse_the_last_count():
+    dedup = FrameDeduplicator(threshold=2.0, max_reuse_s=60)
+    key = 'EVT1:cam1:full'
+
+    first = thumbnail(_jpeg(100))
+    assert first.shape == (32, 32)
+    assert dedup.match(key, first, 2.0) is None
+    dedup.remember(key, first, {'count': 12, 'backend': 'model', 'error': None})
+
+    reused = dedup.match(key, thumbnail(_jpeg(101)), 2.0)
+    assert reused['count'] == 12 and reused['change'] < 2.0
+
+    assert dedup.match(key, thumbnail(_jpeg(160)), 2.0) is None  # scene changed
+    assert dedup.match('EVT1:cam2:full', first, 2.0) is None  # other source
+
+    stats = dedup.stats()['sources'][key]
+    assert stats == {'frames': 3, 'skipped': 1, 'skip_ratio': pytest.approx(0.333), 'last_change': stats['last_change']}
+
+
+def test_static_source_is_recounted_after_max_reuse(monkeypatch):
+    dedup = FrameDeduplicator(threshold=5.0, max_reuse_s=10)
+    thumb = np.zeros((32, 32), dtype=np.float32)
+    dedup.remember('cam', thumb, {'count': 3})
+    assert dedup.match('cam', thumb, 5.0) is not None
+    later = time.time() + 11
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert dedup.match('cam', thumb, 5.0) is None
+    # A per-event threshold of 0 turns reuse off
+    assert dedup.match('cam', thumb, 0.0) is None
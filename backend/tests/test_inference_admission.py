@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from inference_admission import AdmissionController, AdmissionRejected, AdmissionTimeout
+
+
+async def _hold(admission, gate, order, name, **kwargs):
+    async with admission.slot(**kwargs):
+        order.append(name)
+        await gate.wait()
+
+
+async def test_priority_lane_goes_first():
+    admission = AdmissionController(slots=1, queue_depth=8, priority_depth=8, timeout_s=5)
+    gate = asyncio.Event()
+    order = []
+    first = asyncio.create_task(_hold(admission, gate, order, "first"))
+    await asyncio.sleep(0)
+    routine = asyncio.create_task(_hold(admission, gate, order, "routine"))
+    await asyncio.sleep(0)
+    urgent = asyncio.create_task(_hold(admission, gate, order, "urgent", priority=True))
+    await asyncio.sleep(0)
+
+    stats = admission.stats()
+    assert stats["inflight"] == 1
+    assert stats["lanes"]["routine"]["queue_depth"] == 1
+    assert stats["lanes"]["priority"]["queue_depth"] == 1
+
+    gate.set()
+    await asyncio.gather(first, routine, urgent)
+    assert order == ["first", "urgent", "routine"]
+    assert admission.inflight == 0
+
+
+async def test_full_lane_is_rejected_with_retry_after():
+    admission = AdmissionController(slots=1, queue_depth=1, priority_depth=1, timeout_s=5)
+    gate = asyncio.Event()
+    order = []
+    tasks = [asyncio.create_task(_hold(admission, gate, order, i)) for i in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected) as exc:
+        async with admission.slot():
+            pass
+    assert exc.value.retry_after >= 1
+    # Bulk work still queues
+    tasks.append(asyncio.create_task(_hold(admission, gate, order, "bulk", bulk=True)))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*tasks)
+    assert order == [0, 1, "bulk"]
+    assert admission.stats()["lanes"]["routine"]["rejected"] == 1
+
+
+async def test_wait_times_out():
+    admission = AdmissionController(slots=1, queue_depth=4, timeout_s=0.05)
+    gate = asyncio.Event()
+    holder = asyncio.create_task(_hold(admission, gate, [], "holder"))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionTimeout):
+        async with admission.slot():
+            pass
+    assert admission.stats()["lanes"]["routine"]["queue_depth"] == 0
+    gate.set()
+    await holder
+    assert admission.stats()["lanes"]["routine"]["timed_out"] == 1
+    assert admission.inflight == 0
+
+
+async def test_disabled_admits_everything():
+    admission = AdmissionController(slots=0)
+    async with admission.slot():
+        async with admission.slot():
+            assert admission.inflight == 0
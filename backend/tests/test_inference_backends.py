@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+import inference_utils as iu
+
+
+class _Counter(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 4, 3, padding=1)
+        self.head = torch.nn.Linear(4, 1)
+
+    def forward(self, x):
+        y = torch.relu(self.conv(x)).permute(0, 2, 3, 1)
+        return torch.relu(self.head(y)).permute(0, 3, 1, 2) * 0.001
+
+
+def _inputs(n=2, size=64):
+    torch.manual_seed(0)
+    return [torch.randn(3, size, size) for _ in range(n)]
+
+
+def test_int8_backend_stays_close_to_fp32():
+    torch.manual_seed(0)
+    model = _Counter().eval()
+    quantized = iu.build_backend(model, 'int8', input_size=64, calibration=[torch.stack(_inputs(4))])
+    # Static quantization: the conv itself runs in int8, not only the Linear head
+    kinds = {node.kind() for node in quantized.graph.nodes()}
+    assert 'quantized::conv2d_relu' in kinds or 'quantized::conv2d' in kinds
+    base = [c for c, _ in iu.infer_batch(model, _inputs())]
+    q = [c for c, _ in iu.infer_batch(quantized, _inputs())]
+    assert q == pytest.approx(base, rel=0.1, abs=0.05)
+
+
+def test_int8_rejects_models_it_would_leave_in_fp32():
+    class Pooling(torch.nn.Module):
+        def forward(self, x):
+            return torch.nn.functional.avg_pool2d(x, 8)
+
+    with pytest.raises(RuntimeError, match='no Conv2d/Linear'):
+        iu.build_backend(Pooling(), 'int8', input_size=64, calibration=[])
+
+
+def test_torchscript_artifact_is_built_once_and_reused(tmp_path):
+    torch.manual_seed(0)
+    weights = tmp_path / 'model.pt'
+    torch.jit.save(torch.jit.trace(_Counter().eval(), torch.randn(1, 3, 64, 64)), str(weights))
+
+    model = iu.load_backend(str(weights), 'torchscript', input_size=64)
+    artifact = iu.artifact_path(str(weights), 'torchscript')
+    assert os.path.isfile(artifact)
+    built_at = os.path.getmtime(artifact)
+
+    again = iu.load_backend(str(weights), 'torchscript', input_size=64)
+    assert os.path.getmtime(artifact) == built_at
+
+    base = iu.load_backend(str(weights), 'torch')
+    expected = [c for c, _ in iu.infer_batch(base, _inputs())]
+    for m in (model, again):
+        assert [c for c, _ in iu.infer_batch(m, _inputs())] == pytest.approx(expected, rel=1e-3)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        iu.load_backend('model.pt', 'tensorrt')
+
+
+def test_prepare_builds_the_qos_backend_at_startup(tmp_path, monkeypatch):
+    import inference_pipeline
+    import model_registry
+
+    weights = tmp_path / 'model.pt'
+    torch.jit.save(torch.jit.trace(_Counter().eval(), torch.randn(1, 3, 64, 64)), str(weights))
+    registry = model_registry.ModelRegistry(str(weights), device='cpu', hot_reload=False, input_size=64)
+    monkeypatch.setattr(model_registry, 'registry', registry)
+    monkeypatch.setattr(inference_pipeline, 'registry', registry)
+    monkeypatch.setattr(model_registry, '_backend_registries', {})
+    monkeypatch.setattr(inference_pipeline.settings, 'inference_qos_quantized_backend', 'torchscript')
+
+    report = inference_pipeline.prepare(False)
+
+    assert report['qos_model']['loaded'] and report['qos_model']['active_backend'] == 'torchscript'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['model.frozen.pt', 'model.pt']
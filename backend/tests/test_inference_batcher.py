@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from inference_batcher import BatchScheduler, Histogram
+
+
+async def test_concurrent_submits_share_one_batch():
+    seen = []
+
+    async def run_batch(items):
+        seen.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = BatchScheduler(run_batch, max_batch_size=4, max_wait_ms=50)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(4)))
+    await batcher.close()
+
+    assert results == [0, 10, 20, 30]
+    assert seen == [[0, 1, 2, 3]]
+    stats = batcher.stats()
+    assert stats['batches'] == 1
+    assert stats['batch_size']['count'] == 1
+    assert stats['queue_wait_ms']['count'] == 4
+
+
+async def test_batches_are_capped_at_max_size():
+    sizes = []
+
+    async def run_batch(items):
+        sizes.append(len(items))
+        return items
+
+    batcher = BatchScheduler(run_batch, max_batch_size=3, max_wait_ms=20)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+    await batcher.close()
+
+    assert results == list(range(7))
+    assert max(sizes) <= 3
+    assert sum(sizes) == 7
+
+
+async def test_per_item_errors_only_fail_that_caller():
+    async def run_batch(items):
+        return [ValueError('bad image') if item == 'bad' else item for item in items]
+
+    batcher = BatchScheduler(run_batch, max_batch_size=8, max_wait_ms=20)
+    ok, bad = await asyncio.gather(
+        batcher.submit('ok'), batcher.submit('bad'), return_exceptions=True
+    )
+    await batcher.close()
+    assert ok == 'ok'
+    assert isinstance(bad, ValueError)
+
+
+async def test_cancelled_batch_fails_its_callers_and_dead_workers_are_replaced():
+    calls = []
+
+    async def run_batch(items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise asyncio.CancelledError()  # e.g. the executor future was cancelled under it
+        return [item * 2 for item in items]
+
+    batcher = BatchScheduler(run_batch, max_batch_size=4, max_wait_ms=1, concurrency=2)
+    with pytest.raises(RuntimeError, match='cancelled'):
+        await asyncio.wait_for(batcher.submit(1), 5)
+    assert all(not w.done() for w in batcher._workers)
+
+    batcher._workers[0].cancel()
+    await asyncio.sleep(0)
+    assert await asyncio.wait_for(batcher.submit(3), 5) == 6
+    assert len(batcher._workers) == 2 and all(not w.done() for w in batcher._workers)
+    await batcher.close()
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = Histogram([1, 5])
+    for value in (0.5, 3, 3, 10):
+        hist.observe(value)
+    snap = hist.snapshot()
+    assert [b['count'] for b in snap['buckets']] == [1, 3, 4]
+    assert snap['count'] == 4
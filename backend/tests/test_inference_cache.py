@@ -0,0 +1,38 @@
+import time
+
+from inference_cache import ResultCache, cache_key
+
+
+def test_key_depends_on_model_version_and_params():
+    data = b'frame'
+    base = cache_key(data, 'v1', target_size=(512, 512))
+    assert base == cache_key(data, 'v1', target_size=(512, 512))
+    assert base != cache_key(data, 'v2', target_size=(512, 512))
+    assert base != cache_key(data, 'v1', target_size=(256, 256))
+    assert base != cache_key(b'other', 'v1', target_size=(512, 512))
+
+
+def test_lru_eviction_respects_memory_bound():
+    cache = ResultCache(max_bytes=1000, ttl_s=60)
+    for i in range(10):
+        cache.put(f'k{i}', {'count': i})
+    stats = cache.stats()
+    assert stats['bytes'] <= 1000
+    assert stats['evictions'] > 0
+    assert cache.get('k9') == {'count': 9}
+    assert cache.get('k0') is None
+
+
+def test_entries_expire_after_ttl():
+    cache = ResultCache(max_bytes=10_000, ttl_s=0.01)
+    cache.put('k', {'count': 1})
+    time.sleep(0.02)
+    assert cache.get('k') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_zero_size_disables_cache():
+    cache = ResultCache(max_bytes=0, ttl_s=60)
+    cache.put('k', {'count': 1})
+    assert cache.get('k') is None
+    assert cache.stats()['enabled'] is False
@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import pytest
+
+from inference_cascade import CascadePolicy, CascadeStats
+
+SAMPLE = sorted((Path(__file__).resolve().parents[2] / 'samplecrowd').glob('*.jpg'))[0]
+
+
+def test_policy_escalates_only_near_level_boundaries():
+    policy = CascadePolicy(margin=0.2, calibration_frames=0, audit_every=0)
+    area = 100.0
+    assert not policy.needs_full(10, area)  # 0.1 /m²: clearly Safe
+    assert policy.needs_full(45, area)  # 0.45 /m²: close to the Safe/Moderate line
+    assert not policy.needs_full(300, area)  # 3.0 /m²: clearly Risky
+    assert policy.needs_full(380, area)
+    assert policy.needs_full(10, None)  # unknown area: cannot judge the level
+
+
+def test_policy_calibrates_before_trusting_and_keeps_auditing_clear_frames():
+    policy = CascadePolicy(margin=0.2, calibration_frames=3, audit_every=4)
+    # The cheap tier undercounts 4x; every frame is clearly Safe, none near a boundary
+    for _ in range(3):
+        assert policy.needs_full(policy.estimate(5), 10_000.0)
+        policy.observe(5, 20)
+    assert policy.scale() == pytest.approx(4.0)
+    decisions = [policy.needs_full(policy.estimate(5), 10_000.0) for _ in range(8)]
+    assert decisions == [False, False, False, True] * 2
+
+
+def test_each_zone_learns_its_own_calibration():
+    policy = CascadePolicy(margin=0.2, calibration_frames=2, audit_every=0, max_zones=2)
+    for _ in range(2):
+        for zone, full in (('ev:gate:cam1', 20), ('ev:hall:cam2', 10)):
+            assert policy.needs_full(policy.estimate(5, zone), 10_000.0, zone)
+            policy.observe(5, full, zone)
+    assert policy.scale('ev:gate:cam1') == pytest.approx(4.0)
+    assert policy.scale('ev:hall:cam2') == pytest.approx(2.0)
+    assert not policy.needs_full(policy.estimate(5, 'ev:gate:cam1'), 10_000.0, 'ev:gate:cam1')
+    # A zone seen for the first time calibrates from scratch, evicting the least recent one
+    assert policy.needs_full(policy.estimate(5, 'ev:exit:cam3'), 10_000.0, 'ev:exit:cam3')
+    assert policy.scale('ev:hall:cam2') == 1.0 and 'ev:hall:cam2' not in policy._zones
+
+
+def test_cost_savings_are_reported():
+    stats = CascadeStats(cheap_size=128, input_size=512)
+    for tier in ['cheap'] * 6 + ['escalated', 'full']:
+        stats.record({'tier': tier})
+    report = stats.stats()
+    assert report['answered_cheap'] == 6 and report['cheap_ratio'] == 0.75
+    assert report['model_cost'] == pytest.approx(6 / 16 + 17 / 16 + 1, abs=1e-3)
+    assert report['cost_saved'] == pytest.approx(1 - report['model_cost'] / 8, abs=1e-3)
+
+
+def test_pipeline_answers_clear_frames_from_the_cheap_tier(tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    import inference_pipeline
+    from model_registry import ModelRegistry
+
+    class PixelCounter(torch.nn.Module):
+        # count grows with input resolution, like a real density model on shrunk people
+        def forward(self, x):
+            return torch.nn.functional.avg_pool2d(x[:, :1] * 0 + 1, 8) * 0.05
+
+    weights = tmp_path / 'm.pt'
+    torch.jit.save(torch.jit.script(PixelCounter()), str(weights))
+    monkeypatch.setattr(inference_pipeline, 'registry', ModelRegistry(str(weights), device='cpu', hot_reload=False))
+    monkeypatch.setattr(inference_pipeline, 'cascade',
+                        CascadePolicy(cheap_size=128, margin=0.2, calibration_frames=1, audit_every=0))
+
+    full_count = (512 // 8) ** 2 * 0.05  # 204.8
+    src = str(SAMPLE)
+    # Area where the (uncalibrated) cheap estimate sits on the 0.5/m² boundary -> escalated
+    near = inference_pipeline.count_images([src], (512, 512), areas_m2=[((128 // 8) ** 2 * 0.05) / 0.5])[0]
+    assert near['tier'] == 'escalated' and near['count'] == round(full_count)
+    # Now calibrated; a large area is clearly Safe and is answered cheaply, at full-model scale
+    clear, no_area = inference_pipeline.count_images([src, src], (512, 512), areas_m2=[10_000.0, None])
+    assert clear['tier'] == 'cheap' and clear['count'] == pytest.approx(full_count, abs=1)
+    assert no_area['tier'] == 'full'
+
+
+def test_pipeline_does_not_answer_cheaply_before_calibration(tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    import inference_pipeline
+    from model_registry import ModelRegistry
+
+    class ShrinkingCounter(torch.nn.Module):
+        # the cheap pass undercounts 16x, and the frames are never near a level boundary
+        def forward(self, x):
+            return torch.nn.functional.avg_pool2d(x[:, :1] * 0 + 1, 8) * 0.05
+
+    weights = tmp_path / 'm.pt'
+    torch.jit.save(torch.jit.script(ShrinkingCounter()), str(weights))
+    monkeypatch.setattr(inference_pipeline, 'registry', ModelRegistry(str(weights), device='cpu', hot_reload=False))
+    monkeypatch.setattr(inference_pipeline, 'cascade',
+                        CascadePolicy(cheap_size=128, margin=0.2, calibration_frames=2, audit_every=0))
+
+    full_count = (512 // 8) ** 2 * 0.05  # 204.8
+    # 40 m²: the full count is Overcrowded (5.1/m²), the uncalibrated cheap count (12.8) would say Safe
+    results = inference_pipeline.count_images([str(SAMPLE)] * 3, (512, 512), areas_m2=[40.0] * 3)
+    assert [r['tier'] for r in results] == ['escalated', 'escalated', 'escalated']
+    assert all(r['count'] == round(full_count) for r in results)
+    cheap = inference_pipeline.count_images([str(SAMPLE)], (512, 512), areas_m2=[40.0])[0]
+    assert cheap['tier'] == 'cheap' and cheap['count'] == pytest.approx(full_count, abs=1)
@@ -44,3 +44,180 @@ def test_inference_endpoint_with_fake_lwcc(tmp_path):
     assert 'person_count' in data
     assert isinstance(data['person_count'], int)
     assert data['person_count'] == 7
+
+
+def test_repeated_upload_is_served_from_cache():
+    calls = []
+
+    class LWCC:
+        @staticmethod
+        def get_count(paths, **kwargs):
+            calls.append(paths)
+            return 4
+
+    sys.modules['lwcc'] = types.SimpleNamespace(LWCC=LWCC)
+
+    repo_root = Path(__file__).resolve().parents[2]
+    img_path = sorted((repo_root / 'samplecrowd').glob('*.jpg'))[1]
+
+    from main import app
+
+    client = TestClient(app)
+    data = img_path.read_bytes()
+    first = client.post('/inference/count', files={'file': (img_path.name, data, 'image/jpeg')}).json()
+    second = client.post('/inference/count', files={'file': (img_path.name, data, 'image/jpeg')}).json()
+
+    assert first['person_count'] == second['person_count'] == 4
+    assert first['cached'] is False
+    assert second['cached'] is True
+    assert len(calls) == 1
+
+    stats = client.get('/inference/stats').json()['cache']
+    assert stats['hits'] >= 1
+
+
+def test_batch_endpoint_counts_files_and_archives():
+    import io
+    import zipfile
+
+    class LWCC:
+        @staticmethod
+        def get_count(paths, **kwargs):
+            return 3
+
+    sys.modules['lwcc'] = types.SimpleNamespace(LWCC=LWCC)
+
+    repo_root = Path(__file__).resolve().parents[2]
+    imgs = sorted((repo_root / 'samplecrowd').glob('*.jpg'))[:3]
+
+    from main import app
+
+    client = TestClient(app)
+
+    files = [('files', (p.name, p.read_bytes(), 'image/jpeg')) for p in imgs]
+    resp = client.post('/inference/count-batch', files=files)
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert data['total_images'] == 3
+    assert [i['image_filename'] for i in data['images']] == [p.name for p in imgs]
+    assert all(i['person_count'] == 3 for i in data['images'])
+    assert data['total_person_count'] == 9
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        for p in imgs:
+            zf.write(p, arcname=f'cams/{p.name}')
+        zf.writestr('notes.txt', 'ignored')
+    resp = client.post('/inference/count-batch', files={'files': ('sweep.zip', buf.getvalue(), 'application/zip')})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert data['total_images'] == 3
+    assert data['images'][0]['image_filename'] == f'cams/{imgs[0].name}'
+
+    bomb = io.BytesIO()
+    with zipfile.ZipFile(bomb, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('huge.jpg', bytes(64 * 1024 * 1024))
+    resp = client.post('/inference/count-batch', files={'files': ('bomb.zip', bomb.getvalue(), 'application/zip')})
+    assert resp.status_code == 400 and 'uncompressed' in resp.json()['detail']
+
+
+def test_overload_degrades_to_estimate(monkeypatch):
+    import routes.inference as inference_routes
+    from inference_qos import QosController
+
+    repo_root = Path(__file__).resolve().parents[2]
+    img_path = sorted((repo_root / 'samplecrowd').glob('*.jpg'))[2]
+
+    from main import app
+
+    qos = QosController(hold_s=60)
+    monkeypatch.setattr(inference_routes, 'qos', qos)
+    monkeypatch.setattr(inference_routes, '_queue_pressure', lambda: 1.0)
+
+    client = TestClient(app)
+    resp = client.post('/inference/count', files={'file': (img_path.name, img_path.read_bytes(), 'image/jpeg')})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert data['qos_tier'] == 'estimate'
+    assert data['cached'] is False
+    assert client.get('/inference/stats').json()['qos']['served']['estimate'] == 1
+
+
+def test_video_frames_go_through_the_bulk_lane_in_chunks(monkeypatch):
+    import asyncio
+    import io
+    import zipfile
+    import routes.inference as inference_routes
+    from PIL import Image
+
+    from main import app
+
+    state = {'active': 0, 'peak': 0, 'calls': 0}
+
+    async def fake_count(contents, *args, bulk=False, **kwargs):
+        assert bulk is True
+        state['calls'] += 1
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        await asyncio.sleep(0.01)
+        state['active'] -= 1
+        return {'count': float(contents.getpixel((0, 0))[0]), 'error': None}, False
+
+    monkeypatch.setattr(inference_routes, '_count_contents', fake_count)
+    monkeypatch.setattr(inference_routes.settings, 'inference_batch_size', 2)
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        for i in range(6):
+            frame = io.BytesIO()
+            Image.new('RGB', (32, 32), (40 * i, 0, 0)).save(frame, format='PNG')
+            zf.writestr(f'{i:03d}.png', frame.getvalue())
+
+    client = TestClient(app)
+    resp = client.post('/inference/count-video', data={'smoothing': '1'},
+                       files={'file': ('frames.zip', buf.getvalue(), 'application/zip')})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert data['frames'] == 6 and data['frames_counted'] == 6
+    assert [e['raw_count'] for e in data['series']] == [40.0 * i for i in range(6)]
+    assert state['calls'] == 6 and state['peak'] <= 2
+
+    monkeypatch.setattr(inference_routes.settings, 'inference_batch_max_files', 3)
+    resp = client.post('/inference/count-video', files={'file': ('frames.zip', buf.getvalue(), 'application/zip')})
+    assert resp.status_code == 400
+
+
+def test_sources_on_one_area_are_scheduled_apart_and_throttled_frames_not_saved(monkeypatch):
+    import routes.inference as inference_routes
+
+    from main import app
+
+    saved = []
+
+    class Collection:
+        async def insert_one(self, record):
+            saved.append(record)
+
+    async def fake_count(contents, **kwargs):
+        return {'count': 3 + len(saved), 'error': None}, False
+
+    monkeypatch.setattr(inference_routes, '_count_contents', fake_count)
+    monkeypatch.setattr(inference_routes, 'database', {'crowd_density': Collection()})
+    monkeypatch.setattr(inference_routes.zone_scheduler, 'budget_fps', 20.0)
+
+    client = TestClient(app)
+
+    def post(source_id, body):
+        return client.post('/inference/count', data={'area_name': 'Gate 9', 'source_id': source_id, 'save_record': 'true'},
+                           files={'file': ('f.jpg', body, 'image/jpeg')}).json()
+
+    first = post('cam-a', b'frame-1')
+    other = post('cam-b', b'frame-2')
+    again = post('cam-a', b'frame-3')
+
+    assert first['throttled'] is False and first['saved'] is True
+    # Another camera on the same area is its own zone, not cam-a's last count
+    assert other['throttled'] is False and other['person_count'] == 4 and other['saved'] is True
+    assert again['throttled'] is True and again['person_count'] == 3
+    assert again['saved'] is False and again['save_skipped'] == 'throttled'
+    assert len(saved) == 2
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from inference_executor import InferenceExecutor, InferenceWorkerError
+
+
+def _pid():
+    return os.getpid()
+
+
+def _crash():
+    os._exit(1)
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+async def test_thread_mode_runs_off_the_event_loop():
+    executor = InferenceExecutor(workers=0, timeout_s=5)
+    assert await executor.run(_pid) == os.getpid()
+    executor.shutdown()
+
+
+async def test_worker_crash_is_isolated_and_pool_rebuilt():
+    executor = InferenceExecutor(workers=1, timeout_s=30)
+    try:
+        assert await executor.run(_pid) != os.getpid()
+        with pytest.raises(InferenceWorkerError):
+            await executor.run(_crash)
+        assert await executor.run(_pid) != os.getpid()
+        stats = executor.stats()
+        assert stats['crashes'] == 1
+        assert stats['restarts'] == 1
+    finally:
+        executor.shutdown()
+
+
+async def test_timeout_recycles_stuck_worker():
+    executor = InferenceExecutor(workers=1, timeout_s=30)
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(_sleep, 10, timeout=0.5)
+        assert await executor.run(_sleep, 0) == 0
+        assert executor.stats()['timeouts'] == 1
+    finally:
+        executor.shutdown()
+
+
+async def test_timeout_does_not_fail_calls_queued_behind_it():
+    executor = InferenceExecutor(workers=1, timeout_s=30)
+    try:
+        assert await executor.run(_pid) != os.getpid()
+        stuck = asyncio.ensure_future(executor.run(_sleep, 10, timeout=1.0))
+        await asyncio.sleep(0.1)
+        queued = [asyncio.ensure_future(executor.run(_sleep, 0.01 * i)) for i in range(1, 4)]
+        with pytest.raises(asyncio.TimeoutError):
+            await stuck
+        assert await asyncio.gather(*queued) == [0.01, 0.02, 0.03]
+        stats = executor.stats()
+        assert stats['timeouts'] == 1 and stats['crashes'] == 0 and stats['resubmitted'] == 3
+    finally:
+        executor.shutdown()
@@ -0,0 +1,98 @@
+from inference_qos import QosController, tier_model
+
+
+def test_degrades_at_once_and_recovers_one_tier_at_a_time():
+    qos = QosController(thresholds=(0.5, 0.75, 0.9), hold_s=5)
+    assert qos.update(0.2, now=0) == "full"
+    assert qos.update(0.8, now=1) == "quantized"
+    assert qos.update(0.95, now=2) == "estimate"
+
+    # Below the entry threshold but above the exit level: stays degraded
+    assert qos.update(0.6, now=3) == "estimate"
+    assert qos.update(0.6, now=30) == "estimate"
+
+    # Drained: one step up per hold period
+    assert qos.update(0.1, now=31) == "estimate"
+    assert qos.update(0.1, now=36) == "quantized"
+    assert qos.update(0.1, now=38) == "quantized"
+    assert qos.update(0.1, now=41) == "reduced"
+    assert qos.update(0.1, now=46) == "full"
+
+
+def test_blip_during_hold_resets_recovery():
+    qos = QosController(thresholds=(0.5, 0.75, 0.9), hold_s=5)
+    qos.update(0.6, now=0)
+    qos.update(0.1, now=1)
+    qos.update(0.3, now=4)  # not drained enough
+    assert qos.update(0.1, now=7) == "reduced"
+    assert qos.update(0.1, now=12) == "full"
+    assert qos.stats()["transitions"] == 2
+
+
+def test_disabled_always_full():
+    qos = QosController(enabled=False)
+    assert qos.update(5.0) == "full"
+
+
+def test_each_model_tier_is_cheaper_than_the_last():
+    sides = [tier_model(tier)[0][0] for tier in ('full', 'reduced', 'quantized')]
+    assert sides == sorted(sides, reverse=True) and len(set(sides)) == 3
+    assert tier_model('quantized')[1] == 'int8'
+
+
+async def test_one_large_batch_does_not_degrade_itself(monkeypatch):
+    import asyncio
+
+    import routes.inference as inference_routes
+    from inference_admission import AdmissionController
+    from inference_qos import QosController
+
+    class Batcher:
+        queue_depth = 0
+
+        async def submit(self, item):
+            await asyncio.sleep(0.001)
+            return {'count': 1, 'error': None}
+
+    qos = QosController(hold_s=60)
+    monkeypatch.setattr(inference_routes, 'qos', qos)
+    monkeypatch.setattr(inference_routes, 'admission', AdmissionController(slots=2, queue_depth=8))
+    monkeypatch.setattr(inference_routes, 'batcher', Batcher())
+    monkeypatch.setattr(inference_routes.settings, 'inference_queue_depth', 8)
+
+    results = await asyncio.gather(*(inference_routes._count_contents(b'bulk-%d' % i, bulk=True) for i in range(150)))
+    assert {result['qos_tier'] for result, _ in results} == {'full'}
+    assert qos.tier == 'full' and inference_routes._queue_pressure() == 0
+
+
+def test_idle_time_after_a_burst_counts_toward_recovery():
+    qos = QosController(thresholds=(0.5, 0.75, 0.9), hold_s=5)
+    assert qos.update(0.95, now=0) == "estimate"
+    assert qos.update(0.2, now=1) == "estimate"  # drained, but within the hold
+    # Nothing arrived while idle; the first request after it already recovers
+    assert qos.update(0.0, now=7) == "quantized"
+    assert qos.update(0.0, now=16) == "full"
+    assert qos.stats()["transitions"] == 4
+
+
+async def test_estimate_tier_runs_in_the_executor(monkeypatch):
+    import routes.inference as inference_routes
+    from inference_qos import QosController
+
+    calls = []
+
+    class Executor:
+        async def run(self, fn, *args, timeout=None):
+            calls.append(fn)
+            return fn(*args)
+
+    qos = QosController(thresholds=(0.5, 0.75, 0.9))
+    qos.update(0.95)
+    monkeypatch.setattr(inference_routes, 'qos', qos)
+    monkeypatch.setattr(inference_routes, '_queue_pressure', lambda: 0.95)
+    monkeypatch.setattr(inference_routes, 'executor', Executor())
+    monkeypatch.setattr(inference_routes.inference_pipeline, 'estimate_count',
+                        lambda contents: {'count': 3, 'backend': 'heuristic', 'error': None})
+
+    result, cached = await inference_routes._count_contents(b'frame')
+    assert calls == [inference_routes.inference_pipeline.estimate_count] and result['qos_tier'] == 'estimate' and result['count'] == 3
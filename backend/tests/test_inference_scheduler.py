@@ -0,0 +1,53 @@
+import pytest
+
+from inference_scheduler import ZoneScheduler
+
+INTERVALS = {"Safe": 30.0, "Moderate": 10.0, "Risky": 3.0, "Overcrowded": 1.0}
+
+
+def _scheduler(**kwargs):
+    kwargs.setdefault("budget_fps", 100.0)
+    return ZoneScheduler(INTERVALS, **kwargs)
+
+
+def test_interval_follows_density_level():
+    s = _scheduler()
+    s.observe("e:safe", {"count": 1}, 0.2, "Safe", now=0.0)
+    s.observe("e:busy", {"count": 90}, 4.5, "Overcrowded", now=0.0)
+    assert s.interval("e:safe", now=0.0) == 30.0
+    assert s.interval("e:busy", now=0.0) == 1.0
+    assert s.advice("e:safe", now=10.0)["next_frame_in_s"] == 20.0
+
+
+def test_rising_density_shortens_interval():
+    s = _scheduler()
+    s.observe("e:gate", {"count": 10}, 1.0, "Moderate", now=0.0)
+    s.observe("e:gate", {"count": 15}, 1.5, "Moderate", now=60.0)
+    assert s.advice("e:gate", now=60.0)["trend_per_min"] > 0
+    assert s.interval("e:gate", now=60.0) < 10.0
+
+    s.observe("e:gate", {"count": 15}, 1.5, "Moderate", now=70.0)
+    s.observe("e:gate", {"count": 15}, 1.5, "Moderate", now=80.0)
+    s.observe("e:gate", {"count": 5}, 0.5, "Moderate", now=90.0)
+    assert s.interval("e:gate", now=90.0) == 10.0
+
+
+def test_budget_slows_routine_zones_first():
+    s = _scheduler(budget_fps=2.0)
+    s.observe("e:busy", {"count": 90}, 4.5, "Overcrowded", now=0.0)
+    for i in range(20):
+        s.observe(f"e:calm{i}", {"count": 5}, 0.3, "Moderate", now=0.0)
+    # 1 fps for the busy zone + 20 x 0.1 fps asked; only the calm ones give way
+    assert s.interval("e:busy", now=0.0) == 1.0
+    assert s.interval("e:calm0", now=0.0) == pytest.approx(20.0)
+    assert s.stats(now=0.0)["scheduled_fps"] == pytest.approx(2.0)
+
+
+def test_early_frames_reuse_the_last_result():
+    s = _scheduler()
+    s.observe("e:safe", {"count": 3}, 0.1, "Safe", now=0.0)
+    assert s.early_result("e:safe", now=5.0) == {"count": 3}
+    assert s.early_result("e:safe", now=29.0) is None
+    assert s.early_result("e:new", now=0.0) is None
+    zone = s.stats(now=29.0)["zones"]["e:safe"]
+    assert (zone["frames"], zone["throttled"]) == (3, 1)
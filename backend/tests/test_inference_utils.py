@@ -0,0 +1,255 @@
+import io
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import inference_utils as iu
+
+SAMPLE_DIR = Path(__file__).resolve().parents[2] / 'samplecrowd'
+
+
+def _sample_image():
+    imgs = sorted(SAMPLE_DIR.glob('*.jpg'))
+    assert imgs, f'No sample images found in {SAMPLE_DIR}'
+    return imgs[0]
+
+
+def test_open_image_accepts_in_memory_sources():
+    path = _sample_image()
+    data = path.read_bytes()
+    expected = np.asarray(iu.open_image(str(path)))
+
+    for source in (data, bytearray(data), memoryview(data), io.BytesIO(data)):
+        assert np.array_equal(np.asarray(iu.open_image(source)), expected)
+
+
+def test_image_path_for_only_writes_temp_files_for_memory_sources():
+    path = _sample_image()
+    with iu.image_path_for(str(path)) as p:
+        assert p == str(path)
+
+    with iu.image_path_for(path.read_bytes()) as p:
+        assert p != str(path)
+        assert os.path.getsize(p) == path.stat().st_size
+    assert not os.path.exists(p)
+
+
+def test_heuristic_estimate_from_bytes():
+    count = iu.estimate_count_heuristic(_sample_image().read_bytes())
+    assert 1 <= count <= 1000
+
+
+def test_plan_tiles_covers_image_with_equal_sized_tiles():
+    tiles = iu.plan_tiles(1200, 700, tile_size=512, overlap=64)
+    assert {(x1 - x0, y1 - y0) for x0, y0, x1, y1 in tiles} == {(512, 512)}
+    assert max(x1 for _, _, x1, _ in tiles) == 1200
+    assert max(y1 for _, _, _, y1 in tiles) == 700
+    assert iu.plan_tiles(300, 200, tile_size=512) == [(0, 0, 300, 200)]
+
+
+def test_tiled_count_does_not_double_count_overlaps():
+    torch = pytest.importorskip('torch')
+    from PIL import Image
+
+    class UniformDensity(torch.nn.Module):
+        # 8x-downsampled density map with 0.01 people per output cell
+        def forward(self, x):
+            return torch.nn.functional.avg_pool2d(x[:, :1] * 0 + 1, 8) * 0.01
+
+    img = Image.new('RGB', (1600, 1200), (120, 120, 120))
+    result = iu.count_tiled(UniformDensity(), img, tile_size=512, overlap=128, max_pixels=0)
+    assert result['tiles'] > 1
+    assert result['count'] == pytest.approx((1600 / 8) * (1200 / 8) * 0.01, rel=1e-3)
+    assert result['ms_per_tile'] > 0
+
+    downscaled = iu.count_tiled(UniformDensity(), img, tile_size=512, overlap=128, max_pixels=480_000)
+    assert downscaled['scale'] < 1
+    assert downscaled['tiles'] < result['tiles']
+
+
+def test_preprocessor_is_cached_and_normalizes_like_imagenet():
+    from PIL import Image
+
+    assert iu.get_preprocessor((64, 64)) is iu.get_preprocessor((64, 64))
+    img = Image.new('RGB', (80, 60), (0, 128, 255))
+    out = np.asarray(iu._preprocess_pil(img, target_size=(64, 64)))
+    assert out.shape == (3, 64, 64)
+    expected = [(v / 255.0 - m) / s for v, m, s in zip((0, 128, 255), (0.485, 0.456, 0.406), (0.229, 0.224, 0.225))]
+    assert np.allclose(out[:, 0, 0], expected, atol=1e-5)
+
+
+def test_jpeg_decoded_at_reduced_size_for_small_targets():
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new('RGB', (4000, 3000), (90, 90, 90)).save(buf, 'JPEG')
+    data = buf.getvalue()
+    assert iu.open_image(data).size == (4000, 3000)
+    reduced = iu.open_image(data, min_size=(512, 512))
+    assert reduced.size == (1000, 750)
+    assert iu.preprocess_image(data, target_size=(512, 512)).shape[-2:] == (512, 512)
+
+
+def test_batch_inference_loop_resumes_from_manifest(tmp_path):
+    torch = pytest.importorskip('torch')
+
+    class CountingModel(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.seen = 0
+
+        def forward(self, x):
+            self.seen += x.shape[0]
+            return torch.ones(x.shape[0], 1, 4, 4)
+
+    images = [str(p) for p in sorted(SAMPLE_DIR.glob('*.jpg'))[:5]]
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'not an image')
+    paths = images + [str(broken)]
+    out = tmp_path / 'out'
+
+    model = CountingModel()
+    first = iu.batch_inference_loop(model, paths, max_images=3, outputs_dir=str(out),
+                                    batch_size=2, workers=2, save_visuals=False)
+    assert [r['count'] for r in first] == [16, 16, 16]
+    assert model.seen == 3
+
+    model = CountingModel()
+    results = iu.batch_inference_loop(model, paths, outputs_dir=str(out),
+                                      batch_size=2, workers=2, save_visuals=False)
+    assert model.seen == 2  # only the images the first run did not reach
+    assert [r['image'] for r in results] == paths
+    assert results[-1]['count'] is None and results[-1]['error']
+    assert len(iu.read_manifest(str(out))) == len(paths)
+
+
+def test_manifest_entries_of_other_weights_are_counted_again(tmp_path):
+    torch = pytest.importorskip('torch')
+
+    class Scaled(torch.nn.Module):
+        def __init__(self, value):
+            super().__init__()
+            self.value = torch.nn.Parameter(torch.tensor(float(value)))
+            self.seen = 0
+
+        def forward(self, x):
+            self.seen += x.shape[0]
+            return self.value * torch.ones(x.shape[0], 1, 4, 4)
+
+    paths = [str(p) for p in sorted(SAMPLE_DIR.glob('*.jpg'))[:2]]
+    out = str(tmp_path / 'out')
+    kwargs = dict(outputs_dir=out, batch_size=2, workers=1, save_visuals=False)
+    assert [r['count'] for r in iu.batch_inference_loop(Scaled(1), paths, **kwargs)] == [16, 16]
+
+    same = Scaled(1)
+    assert [r['count'] for r in iu.batch_inference_loop(same, paths, **kwargs)] == [16, 16] and same.seen == 0
+    retrained = Scaled(2)
+    assert [r['count'] for r in iu.batch_inference_loop(retrained, paths, **kwargs)] == [32, 32]
+    assert retrained.seen == 2
+    # The notebook helper does not resume unless asked to
+    again = Scaled(2)
+    iu.safe_inference_loop(again, paths, outputs_dir=out, batch_size=2, workers=1)
+    assert again.seen == 2
+
+
+def test_batch_loop_fails_instead_of_hanging_when_the_writer_dies(tmp_path, monkeypatch):
+    import threading
+
+    torch = pytest.importorskip('torch')
+
+    class Ones(torch.nn.Module):
+        def forward(self, x):
+            return torch.ones(x.shape[0], 1, 4, 4)
+
+    def broken_append(self, *args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(iu.ResultsLog, 'append', broken_append)
+    paths = [str(p) for p in sorted(SAMPLE_DIR.glob('*.jpg'))[:6]]
+    errors = []
+
+    def run():
+        try:
+            iu.batch_inference_loop(Ones(), paths, outputs_dir=str(tmp_path), batch_size=1, prefetch=1,
+                                    workers=1, save_visuals=False)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive()
+    assert errors and 'disk full' in str(errors[0])
+
+
+def test_overlay_and_buffered_results_log(tmp_path):
+    from PIL import Image
+
+    img = Image.new('RGB', (320, 240), (40, 40, 40))
+    density = np.zeros((30, 40), dtype=np.float32)
+    density[10:20, 10:20] = 1.0
+    overlay = iu.render_overlay(img, density, count=100)
+    assert overlay.size == img.size
+    assert overlay.getpixel((120, 120)) != (40, 40, 40)  # heat drawn where density is
+    assert overlay.getpixel((300, 220)) == (40, 40, 40)  # background untouched
+
+    log = iu.ResultsLog(str(tmp_path), flush_every=3)
+    for i in range(2):
+        path = iu.visualize_and_save(f'img{i}.jpg', density, 10 + i, outputs_dir=str(tmp_path),
+                                     image=img, log=log)
+        assert os.path.exists(path)
+    assert not os.path.exists(log.path)  # still buffered
+    log.append('img2.jpg', None, error='decode failed')
+    lines = open(log.path).read().splitlines()
+    assert lines[0] == 'image,prediction_count,overlay_path,error'
+    assert len(lines) == 4 and lines[3].endswith('decode failed')
+
+
+def test_results_log_moves_aside_a_csv_with_the_old_header(tmp_path):
+    old = tmp_path / 'predictions.csv'
+    old.write_text('image,prediction_count,json_path\na.jpg,3,a.json\n')
+    log = iu.ResultsLog(str(tmp_path), flush_every=1)
+    log.append('b.jpg', 4, 'b_pred.png')
+    assert open(log.rotated_to).read().startswith('image,prediction_count,json_path')
+    assert old.read_text().splitlines() == ['image,prediction_count,overlay_path,error', 'b.jpg,4,b_pred.png,']
+    # A file with the current header is appended to as before
+    again = iu.ResultsLog(str(tmp_path), flush_every=1)
+    again.append('c.jpg', 5)
+    assert again.rotated_to is None and len(old.read_text().splitlines()) == 3
+
+
+def test_archive_members_are_capped_by_uncompressed_size():
+    def _zip(members):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, size in members:
+                zf.writestr(name, bytes(size))
+        return buf.getvalue()
+
+    bomb = _zip([('big.jpg', 10 * 1024 * 1024)])
+    assert len(bomb) < 64 * 1024
+    with pytest.raises(ValueError, match='larger than'):
+        list(iu.iter_archive_images(bomb, max_member_bytes=1024 * 1024))
+    with pytest.raises(ValueError, match='exceed'):
+        list(iu.iter_archive_images(_zip([('a.jpg', 600), ('b.jpg', 600)]), max_total_bytes=1000))
+    assert len(list(iu.iter_archive_images(_zip([('a.jpg', 600), ('b.jpg', 300)]), max_total_bytes=1000))) == 2
+
+    # A member whose header understates its size is never read past that size
+    lying = bytearray(_zip([('big.jpg', 4096)]))
+    for sig, offset in ((b'PK\x03\x04', 22), (b'PK\x01\x02', 24)):
+        at = lying.index(sig)
+        lying[at + offset:at + offset + 4] = (10).to_bytes(4, 'little')
+    with pytest.raises(zipfile.BadZipFile):
+        list(iu.iter_archive_images(bytes(lying), max_member_bytes=1024))
+
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tf:
+        info = tarfile.TarInfo('big.jpg')
+        info.size = 2 * 1024 * 1024
+        tf.addfile(info, io.BytesIO(bytes(info.size)))
+    with pytest.raises(ValueError, match='larger than'):
+        list(iu.iter_archive_images(buf.getvalue(), max_member_bytes=1024 * 1024))
@@ -0,0 +1,44 @@
+import io
+
+from PIL import Image
+
+import inference_video
+
+
+def _gif(frames):
+    buf = io.BytesIO()
+    frames[0].save(buf, format='GIF', save_all=True, append_images=frames[1:], duration=500)
+    return buf.getvalue()
+
+
+def test_static_frames_are_skipped_and_changes_counted():
+    # Near-identical frames (GIF would merge exact duplicates)
+    still = [Image.new('RGB', (64, 64), (40 + i, 40 + i, 40 + i)) for i in range(3)]
+    changed = [Image.new('RGB', (64, 64), (220 + i, 220 + i, 220 + i)) for i in range(2)]
+    data = _gif(still + changed)
+    calls = []
+
+    def count_batch(images):
+        calls.append(len(images))
+        return [float(img.getpixel((0, 0))[0]) for img in images]
+
+    frames = inference_video.iter_frames(data, 'clip.gif')
+    result = inference_video.count_stream(frames, count_batch, change_threshold=4.0, smoothing=1.0)
+
+    assert result['frames'] == 5
+    assert result['frames_counted'] == 2
+    assert sum(calls) == 2
+    assert [e['counted'] for e in result['series']] == [True, False, False, True, False]
+    assert result['series'][2]['raw_count'] == result['series'][0]['raw_count']
+    assert result['series'][1]['t'] == 0.5
+
+
+def test_max_skip_forces_periodic_count():
+    still = Image.new('RGB', (32, 32), (10, 10, 10))
+    frames = ((float(i), still) for i in range(7))
+    result = inference_video.count_stream(frames, lambda imgs: [1.0] * len(imgs), max_skip=2)
+    assert [e['counted'] for e in result['series']] == [True, False, False, True, False, False, True]
+
+
+def test_smoothing_is_an_ema():
+    assert inference_video.smooth([0, 10, 10], 0.5) == [0, 5.0, 7.5]
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from model_registry import ModelRegistry
+
+
+class _TinyCounter(torch.nn.Module):
+    """Density-map model whose output sums to `scale` * mean pixel value."""
+
+    def __init__(self, scale: float):
+        super().__init__()
+        self.scale = scale
+
+    def forward(self, x):
+        return x.mean(dim=1, keepdim=True) * 0 + self.scale / (x.shape[-1] * x.shape[-2])
+
+
+def _save(path, scale):
+    torch.jit.save(torch.jit.script(_TinyCounter(scale)), str(path))
+
+
+def test_registry_loads_once_and_hot_reloads(tmp_path):
+    weights = tmp_path / 'model.pt'
+    _save(weights, 3.0)
+
+    reg = ModelRegistry(str(weights), device='cpu', hot_reload=True, reload_check_s=0.0)
+    first = reg.get()
+    assert first is not None
+    assert reg.get() is first
+    assert reg.stats['loads'] == 1
+    assert reg.stats['last_load_ms'] is not None
+
+    _save(weights, 5.0)
+    later = time.time() + 10
+    os.utime(weights, (later, later))
+    second = reg.get()
+    assert second is not first
+    assert reg.stats['reloads'] == 1
+
+
+def test_registry_keeps_model_when_reload_fails(tmp_path):
+    weights = tmp_path / 'model.pt'
+    _save(weights, 3.0)
+    reg = ModelRegistry(str(weights), device='cpu', reload_check_s=0.0)
+    model = reg.get()
+
+    weights.write_bytes(b'not a model')
+    later = time.time() + 10
+    os.utime(weights, (later, later))
+    assert reg.get() is model
+    assert reg.stats['load_errors'] == 1
+
+
+def test_registry_warmup_uses_samplecrowd(tmp_path):
+    weights = tmp_path / 'model.pt'
+    _save(weights, 3.0)
+    reg = ModelRegistry(str(weights), device='cpu')
+    reg.startup(warmup=True)
+    status = reg.status()
+    assert status['loaded'] is True
+    assert status['warmup_ms'] is not None
+    assert status['warmup_image']
+
+
+def test_registry_without_weights_returns_none(tmp_path):
+    reg = ModelRegistry(str(tmp_path / 'missing.pt'), device='cpu')
+    assert reg.get() is None
+    assert reg.status()['loaded'] is False
+
+
+def test_lwcc_fallback_loads_model_once_and_batches(monkeypatch):
+    import sys
+    import types
+
+    from model_registry import LWCCFallback
+
+    loads, calls = [], []
+
+    class LWCC:
+        @staticmethod
+        def load_model(model_name, model_weights):
+            loads.append((model_name, model_weights))
+            return 'dm-count'
+
+        @staticmethod
+        def get_count(paths, model=None, **kwargs):
+            calls.append(model)
+            return {os.path.splitext(os.path.basename(p))[0]: i + 1 for i, p in enumerate(paths)}
+
+    monkeypatch.setitem(sys.modules, 'lwcc', types.SimpleNamespace(LWCC=LWCC))
+    fallback = LWCCFallback()
+    assert fallback.count(['/x/a.jpg', '/x/b.jpg']) == [1.0, 2.0]
+    assert fallback.count(['/x/c.jpg']) == [1.0]
+    assert loads == [('DM-Count', 'SHA')]
+    assert calls == ['dm-count', 'dm-count']
+    assert fallback.status()['images'] == 3
+
+    # A replaced lwcc module is picked up on the next call
+    monkeypatch.setitem(sys.modules, 'lwcc', types.SimpleNamespace(LWCC=LWCC))
+    fallback.count(['/x/a.jpg'])
+    assert len(loads) == 2
+
+
+def test_health_report_names_the_serving_backend(tmp_path, monkeypatch):
+    import inference_pipeline
+    from model_registry import LWCCFallback
+
+    monkeypatch.setattr(inference_pipeline, 'registry', ModelRegistry(str(tmp_path / 'missing.pt'), device='cpu'))
+    monkeypatch.setattr(inference_pipeline, 'lwcc_fallback', LWCCFallback())
+    monkeypatch.setitem(__import__('sys').modules, 'lwcc', None)  # import fails
+
+    report = inference_pipeline.prepare(run_warmup=False)
+    assert report['active_backend'] == 'heuristic'
+    assert report['degraded'] is True
+    assert 'HEURISTIC' in inference_pipeline.describe_health(report)
@@ -0,0 +1,47 @@
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+
+import process_memory
+
+ROLLUP = """55dba185f000-7ffc21d02000 ---p 00000000 00:00 0    [rollup]
+Rss:                1416 kB
+Pss:                 468 kB
+Shared_Clean:       1256 kB
+Shared_Dirty:          0 kB
+Private_Clean:        56 kB
+Private_Dirty:       104 kB
+"""
+
+
+def test_parse_smaps_rollup():
+    mem = process_memory.parse_smaps_rollup(ROLLUP)
+    assert mem == {
+        "rss_bytes": 1416 * 1024,
+        "pss_bytes": 468 * 1024,
+        "uss_bytes": 160 * 1024,
+        "shared_bytes": 1256 * 1024,
+    }
+
+
+@pytest.mark.skipif(process_memory.process_memory() is None or not hasattr(os, "fork"),
+                    reason="needs Linux /proc smaps_rollup and fork()")
+def test_forked_child_shares_parent_pages():
+    weights = np.ones(32 * 1024 * 1024 // 8)  # 32 MB written before the fork
+    pid = os.fork()
+    if pid == 0:
+        time.sleep(30)
+        os._exit(0)
+    try:
+        report = process_memory.memory_report(os.getpid())
+        forked = next(p for p in report["processes"] if p["pid"] == pid)
+        assert forked["role"] == "inference"
+        assert forked["shared_bytes"] >= weights.nbytes
+        assert forked["uss_bytes"] < weights.nbytes
+        assert report["shared_savings_bytes"] >= weights.nbytes // 2
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
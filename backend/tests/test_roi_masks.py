@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import roi_masks
+from roi_masks import CameraMasks, RoiMaskCache
+
+
+def test_one_frame_feeds_every_area_and_ignores_people_outside():
+    masks = CameraMasks([
+        ('Gate', [[0, 0], [0.5, 0], [0.5, 1], [0, 1]], 10.0),
+        ('Stage', [[0.5, 0], [1, 0], [1, 0.5], [0.5, 0.5]], None),
+    ])
+    density = np.zeros((32, 32), dtype=np.float16)
+    density[:, :16] = 20.0 / (32 * 16)  # 20 people in the left half
+    density[16:, 16:] = 7.0 / (16 * 16)  # 7 people outside both areas
+    counts = masks.area_counts(density)
+    assert counts['Gate'] == pytest.approx(20.0, rel=1e-2)
+    assert counts['Stage'] == pytest.approx(0.0, abs=1e-6)
+    assert masks.compiled((32, 32)) is masks.compiled((32, 32))
+    assert masks.compiled((32, 32)).shape == (2, 32 * 32)
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    async def to_list(self, n):
+        return self.docs
+
+
+class _Collection:
+    def __init__(self, docs=(), one=None):
+        self.docs, self.one, self.finds = list(docs), one, 0
+
+    def find(self, query, projection=None):
+        self.finds += 1
+        return _Cursor([d for d in self.docs if all(d.get(k) == v for k, v in query.items())])
+
+    async def find_one(self, query, projection=None):
+        return self.one
+
+
+async def test_mask_cache_loads_once_until_invalidated(monkeypatch):
+    masks = _Collection([{'event_id': 'E1', 'camera_id': 'cam1', 'area_name': 'Gate',
+                          'polygon': [[0, 0], [1, 0], [1, 1]]}])
+    events = _Collection(one={'areas': [{'name': 'Gate', 'radius_m': 12.0}]})
+    monkeypatch.setattr(roi_masks, 'database', {'camera_area_masks': masks, 'events': events})
+
+    cache = RoiMaskCache(ttl_s=60)
+    first = await cache.get('E1', 'cam1')
+    assert first.names == ['Gate'] and first.radii == {'Gate': 12.0}
+    assert await cache.get('E1', 'cam1') is first
+    assert await cache.get('E1', 'cam2') is None
+    assert masks.finds == 2
+
+    cache.invalidate('E1')
+    await cache.get('E1', 'cam1')
+    assert masks.finds == 3
@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import shm_ring
+from shm_ring import SlotsExhausted, StaleSlot, TensorRing
+
+SAMPLE = sorted((Path(__file__).resolve().parents[2] / 'samplecrowd').glob('*.jpg'))[0]
+
+
+@pytest.fixture
+def ring():
+    ring = TensorRing(2, (3, 64, 64))
+    yield ring
+    shm_ring._ATTACHED.clear()
+    ring.close()
+
+
+def test_slots_are_recycled_and_exhaustion_is_counted(ring):
+    a, b = ring.acquire(), ring.acquire()
+    assert {a, b} == {0, 1} and ring.in_use == 2
+    with pytest.raises(SlotsExhausted):
+        ring.acquire()
+    ring.release(a)
+    assert ring.acquire() == a
+    stats = ring.stats()
+    assert stats['acquired'] == 3 and stats['exhausted'] == 1 and stats['peak_in_use'] == 2
+
+
+def test_images_are_preprocessed_into_the_slot_and_stale_refs_rejected(ring):
+    index = ring.acquire()
+    ref = ring.write_image(index, SAMPLE.read_bytes(), (32, 32))
+    tensor = ring.read(ref)
+    assert tensor.shape == (3, 32, 32) and np.isfinite(tensor).all() and tensor.std() > 0
+    # An attached mapping sees the same bytes
+    assert np.array_equal(TensorRing.attach(ring.spec).read(ref), tensor)
+    ring.release(index)
+    with pytest.raises(StaleSlot):
+        ring.read(ref)
+
+
+def test_count_slots_writes_counts_into_the_ring(ring, tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    import inference_pipeline
+    from model_registry import ModelRegistry
+
+    monkeypatch.setattr(inference_pipeline.registry, 'get', lambda: None)
+    first = ring.write_image(ring.acquire(), SAMPLE.read_bytes(), (64, 64))
+    assert shm_ring.count_slots(ring.spec, [first], (64, 64), [False], [None]) == [{'fallback': True}]
+
+    class Uniform(torch.nn.Module):
+        def forward(self, x):
+            return torch.nn.functional.avg_pool2d(x[:, :1] * 0 + 1, 8) * 0.1
+
+    weights = tmp_path / 'uniform.pt'
+    torch.jit.save(torch.jit.script(Uniform()), str(weights))
+    monkeypatch.setattr(inference_pipeline, 'registry', ModelRegistry(str(weights), device='cpu', hot_reload=False))
+    stale = ring.write_image(ring.acquire(), SAMPLE.read_bytes(), (64, 64))
+    ring.release(stale[0])
+    metas = shm_ring.count_slots(ring.spec, [first, stale], (64, 64), [True, False], [None, None])
+    assert metas[1] == {'stale': True}
+    assert 'count' not in metas[0] and metas[0]['density_map'].shape == (8, 8)
+    assert ring.counts[first[0]] == 6
@@ -0,0 +1,123 @@
+import io
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from ws_ingest import FORMAT_RAW, FrameError, FrameWindow, pack_frame, parse_frames
+
+
+def test_frames_round_trip_and_share_one_message():
+    pixels = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+    message = pack_frame('gate-1', 12.5, pixels.tobytes(), pixels.shape) + pack_frame('hall', 13.0, b'jpeg')
+    raw, encoded = parse_frames(message, 1024)
+    assert (raw.camera_id, raw.ts, raw.format, raw.shape) == ('gate-1', 12.5, FORMAT_RAW, (2, 3, 3))
+    assert np.array_equal(np.asarray(raw.image()), pixels)
+    assert (encoded.camera_id, encoded.image()) == ('hall', b'jpeg')
+
+    gray = next(parse_frames(pack_frame('g', 0.0, bytes(6), (2, 3)), 1024))
+    assert gray.image().mode == 'RGB' and gray.image().size == (3, 2)
+
+    with pytest.raises(FrameError):
+        list(parse_frames(message[:-1], 1024))
+    with pytest.raises(FrameError):
+        list(parse_frames(pack_frame('g', 0.0, bytes(5), (2, 3)), 1024))
+    with pytest.raises(FrameError):
+        list(parse_frames(message, 8))
+    for ts in (float('nan'), float('inf'), -1.0, 1e20):
+        with pytest.raises(FrameError, match='timestamp'):
+            list(parse_frames(pack_frame('g', ts, b'jpeg'), 1024))
+
+
+def test_window_keeps_only_the_newest_waiting_frame():
+    window = FrameWindow(1)
+    assert window.offer('f1') == ('f1', None) and window.credits == 0
+    assert window.offer('f2') == (None, None)
+    assert window.offer('f3') == (None, 'f2') and window.dropped == 1
+    assert window.done() == 'f3'
+    assert window.done() is None and window.credits == 1
+
+
+def test_stream_answers_counts_on_the_socket(monkeypatch):
+    from PIL import Image
+
+    import routes.inference as inference
+    from main import app
+
+    seen = []
+
+    async def fake_count(contents, **kwargs):
+        seen.append(type(contents))
+        return {'count': 5, 'error': None, 'qos_tier': 'full'}, False
+
+    monkeypatch.setattr(inference, '_count_contents', fake_count)
+    buf = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(buf, format='JPEG')
+    pixels = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    client = TestClient(app)
+    with client.websocket_connect('/inference/stream?event_id=ws-test&radius_m=5') as ws:
+        ws.send_bytes(pack_frame('cam-a', 1.0, pixels.tobytes(), pixels.shape))
+        first = ws.receive_json()
+        ws.send_bytes(pack_frame('cam-b', 2.0, buf.getvalue()))
+        second = ws.receive_json()
+        ws.send_bytes(b'not a frame')
+        error = ws.receive_json()
+
+    assert first['type'] == 'count' and first['camera_id'] == 'cam-a' and first['person_count'] == 5
+    assert first['credits'] == 2 and 'schedule' in first
+    assert second['camera_id'] == 'cam-b' and second['ts'] == 2.0
+    assert seen == [Image.Image, bytes]
+    assert error['type'] == 'error' and 'truncated' in error['error']
+    stats = client.get('/inference/stats').json()['stream']
+    assert stats['counted'] >= 2 and stats['raw_frames'] >= 1
+
+
+def test_saved_stream_frames_are_observed_once(monkeypatch):
+    import routes.inference as inference
+    from main import app
+
+    async def fake_count(contents, **kwargs):
+        return {'count': 7, 'error': None}, False
+
+    observed = []
+    real_observe = inference.zone_scheduler.observe
+    monkeypatch.setattr(inference, '_count_contents', fake_count)
+    monkeypatch.setattr(inference.zone_scheduler, 'observe', lambda key, *a, **kw: (observed.append(key), real_observe(key, *a, **kw)))
+    monkeypatch.setattr(inference.ingest, '_records', [])
+    monkeypatch.setattr(inference.ingest, '_ensure_writer', lambda: None)
+    pixels = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    client = TestClient(app)
+    with client.websocket_connect('/inference/stream?event_id=ws-save&radius_m=5&save_record=true') as ws:
+        ws.send_bytes(pack_frame('cam-s', 1.0, pixels.tobytes(), pixels.shape))
+        reply = ws.receive_json()
+
+    assert reply['type'] == 'count' and reply['person_count'] == 7
+    assert len(observed) == 1
+    assert [r['camera_id'] for r in inference.ingest._records] == ['cam-s']
+
+
+def test_a_failing_frame_gives_its_credit_back(monkeypatch):
+    import routes.inference as inference
+    from main import app
+
+    async def fake_count(contents, **kwargs):
+        return {'count': 2, 'error': None}, False
+
+    def broken_record(*args, **kwargs):
+        raise ValueError('record failed')
+
+    monkeypatch.setattr(inference, '_count_contents', fake_count)
+    monkeypatch.setattr(inference.ingest, 'record', broken_record)
+    pixels = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    client = TestClient(app)
+    with client.websocket_connect('/inference/stream?event_id=ws-credit&save_record=true') as ws:
+        ws.send_bytes(pack_frame('cam-x', 1.0, pixels.tobytes(), pixels.shape))
+        failed = ws.receive_json()
+        ws.send_bytes(pack_frame('cam-y', 2.0, pixels.tobytes(), pixels.shape))
+        second = ws.receive_json()
+
+    assert failed['type'] == 'error' and 'record failed' in failed['error'] and failed['credits'] == 2
+    assert second['type'] == 'error' and second['credits'] == 2
@@ -0,0 +1,169 @@
+"""
+Binary frame protocol and flow control for the camera WebSocket (`/inference/stream`).
+
+A camera keeps one WebSocket open and sends each frame as a binary message.
+Every frame starts with a fixed 23-byte big-endian header:
+
+    magic    4s  b"CRF1"
+    format   B   0 = JPEG/PNG bytes, 1 = raw uint8 pixels (row-major, HxWxC)
+    id_len   B   length of the UTF-8 camera id that follows the header
+    height   H   raw frames only (0 for encoded images)
+    width    H
+    channels B   1 (gray) or 3 (RGB); raw frames only
+    ts       d   capture time, seconds since the epoch (finite, 0 to year 9999)
+    length   I   payload bytes after the camera id
+
+The header is followed by the camera id and then the payload. Because each
+frame is length-prefixed, one message may carry several frames back to back.
+Raw frames skip JPEG decoding entirely: a camera that already downscales to
+about the model input size sends pixels the server can use directly.
+
+The server answers every frame exactly once, on the same socket, with a JSON
+text message: "count", "error", "dropped" or "flow". Each answer carries
+`credits`, the number of frames the camera may send before it waits for the
+next answer. A connection has at most `max_inflight` frames being counted.
+A frame that arrives while the window is full waits. If another frame
+arrives first, the newer one takes its place and the older one is answered
+"dropped", so the newest frame always wins. While the inference queue is
+saturated, frames are refused before they queue (shed), and each is answered
+"flow" with `retry_after_s`.
+"""
+import math
+import struct
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+import inference_utils as iu
+
+MAGIC = b"CRF1"
+FORMAT_ENCODED = 0
+FORMAT_RAW = 1
+HEADER = struct.Struct("!4sBBHHBdI")
+MAX_TS = 253402300799.0  # 9999-12-31T23:59:59Z, the last time datetime can represent
+
+
+class FrameError(ValueError):
+    """A binary message that is not a valid frame."""
+
+
+class Frame:
+    __slots__ = ("camera_id", "ts", "format", "shape", "payload")
+
+    def __init__(self, camera_id: str, ts: float, format: int, shape: Tuple[int, int, int], payload: memoryview):
+        self.camera_id = camera_id
+        self.ts = ts
+        self.format = format
+        self.shape = shape
+        self.payload = payload
+
+    def image(self) -> Any:
+        """The encoded bytes, or a PIL image built from raw pixels without a decode."""
+        if self.format == FORMAT_ENCODED:
+            return bytes(self.payload)
+        h, w, c = self.shape
+        pixels = np.frombuffer(self.payload, dtype=np.uint8).reshape(h, w, c)
+        img = iu.Image.fromarray(pixels[:, :, 0] if c == 1 else pixels)
+        return img.convert("RGB") if c == 1 else img
+
+
+def pack_frame(camera_id: str, ts: float, payload: bytes, shape: Optional[Tuple[int, ...]] = None) -> bytes:
+    """One frame as sent by a camera; `shape` (h, w[, c]) marks `payload` as raw uint8 pixels."""
+    cid = camera_id.encode("utf-8")
+    if shape is None:
+        header = HEADER.pack(MAGIC, FORMAT_ENCODED, len(cid), 0, 0, 0, ts, len(payload))
+    else:
+        h, w = shape[:2]
+        c = shape[2] if len(shape) > 2 else 1
+        header = HEADER.pack(MAGIC, FORMAT_RAW, len(cid), h, w, c, ts, len(payload))
+    return header + cid + payload
+
+
+def parse_frames(message: bytes, max_frame_bytes: int) -> Iterator[Frame]:
+    """Frames of one binary message; raises FrameError at the first malformed one."""
+    view = memoryview(message)
+    offset = 0
+    while offset < len(view):
+        if len(view) - offset < HEADER.size:
+            raise FrameError("truncated frame header")
+        magic, fmt, id_len, h, w, c, ts, length = HEADER.unpack_from(view, offset)
+        if magic != MAGIC:
+            raise FrameError("bad frame magic")
+        if length > max_frame_bytes:
+            raise FrameError(f"frame of {length} bytes exceeds the {max_frame_bytes} byte limit")
+        start = offset + HEADER.size
+        end = start + id_len + length
+        if end > len(view):
+            raise FrameError("truncated frame payload")
+        if not math.isfinite(ts) or not 0 <= ts <= MAX_TS:
+            raise FrameError(f"frame timestamp {ts!r} is not seconds since the epoch")
+        camera_id = bytes(view[start:start + id_len]).decode("utf-8", "replace")
+        payload = view[start + id_len:end]
+        if fmt == FORMAT_RAW:
+            if c not in (1, 3) or h * w * c != length:
+                raise FrameError(f"raw frame of {length} bytes does not match shape {h}x{w}x{c}")
+        elif fmt != FORMAT_ENCODED:
+            raise FrameError(f"unknown frame format {fmt}")
+        yield Frame(camera_id, ts, fmt, (h, w, c), payload)
+        offset = end
+
+
+class FrameWindow:
+    """In-flight frames of one connection; when the window is full the newest frame waits and wins."""
+
+    def __init__(self, max_inflight: int):
+        self.max_inflight = max(1, max_inflight)
+        self.inflight = 0
+        self.pending: Optional[Frame] = None
+        self.dropped = 0
+
+    @property
+    def credits(self) -> int:
+        return 0 if self.pending is not None else self.max_inflight - self.inflight
+
+    def offer(self, frame: Frame) -> Tuple[Optional[Frame], Optional[Frame]]:
+        """(frame to count now or None if it has to wait, older waiting frame it replaced)."""
+        if self.inflight < self.max_inflight:
+            self.inflight += 1
+            return frame, None
+        replaced, self.pending = self.pending, frame
+        if replaced is not None:
+            self.dropped += 1
+        return None, replaced
+
+    def done(self) -> Optional[Frame]:
+        """Mark one frame counted; returns the waiting frame to count next, if any."""
+        self.inflight -= 1
+        frame, self.pending = self.pending, None
+        if frame is not None:
+            self.inflight += 1
+        return frame
+
+
+class StreamStats:
+    def __init__(self):
+        self.connections = 0
+        self.open = 0
+        self.frames = 0
+        self.bytes = 0
+        self.raw_frames = 0
+        self.counted = 0
+        self.dropped = 0
+        self.shed = 0
+        self.errors = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "open": self.open,
+            "frames": self.frames,
+            "raw_frames": self.raw_frames,
+            "bytes": self.bytes,
+            "counted": self.counted,
+            "dropped": self.dropped,
+            "shed": self.shed,
+            "errors": self.errors,
+        }
+
+
+stream_stats = StreamStats()